@@ -0,0 +1,538 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from multiprocessing import Pool, Process
+from multiprocessing.managers import BaseManager
+
+from evaluation import evaluate_hashset
+
+# Trust model of the broker: the tasks are pickled (function, arguments) pairs that the workers unpickle and execute,
+# and the results are unpickled by the clients, so any process holding the authentication key can run arbitrary code
+# on every worker and client. The key must be a secret shared only by trusted machines, the broker listens on the
+# loopback interface unless an address is given explicitly, and it should only be exposed on a trusted network (or
+# through an SSH tunnel). There is no default key: it is passed explicitly or read from the environment.
+AUTHKEY_ENV = "OPTIMIZATION_BROKER_AUTHKEY"  # environment variable holding the key
+AUTHKEY_FILE_ENV = "OPTIMIZATION_BROKER_AUTHKEY_FILE"  # environment variable holding the path of a file with the key
+
+
+class EvaluationBackend(ABC):
+    """
+    Protocol of the evaluation backends: a task is the (movie hashset, number of replications, metric function, seed)
+    arguments of evaluation.evaluate_hashset, and its result the EvaluationRecord holding the sufficient statistics of
+    the replications. As the replications of a task only depend on its seed, the records do not depend on the backend.
+    """
+
+    @abstractmethod
+    def starmap(self, fct, tasks):
+        """
+        Apply a picklable module-level function to the arguments of each task.
+        :param fct: function
+        :param tasks: list of argument tuples
+        :return: list of the results in the order of the tasks
+        """
+
+    def evaluate(self, tasks):
+        """
+        Evaluate a list of tasks.
+        :param tasks: list of (movie hashset, number of replications, metric function, seed[, keep replications])
+        :return: list of EvaluationRecord in the order of the tasks
+        """
+        return self.starmap(evaluate_hashset, tasks)
+
+    def close(self):
+        pass
+
+
+class InProcessBackend(EvaluationBackend):
+
+    def starmap(self, fct, tasks):
+        return [fct(*task) for task in tasks]
+
+
+class PoolBackend(EvaluationBackend):
+
+    def __init__(self, n_workers):
+        """
+        Evaluation over a pool of local worker processes.
+        :param n_workers: number of worker processes
+        """
+        self.n_workers = n_workers
+        self.pool = Pool(processes=n_workers)
+
+    def starmap(self, fct, tasks):
+        return self.pool.starmap(fct, tasks, chunksize=max(1, len(tasks) // (4 * self.n_workers)))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+class TaskBoard:
+
+    def __init__(self, lease_timeout=30.):
+        """
+        Task queue of the broker shared by the clients and the workers. A task taken by a worker is leased to it until
+        its result is returned; the tasks of a worker without sign of life (take, heartbeat or result) for more than
+        lease_timeout seconds are put back at the front of the queue, so that a lost worker delays its tasks but never
+        loses them. A result returned for a task already completed (by a slow rather than lost worker) is dropped.
+        The clients hold a lease too, renewed by their submissions and collections: the pending tasks and the
+        uncollected results of a client without sign of life for more than lease_timeout seconds are dropped.
+        :param lease_timeout: number of seconds without sign of life after which a worker or a client is considered lost
+        """
+        self.lease_timeout = lease_timeout
+        self.lock = threading.Lock()
+        self.queue = deque()  # (task id, function, arguments)
+        self.tasks = {}  # task id -> (function, arguments) of the pending tasks
+        self.leases = {}  # task id -> worker id
+        self.results = {}  # task id -> (success, result)
+        self.owners = {}  # task id -> client id of the pending tasks and uncollected results
+        self.last_seen = {}  # worker id -> time of its last sign of life
+        self.clients_last_seen = {}  # client id -> time of its last sign of life
+        self.next_id = 0
+        self.num_completed = 0
+        self.num_resubmitted = 0
+        self.num_expired = 0
+        self.closed = False
+
+    def submit(self, tasks, client_id):
+        """
+        :param tasks: list of (function, arguments)
+        :param client_id: id of the client
+        :return: list of the task ids
+        """
+        with self.lock:
+            self.clients_last_seen[client_id] = time.time()
+            task_ids = list(range(self.next_id, self.next_id + len(tasks)))
+            self.next_id += len(tasks)
+            for task_id, (fct, args) in zip(task_ids, tasks):
+                self.tasks[task_id] = (fct, args)
+                self.owners[task_id] = client_id
+                self.queue.append((task_id, fct, args))
+            return task_ids
+
+    def take(self, worker_id):
+        """
+        :param worker_id: id of the worker
+        :return: (task id, function, arguments) leased to the worker, or None if no task is queued
+        """
+        with self.lock:
+            self.last_seen[worker_id] = time.time()
+            self._resubmit_lost()
+            self._expire_lost_clients()
+            while len(self.queue) > 0:
+                task = self.queue.popleft()
+                if task[0] in self.tasks:  # skip the tasks completed or cancelled since their resubmission
+                    self.leases[task[0]] = worker_id
+                    return task
+            return None
+
+    def heartbeat(self, worker_id):
+        with self.lock:
+            self.last_seen[worker_id] = time.time()
+
+    def complete(self, worker_id, task_id, success, result):
+        """
+        :param worker_id: id of the worker
+        :param task_id: id of the task
+        :param success: whether the task succeeded
+        :param result: result of the task, or its exception
+        """
+        with self.lock:
+            self.last_seen[worker_id] = time.time()
+            if task_id not in self.tasks:
+                return
+            del self.tasks[task_id]
+            self.leases.pop(task_id, None)
+            self.results[task_id] = (success, result)
+            self.num_completed += 1
+
+    def collect(self, task_ids, client_id):
+        """
+        Remove and return the results of the completed tasks.
+        :param task_ids: ids of the tasks
+        :param client_id: id of the client
+        :return: dictionary of the task ids to their (success, result)
+        """
+        with self.lock:
+            self.clients_last_seen[client_id] = time.time()
+            self._resubmit_lost()
+            self._expire_lost_clients()
+            results = {task_id: self.results.pop(task_id) for task_id in task_ids if task_id in self.results}
+            for task_id in results:
+                del self.owners[task_id]
+            return results
+
+    def cancel(self, task_ids):
+        """
+        Drop the pending tasks and the uncollected results of tasks, e.g. of a batch given up by its client.
+        :param task_ids: ids of the tasks
+        """
+        with self.lock:
+            for task_id in task_ids:
+                self._drop(task_id)
+
+    def _drop(self, task_id):
+        self.tasks.pop(task_id, None)
+        self.leases.pop(task_id, None)
+        self.results.pop(task_id, None)
+        self.owners.pop(task_id, None)
+
+    def _resubmit_lost(self):
+        now = time.time()
+        lost = [task_id for task_id, worker_id in self.leases.items() if now - self.last_seen[worker_id] > self.lease_timeout]
+        for task_id in lost:
+            del self.leases[task_id]
+            fct, args = self.tasks[task_id]
+            self.queue.appendleft((task_id, fct, args))
+            self.num_resubmitted += 1
+
+    def _expire_lost_clients(self):
+        now = time.time()
+        lost = {client_id for client_id, last_seen in self.clients_last_seen.items() if now - last_seen > self.lease_timeout}
+        if len(lost) == 0:
+            return
+        for task_id in [task_id for task_id, client_id in self.owners.items() if client_id in lost]:
+            self._drop(task_id)
+            self.num_expired += 1
+        for client_id in lost:
+            del self.clients_last_seen[client_id]
+
+    def close(self):
+        """
+        Ask the workers to exit once the queue is empty.
+        """
+        with self.lock:
+            self.closed = True
+
+    def is_closed(self):
+        with self.lock:
+            return self.closed
+
+    def stats(self):
+        """
+        :return: dictionary of the numbers of queued, leased, completed, resubmitted and expired tasks, of uncollected
+                 results and of live workers and clients
+        """
+        with self.lock:
+            now = time.time()
+            return {
+                "queued": len(self.queue),
+                "leased": len(self.leases),
+                "completed": self.num_completed,
+                "resubmitted": self.num_resubmitted,
+                "expired": self.num_expired,
+                "uncollected": len(self.results),
+                "workers": sum(now - last_seen <= self.lease_timeout for last_seen in self.last_seen.values()),
+                "clients": sum(now - last_seen <= self.lease_timeout for last_seen in self.clients_last_seen.values()),
+            }
+
+
+_board = None
+
+
+def _get_board():
+    return _board
+
+
+def _init_board(lease_timeout):
+    global _board
+    _board = TaskBoard(lease_timeout=lease_timeout)
+
+
+class BrokerManager(BaseManager):
+    pass
+
+
+BrokerManager.register("get_board", callable=_get_board)
+
+
+def resolve_authkey(authkey=None):
+    """
+    :param authkey: authentication key of the broker (optional, by default read from the environment variable
+                    OPTIMIZATION_BROKER_AUTHKEY or from the file named by OPTIMIZATION_BROKER_AUTHKEY_FILE)
+    :return: authentication key as bytes
+    """
+    if authkey is None and os.environ.get(AUTHKEY_ENV):
+        authkey = os.environ[AUTHKEY_ENV]
+    if authkey is None and os.environ.get(AUTHKEY_FILE_ENV):
+        with open(os.environ[AUTHKEY_FILE_ENV], "rb") as f:
+            authkey = f.read().strip()
+    if not authkey:
+        raise ValueError(f"The broker needs an authentication key: pass authkey or set {AUTHKEY_ENV} or {AUTHKEY_FILE_ENV}.")
+    return authkey.encode() if isinstance(authkey, str) else bytes(authkey)
+
+
+def _connect(address, authkey):
+    manager = BrokerManager(address=address, authkey=resolve_authkey(authkey))
+    manager.connect()
+    return manager.get_board()
+
+
+def start_broker(address=("127.0.0.1", 0), authkey=None, lease_timeout=30.):
+    """
+    Start the broker in a background process.
+    :param address: (host, port) of the broker, port 0 picks a free port
+    :param authkey: authentication key shared by the broker, its clients and its workers (see resolve_authkey)
+    :param lease_timeout: number of seconds without sign of life after which a worker is considered lost
+    :return: started BrokerManager (its address attribute holds the actual address)
+    """
+    manager = BrokerManager(address=address, authkey=resolve_authkey(authkey))
+    manager.start(initializer=_init_board, initargs=(lease_timeout,))
+    return manager
+
+
+def serve_broker(address=("127.0.0.1", 50000), authkey=None, lease_timeout=30.):
+    """
+    Run the broker in the current process until it is interrupted. Anyone reaching the broker with its key can run
+    code on the workers (see the trust model above AUTHKEY_ENV): the broker listens on the loopback interface unless
+    the host of a trusted network interface is given.
+    :param address: (host, port) of the broker
+    :param authkey: authentication key shared by the broker, its clients and its workers (see resolve_authkey)
+    :param lease_timeout: number of seconds without sign of life after which a worker is considered lost
+    """
+    authkey = resolve_authkey(authkey)
+    _init_board(lease_timeout)
+    BrokerManager(address=address, authkey=authkey).get_server().serve_forever()
+
+
+def run_worker(address, authkey=None, worker_id=None, heartbeat_interval=1., poll_interval=0.05):
+    """
+    Worker daemon: evaluates the tasks of the broker until the broker is closed or unreachable. A background thread
+    sends heartbeats so that long tasks keep their lease. The worker executes the functions of the tasks, so it must
+    only be connected to a trusted broker.
+    :param address: (host, port) of the broker
+    :param authkey: authentication key of the broker (see resolve_authkey)
+    :param worker_id: id of the worker (optional, by default host name and process id)
+    :param heartbeat_interval: number of seconds between two heartbeats (must be below the lease timeout)
+    :param poll_interval: number of seconds between two polls of an empty queue
+    :return: number of tasks evaluated
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}" if worker_id is None else worker_id
+    authkey = resolve_authkey(authkey)
+    board = _connect(address, authkey)
+    stopped = threading.Event()
+
+    def heartbeat():
+        heartbeat_board = _connect(address, authkey)  # proxies cannot be shared between threads
+        try:
+            while not stopped.wait(heartbeat_interval):
+                heartbeat_board.heartbeat(worker_id)
+        except (EOFError, OSError):
+            pass
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    num_tasks = 0
+    try:
+        while True:
+            task = board.take(worker_id)
+            if task is None:
+                if board.is_closed():
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            task_id, fct, args = task
+            try:
+                success, result = True, fct(*args)
+            except Exception as e:
+                success, result = False, e
+            board.complete(worker_id, task_id, success, result)
+            num_tasks += 1
+    except (EOFError, OSError):
+        pass  # the broker is gone
+    finally:
+        stopped.set()
+    return num_tasks
+
+
+class RemoteBackend(EvaluationBackend):
+
+    def __init__(self, address, authkey=None, poll_interval=0.01, timeout=None):
+        """
+        Evaluation over the workers of a broker (see start_broker, serve_broker and run_worker).
+        :param address: (host, port) of the broker
+        :param authkey: authentication key of the broker (see resolve_authkey)
+        :param poll_interval: number of seconds between two polls of the results
+        :param timeout: maximal number of seconds waited for the results of a batch (optional)
+        """
+        self.address = address
+        self.authkey = resolve_authkey(authkey)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.client_id = uuid.uuid4().hex
+        self.board = _connect(address, authkey)
+
+    def starmap(self, fct, tasks):
+        task_ids = self.board.submit([(fct, tuple(task)) for task in tasks], self.client_id)
+        results = {}
+        start_time = time.time()
+        try:
+            while len(results) < len(task_ids):
+                results.update(self.board.collect([task_id for task_id in task_ids if task_id not in results], self.client_id))
+                if len(results) == len(task_ids):
+                    break
+                if self.timeout is not None and time.time() - start_time > self.timeout:
+                    raise TimeoutError(f"{len(task_ids) - len(results)} tasks not evaluated after {self.timeout} seconds.")
+                time.sleep(self.poll_interval)
+        finally:
+            if len(results) < len(task_ids):
+                self.board.cancel([task_id for task_id in task_ids if task_id not in results])
+
+        for success, result in results.values():
+            if not success:
+                raise result
+        return [results[task_id][1] for task_id in task_ids]
+
+    def stats(self):
+        return self.board.stats()
+
+    def __getstate__(self):
+        # the proxy of the board is reconnected after unpickling
+        return {name: value for name, value in self.__dict__.items() if name != "board"}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.client_id = uuid.uuid4().hex
+        self.board = _connect(self.address, self.authkey)
+
+
+class LocalCluster:
+
+    def __init__(self, n_workers, authkey=None, lease_timeout=30., heartbeat_interval=1.):
+        """
+        Broker and worker processes on the local machine, e.g. to test the remote evaluation on one machine.
+        :param n_workers: number of worker processes
+        :param authkey: authentication key of the broker (by default a random key)
+        :param lease_timeout: number of seconds without sign of life after which a worker is considered lost
+        :param heartbeat_interval: number of seconds between two heartbeats of a worker
+        """
+        authkey = os.urandom(32) if authkey is None else authkey
+        self.manager = start_broker(authkey=authkey, lease_timeout=lease_timeout)
+        self.address = self.manager.address
+        self.authkey = authkey
+        self.workers = [
+            Process(target=run_worker, args=(self.address, authkey, f"local-{i}", heartbeat_interval), daemon=True)
+            for i in range(n_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def backend(self, **kwargs):
+        """
+        :return: RemoteBackend connected to the broker
+        """
+        return RemoteBackend(self.address, self.authkey, **kwargs)
+
+    def close(self):
+        """
+        Let the workers finish their tasks, then stop them and the broker.
+        """
+        self.manager.get_board().close()
+        for worker in self.workers:
+            worker.join()
+        self.manager.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _wait_for_release(started_path, release_path):
+    """
+    Task of test_backend blocking its worker: records the process id of the worker and waits for the release file.
+    """
+    if not os.path.exists(release_path):
+        with open(started_path, "w") as f:
+            f.write(str(os.getpid()))
+        while not os.path.exists(release_path):
+            time.sleep(0.01)
+    return os.getpid()
+
+
+def test_backend():
+    """
+    Test the remote evaluation on a local cluster: the records match the in-process evaluation, the task of a killed
+    worker is resubmitted to another worker, and the pending tasks and uncollected results of a lost client expire.
+    """
+    import tempfile
+    import numpy as np
+    from evaluation import evaluate_batch
+    from optimization import Optimization
+
+    try:
+        EvaluationBackend()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("A backend should implement starmap")
+
+    hashsets = [
+        {'ASN1': {8, 2, 6, 7}, 'ASN2': {8, 9, 5, 7}, 'MSN': set(range(10))},
+        {'ASN1': {0, 1, 2, 3}, 'ASN2': {4, 5, 6, 7}, 'MSN': set(range(10))},
+        {'ASN1': {0, 8}, 'ASN2': {9, 5}, 'MSN': set(range(10))},
+        {'ASN1': {1, 2, 3}, 'ASN2': {6, 7, 8}, 'MSN': set(range(10))},
+    ]
+    expected = evaluate_batch(hashsets, 3, metric_fct=np.mean, seed=0)
+    directory = tempfile.mkdtemp()
+
+    with LocalCluster(n_workers=2, lease_timeout=2., heartbeat_interval=0.5) as cluster:
+        backend = cluster.backend()
+        records = backend.evaluate([(movie_hashsets, 3, np.mean, 0) for movie_hashsets in hashsets])
+        assert [record.sum_x for record in records] == [record.sum_x for record in expected]
+
+        # kill the worker blocked on a task, which is resubmitted to the other worker once its lease expires
+        started_path, release_path = os.path.join(directory, "started"), os.path.join(directory, "release")
+        result = []
+        thread = threading.Thread(target=lambda: result.extend(backend.starmap(_wait_for_release, [(started_path, release_path)])))
+        thread.start()
+        while not os.path.exists(started_path) or os.path.getsize(started_path) == 0:
+            time.sleep(0.01)
+        with open(started_path) as f:
+            killed_pid = int(f.read())
+        next(worker for worker in cluster.workers if worker.pid == killed_pid).kill()
+        open(release_path, "w").close()
+        thread.join()
+        assert len(result) == 1 and result[0] != killed_pid
+        assert backend.stats()["resubmitted"] == 1
+        records = evaluate_batch(hashsets, 3, metric_fct=np.mean, seed=0, backend=backend)
+        assert [record.sum_x for record in records] == [record.sum_x for record in expected]
+
+        # the replications of a single candidate are spread over the workers too
+        completed = backend.stats()["completed"]
+        optimization = Optimization(random_seed=0, backend=backend)
+        optimization.STATS_LOG_PATH = os.path.join(directory, "stats.runlog")
+        optimization(optimization_fct_names=["replace_one", "swap_one"], num_optimization_iters=3, num_iters_per_optimization=10, tolerance=1.)
+        assert backend.stats()["completed"] > completed
+        assert backend.stats()["uncollected"] == 0
+
+    # the results of a lost client expire with its lease, the given up batches are cancelled
+    board = TaskBoard(lease_timeout=0.1)
+    task_ids = board.submit([(abs, (-1,)), (abs, (-2,))], "lost")
+    board.complete("worker", board.take("worker")[0], True, 1)
+    time.sleep(0.2)
+    assert board.collect([], "other") == {} and board.take("worker") is None
+    assert len(board.results) == len(board.tasks) == len(board.owners) == 0 and board.stats()["expired"] == len(task_ids)
+    task_ids = board.submit([(abs, (-1,)), (abs, (-2,))], "client")
+    board.complete("worker", board.take("worker")[0], True, 1)
+    board.cancel(task_ids)
+    assert board.collect(task_ids, "client") == {} and board.take("worker") is None
+
+    # no default key
+    environ = {name: os.environ.pop(name) for name in (AUTHKEY_ENV, AUTHKEY_FILE_ENV) if name in os.environ}
+    try:
+        start_broker()
+        raise AssertionError("The broker started without authentication key.")
+    except ValueError:
+        pass
+    finally:
+        os.environ.update(environ)
+
+
+if __name__ == "__main__":
+    test_backend()
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from constants import GROUP_ACTIVITIES, GROUP_IDS, INITIAL_MOVIE_HASHSET
+from group import Group
+from storage import Storage
+from simulation import Simulation
+from stats import Stats
+from optimization import Optimization
+from pareto import pareto_front_mask
+import utils
+
+# modules of the simulation and optimization core, which must be importable with NumPy only (see import_time)
+CORE_MODULES = ("simulation", "stats", "evaluation", "optimization", "incremental", "backend", "multistart")
+HEAVY_MODULES = ("matplotlib", "pandas", "scipy")
+IMPORT_TIME_BUDGET = 0.5  # in seconds
+
+# scenarios scaling the request rates of the groups, i.e. the number of simulated requests
+SCENARIOS = {"nominal": 1., "double": 2., "quadruple": 4.}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register a benchmark: a function of the scenario scale returning the function to time.
+    :param name: name of the benchmark
+    """
+    def decorator(setup_fct):
+        BENCHMARKS[name] = setup_fct
+        return setup_fct
+    return decorator
+
+
+@contextmanager
+def scaled_scenario(scale):
+    """
+    Scale the request rates of the groups in-place for the duration of the context.
+    :param scale: factor applied to the request rates
+    """
+    original = {group_id: list(activities) for group_id, activities in GROUP_ACTIVITIES.items()}
+    utils.set_group_activities({group_id: [activity * scale for activity in activities] for group_id, activities in original.items()})
+    try:
+        yield
+    finally:
+        utils.set_group_activities(original)
+
+
+def _generated_requests(batch=True):
+    requests = []
+    for group_id in sorted(GROUP_IDS):
+        group = Group(group_id=group_id)
+        requests.extend(group.generate_requests_batch(INITIAL_MOVIE_HASHSET) if batch else group.generate_requests(INITIAL_MOVIE_HASHSET))
+    return requests
+
+
+@benchmark("group_generate_requests")
+def _bench_generate_requests(scale):
+    return lambda: _generated_requests(batch=False)
+
+
+@benchmark("group_generate_requests_batch")
+def _bench_generate_requests_batch(scale):
+    return lambda: _generated_requests(batch=True)
+
+
+@benchmark("storage_process")
+def _bench_storage_process(scale):
+    requests = [request for request in _generated_requests() if request.storage_id == "MSN"]
+    storage = Storage()
+    return lambda: storage.process(requests)
+
+
+@benchmark("simulation_run")
+def _bench_simulation_run(scale):
+    simulation = Simulation()
+    return lambda: simulation.run(movie_hashsets=INITIAL_MOVIE_HASHSET)
+
+
+@benchmark("stats_get_waiting_time")
+def _bench_get_waiting_time(scale):
+    stats = Stats(Simulation().run(movie_hashsets=INITIAL_MOVIE_HASHSET))
+    return stats.get_waiting_time
+
+
+@benchmark("stats_mse_bootstrap")
+def _bench_mse_bootstrap(scale):
+    stats = Stats(Simulation().run(movie_hashsets=INITIAL_MOVIE_HASHSET))
+    return lambda: stats.mse_bootstrap(np.mean, num_bootstrap=1000)
+
+
+@benchmark("compute_mean_request_rate")
+def _bench_compute_mean_request_rate(scale):
+    optimization = Optimization(random_seed=0)
+    hashsets = [optimization.random() for _ in range(100)]
+
+    def run():
+        utils._mean_request_rate.cache_clear()  # time the rate model rather than its memoization
+        for movie_hashsets in hashsets:
+            utils.compute_mean_request_rate(movie_hashsets)
+    return run
+
+
+@benchmark("optimization_iteration")
+def _bench_optimization_iteration(scale):
+    log_dir = tempfile.mkdtemp()
+
+    def run():
+        optimization = Optimization(random_seed=0)
+        optimization.STATS_LOG_PATH = os.path.join(log_dir, "stats.runlog")
+        optimization.HISTORY_LOG_PATH = os.path.join(log_dir, "history.runlog")
+        optimization(
+            optimization_fct_names=["replace_one"],
+            num_optimization_iters=1,
+            num_iters_per_optimization=5,
+            tolerance=10.,
+        )
+    return run
+
+
+@benchmark("pareto_front")
+def _bench_pareto_front(scale):
+    # ten million logged replications with 2 objectives (maximal and minimal wait), a million with 3 objectives (NSGA-II)
+    objectives_2d = np.random.random((10**7, 2))
+    objectives_3d = np.random.random((10**6, 3))
+    return lambda: (pareto_front_mask(objectives_2d), pareto_front_mask(objectives_3d))
+
+
+def run_benchmarks(names=None, scenarios=None, repeat=5, print_results=True):
+    """
+    Time the benchmarks over the scenarios. Each repetition starts from the same random state so that the repetitions
+    and the runs compared to a baseline simulate the same requests.
+    :param names: names of the benchmarks (by default all of them)
+    :param scenarios: names of the scenarios (by default all of them)
+    :param repeat: number of timed repetitions
+    :param print_results: whether to print the timings
+    :return: dictionary of the metadata of the machine and of the timings (min, median, max in seconds) per benchmark
+             and scenario
+    """
+    names = list(BENCHMARKS) if names is None else names
+    scenarios = list(SCENARIOS) if scenarios is None else scenarios
+
+    results = {}
+    for scenario in scenarios:
+        with scaled_scenario(SCENARIOS[scenario]):
+            for name in names:
+                np.random.seed(0)
+                random.seed(0)
+                fct = BENCHMARKS[name](SCENARIOS[scenario])
+
+                times = []
+                for _ in range(repeat + 1):  # the first run warms up the caches and is discarded
+                    np.random.seed(1)
+                    random.seed(1)
+                    start_time = time.perf_counter()
+                    fct()
+                    times.append(time.perf_counter() - start_time)
+                times = times[1:]
+
+                key = f"{name}[{scenario}]"
+                results[key] = {"min": min(times), "median": float(np.median(times)), "max": max(times), "repeat": repeat}
+                if print_results:
+                    print(f"{key:50s} median {1000 * results[key]['median']:10.2f} ms, min {1000 * results[key]['min']:10.2f} ms")
+
+    return {
+        "metadata": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+
+
+def save_baseline(results, path):
+    """
+    :param results: results of run_benchmarks
+    :param path: path of the JSON baseline
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=0.2, print_results=True):
+    """
+    Compare timings to a baseline on the median times of the benchmarks present in both.
+    :param results: results of run_benchmarks
+    :param baseline: baseline results (see save_baseline)
+    :param threshold: relative slowdown above which a benchmark is flagged as a regression
+    :param print_results: whether to print the comparison
+    :return: list of (benchmark, baseline median, current median, ratio) of the regressions
+    """
+    regressions = []
+    for key, current in results["results"].items():
+        if key not in baseline["results"]:
+            continue
+        reference = baseline["results"][key]["median"]
+        ratio = current["median"] / reference if reference > 0 else np.inf
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append((key, reference, current["median"], ratio))
+        if print_results:
+            flag = "REGRESSION" if regressed else ("faster" if ratio < 1 - threshold else "")
+            print(f"{key:50s} {1000 * reference:10.2f} ms -> {1000 * current['median']:10.2f} ms ({ratio:5.2f}x) {flag}")
+
+    if print_results:
+        print(f"{len(regressions)} regression(s) above {100 * threshold:.0f}%")
+    return regressions
+
+
+def import_time(modules=CORE_MODULES):
+    """
+    Time the import of modules in a fresh interpreter.
+    :param modules: names of the modules
+    :return: import time in seconds and list of the heavy modules (see HEAVY_MODULES) imported with them
+    """
+    code = (
+        "import sys, time\n"
+        "start_time = time.perf_counter()\n"
+        f"import {', '.join(modules)}\n"
+        "print(time.perf_counter() - start_time)\n"
+        f"print(','.join(sorted({{name.split('.')[0] for name in sys.modules}} & set({list(HEAVY_MODULES)!r}))))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.splitlines()
+    return float(output[0]), [name for name in output[1].split(",") if name]
+
+
+def test_import_time():
+    """
+    Test that the core modules import without the plotting and data frame libraries within the import time budget, so
+    that the worker processes start fast.
+    """
+    seconds, heavy_modules = import_time()
+    print(f"Core import time: {seconds:.3f} seconds, heavy modules: {heavy_modules}")
+    assert len(heavy_modules) == 0, f"The core modules import {heavy_modules}."
+    assert seconds < IMPORT_TIME_BUDGET, f"The core modules take {seconds:.3f} seconds to import (budget {IMPORT_TIME_BUDGET})."
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the simulation and optimization hot paths.")
+    parser.add_argument("command", choices=["run", "compare", "import"], help="run: time and save a baseline, compare: time and compare to a baseline, import: check the import time of the core modules")
+    parser.add_argument("--baseline", default="benchmark_baselines/baseline.json", help="path of the JSON baseline")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed repetitions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown flagged as a regression")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        test_import_time()
+        return 0
+
+    results = run_benchmarks(args.benchmarks, args.scenarios, repeat=args.repeat)
+    if args.command == "run":
+        save_baseline(results, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, load_baseline(args.baseline), threshold=args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
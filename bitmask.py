@@ -0,0 +1,104 @@
+from constants import MOVIES_IDS, MOVIE_SIZES, STORAGE_SIZES
+
+# Compact representation of a movie set as an integer bitmask: bit k is set if the k-th movie of MOVIE_LIST is stored.
+# The sizes and cardinalities of all the 2^n subsets are precomputed so that capacity checks are table lookups.
+MOVIE_LIST = tuple(sorted(MOVIES_IDS))
+MOVIE_BITS = {movie_id: 1 << k for k, movie_id in enumerate(MOVIE_LIST)}
+ALL_MOVIES = (1 << len(MOVIE_LIST)) - 1
+
+SUBSET_SIZES = [0] * (ALL_MOVIES + 1)
+SUBSET_COUNTS = [0] * (ALL_MOVIES + 1)
+for _mask in range(1, ALL_MOVIES + 1):
+    _lowest = _mask & -_mask
+    SUBSET_SIZES[_mask] = SUBSET_SIZES[_mask ^ _lowest] + MOVIE_SIZES[MOVIE_LIST[_lowest.bit_length() - 1]]
+    SUBSET_COUNTS[_mask] = SUBSET_COUNTS[_mask ^ _lowest] + 1
+
+
+def to_mask(movie_ids):
+    """
+    :param movie_ids: iterable of movie ids
+    :return: bitmask of the movies
+    """
+    mask = 0
+    for movie_id in movie_ids:
+        mask |= MOVIE_BITS[int(movie_id)]
+    return mask
+
+
+def movie_ids(mask):
+    """
+    :param mask: bitmask of movies
+    :return: tuple of the movie ids of the bitmask, in increasing order
+    """
+    return tuple(movie_id for k, movie_id in enumerate(MOVIE_LIST) if mask >> k & 1)
+
+
+def to_set(mask):
+    """
+    :param mask: bitmask of movies
+    :return: set of the movie ids of the bitmask
+    """
+    return set(movie_ids(mask))
+
+
+def popcount(mask):
+    """
+    :param mask: bitmask of movies
+    :return: number of movies of the bitmask
+    """
+    return SUBSET_COUNTS[mask]
+
+
+def size(mask):
+    """
+    :param mask: bitmask of movies
+    :return: total size of the movies of the bitmask
+    """
+    return SUBSET_SIZES[mask]
+
+
+def fits(storage_id, mask):
+    """
+    :param storage_id: storage node
+    :param mask: bitmask of movies
+    :return: True if the movies fit in the capacity of the storage node
+    """
+    return SUBSET_SIZES[mask] <= STORAGE_SIZES[storage_id]
+
+
+def to_masks(movies_hashsets):
+    """
+    :param movies_hashsets: movie hashset defining the storage configuration (dict of movie sets per storage node)
+    :return: dict of bitmasks per storage node
+    """
+    return {storage_id: to_mask(movie_set) for storage_id, movie_set in movies_hashsets.items()}
+
+
+def to_hashsets(masks):
+    """
+    :param masks: dict of bitmasks per storage node
+    :return: movie hashset (dict of movie sets per storage node), the view used by the simulation
+    """
+    return {storage_id: to_set(mask) for storage_id, mask in masks.items()}
+
+
+def test_bitmask():
+    """
+    Test that movie hashsets round-trip through their bitmasks and that the precomputed tables match the sets.
+    """
+    from constants import INITIAL_MOVIE_HASHSET, STORAGE_IDS
+
+    assert to_hashsets(to_masks(INITIAL_MOVIE_HASHSET)) == INITIAL_MOVIE_HASHSET
+
+    for mask in range(ALL_MOVIES + 1):
+        movie_set = to_set(mask)
+        assert to_mask(movie_set) == mask
+        assert popcount(mask) == len(movie_set)
+        movie_size = sum(MOVIE_SIZES[movie_id] for movie_id in movie_set)
+        assert size(mask) == movie_size
+        for storage_id in STORAGE_IDS:
+            assert fits(storage_id, mask) == (movie_size <= STORAGE_SIZES[storage_id])
+
+
+if __name__ == "__main__":
+    test_bitmask()
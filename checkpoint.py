@@ -0,0 +1,131 @@
+import os
+import pickle
+import random
+import numpy as np
+
+
+def save_checkpoint(path, state):
+    """
+    Write a checkpoint atomically: the state is pickled to a temporary file which then replaces the checkpoint, so that
+    a crash while writing keeps the previous checkpoint. Objects shared within the state (e.g. records referenced both
+    by the loop state and by the evaluation cache) are pickled once and stay shared on loading.
+    :param path: path of the checkpoint file
+    :param state: dictionary of the state to save
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    :param path: path of the checkpoint file
+    :return: dictionary of the saved state
+    """
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def get_random_states(rng):
+    """
+    Capture the states of all the random generators used by the simulation and the optimization.
+    :param rng: numpy Generator of the optimization
+    :return: dictionary of the random states
+    """
+    return {"rng": rng.bit_generator.state, "np_random": np.random.get_state(), "random": random.getstate()}
+
+
+def set_random_states(rng, states):
+    """
+    Restore the states of all the random generators (see get_random_states).
+    :param rng: numpy Generator of the optimization, restored in-place
+    :param states: dictionary of the random states
+    """
+    rng.bit_generator.state = states["rng"]
+    np.random.set_state(states["np_random"])
+    random.setstate(states["random"])
+
+
+def test_checkpoint():
+    """
+    Test that a checkpoint restores the states of the random generators, and that an optimization interrupted after a
+    checkpoint and resumed in another instance ends as the uninterrupted run, with the same run log, and that a finished
+    run is not rerun.
+    """
+    import tempfile
+    from optimization import Optimization
+    from runlog import read_runlog
+
+    directory = tempfile.mkdtemp()
+    rng = np.random.default_rng(0)
+    np.random.seed(0)
+    random.seed(0)
+    save_checkpoint(os.path.join(directory, "states.pkl"), {"random_states": get_random_states(rng)})
+    draws = rng.random(), np.random.random(), random.random()
+    rng = np.random.default_rng(1)
+    set_random_states(rng, load_checkpoint(os.path.join(directory, "states.pkl"))["random_states"])
+    assert (rng.random(), np.random.random(), random.random()) == draws
+
+    optimization_kwargs = dict(
+        optimization_fct_names=["replace_one", "swap_one", "replace_one_fill"],
+        num_optimization_iters=4,
+        num_iters_per_optimization=10,
+        tolerance=0.5,
+        use_control_variate=True,
+        use_evaluation_cache=True,
+        checkpoint_every=2,
+    )
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(state):
+        if state["iteration"] == 3:
+            raise Interrupted()
+        return False
+
+    results, runlogs = [], []
+    for interrupted in (False, True):
+        np.random.seed(0)
+        random.seed(0)
+        optimization = Optimization(print_results=False, random_seed=0)
+        optimization.STATS_LOG_PATH = os.path.join(directory, f"stats_{interrupted}.runlog")
+        checkpoint_path = os.path.join(directory, f"optimization_{interrupted}.pkl")
+        if interrupted:
+            try:
+                optimization(**optimization_kwargs, checkpoint_path=checkpoint_path, callback=interrupt)
+            except Interrupted:
+                pass
+            optimization = Optimization(print_results=False, random_seed=1)
+            results.append(optimization.resume(checkpoint_path))
+            assert optimization.STATS_LOG_PATH == os.path.join(directory, f"stats_{interrupted}.runlog")
+        else:
+            results.append(optimization(**optimization_kwargs, checkpoint_path=checkpoint_path))
+        runlogs.append(read_runlog(optimization.STATS_LOG_PATH))
+
+    assert results[0] == results[1]
+    assert len(runlogs[0]) == len(runlogs[1]) > 0
+    for name in runlogs[0].dtype.names:
+        if name != "run_id":
+            assert np.array_equal(runlogs[0][name], runlogs[1][name])
+
+    # a metric which cannot be pickled is rejected before the run rather than at its first checkpoint
+    try:
+        Optimization(print_results=False)(**optimization_kwargs, metric_fct=lambda X: np.mean(X), checkpoint_path=checkpoint_path)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A lambda metric should be rejected with a checkpoint")
+
+    # a finished run is not rerun on resume and its run log is left untouched
+    assert Optimization(print_results=False).resume(checkpoint_path) == results[1]
+    assert np.array_equal(read_runlog(os.path.join(directory, "stats_True.runlog")), runlogs[1])
+
+
+if __name__ == "__main__":
+    test_checkpoint()
@@ -0,0 +1,419 @@
+import numpy as np
+import random
+from collections import OrderedDict
+from multiprocessing import Pool
+
+from simulation import Simulation
+from stats import Stats
+from utils import canonical_hashset, observed_max_request_rate
+
+
+def qualified_name(fct):
+    """
+    :param fct: function
+    :return: module and qualified name of a module-level function, which identify it across processes and pickles, None
+             for a lambda, a local function or an object without qualified name
+    """
+    name = getattr(fct, "__qualname__", None)
+    if name is None or "<lambda>" in name or "<locals>" in name:
+        return None
+    return f"{fct.__module__}.{name}"
+
+
+class EvaluationRecord:
+
+    def __init__(self):
+        """
+        Sufficient statistics of the replications of a movie hashset: the statistic X = T(requests) and the control
+        variate Y = f(rates) of each replication are accumulated so that replications can be topped up on revisits.
+        """
+        self.count = 0
+        self.sum_x = 0.
+        self.sum_x2 = 0.
+        self.sum_y = 0.
+        self.sum_y2 = 0.
+        self.sum_xy = 0.
+        self.mse_bootstrap = None  # bootstrap MSE of the statistic from a single simulation
+        self.replications = None  # per-replication outputs kept until consumed (see evaluate_hashset)
+
+    def update(self, X, Y):
+        """
+        Accumulate new replications.
+        :param X: statistic T(requests) of the requests waiting time per simulation
+        :param Y: f(rates) per simulation
+        """
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        self.count += len(X)
+        self.sum_x += float(np.sum(X))
+        self.sum_x2 += float(np.sum(X ** 2))
+        self.sum_y += float(np.sum(Y))
+        self.sum_y2 += float(np.sum(Y ** 2))
+        self.sum_xy += float(np.sum(X * Y))
+
+    def merge(self, other):
+        """
+        Accumulate the replications of another record of the same movie hashset.
+        :param other: EvaluationRecord
+        """
+        self.count += other.count
+        self.sum_x += other.sum_x
+        self.sum_x2 += other.sum_x2
+        self.sum_y += other.sum_y
+        self.sum_y2 += other.sum_y2
+        self.sum_xy += other.sum_xy
+        if self.mse_bootstrap is None:
+            self.mse_bootstrap = other.mse_bootstrap
+        if other.replications is not None:
+            self.replications = concatenate_replications([self.replications, other.replications])
+
+    def pop_replications(self):
+        """
+        Release the per-replication outputs kept by the record.
+        :return: dictionary of arrays per replication (see simulate_replications), None if none were kept
+        """
+        replications = self.replications
+        self.replications = None
+        return replications
+
+    def mean(self):
+        """
+        :return: Monte-Carlo estimate of the expected statistic
+        """
+        return self.sum_x / self.count if self.count > 0 else np.inf
+
+    def variance(self):
+        """
+        :return: sample variance of the statistic over the replications
+        """
+        if self.count < 2:
+            return np.inf
+        return max(self.sum_x2 - self.sum_x ** 2 / self.count, 0.) / (self.count - 1)
+
+    def half_width(self):
+        """
+        :return: 95% CI half-width of the Monte-Carlo estimate
+        """
+        return 1.96 * np.sqrt(self.variance() / self.count) if self.count > 0 else np.inf
+
+    def control_variate_estimate(self, mu):
+        """
+        Control variate estimate computed from the sufficient statistics (see Optimization.control_variate_estimate).
+        :param mu: theoretical value of the control variate
+        :return: control estimate of the expected statistic
+        """
+        if self.count < 2: return self.mean()  # no linear regression possible
+
+        X_mean = self.sum_x / self.count
+        Y_mean = self.sum_y / self.count
+        S_xy = self.sum_xy - self.count * X_mean * Y_mean
+        S_yy = self.sum_y2 - self.count * Y_mean ** 2
+        if S_yy <= 0: return X_mean  # constant control variate
+
+        a = S_xy / S_yy
+        b = X_mean - a * Y_mean
+
+        return b + a * mu
+
+    def control_variate_half_width(self):
+        """
+        :return: 95% CI half-width of the control variate estimate, from the variance of the residuals X - a Y of the
+                 regression of the statistic on the control variate
+        """
+        if self.count < 2: return self.half_width()
+
+        X_mean = self.sum_x / self.count
+        Y_mean = self.sum_y / self.count
+        S_xx = self.sum_x2 - self.count * X_mean ** 2
+        S_xy = self.sum_xy - self.count * X_mean * Y_mean
+        S_yy = self.sum_y2 - self.count * Y_mean ** 2
+        if S_yy <= 0: return self.half_width()  # constant control variate
+
+        variance = max(S_xx - S_xy ** 2 / S_yy, 0.) / (self.count - 1)
+        return 1.96 * np.sqrt(variance / self.count)
+
+
+class EvaluationCache:
+
+    def __init__(self, max_size=1024):
+        """
+        In-memory LRU cache of EvaluationRecord keyed by the canonical form of the movie hashsets.
+        :param max_size: maximal number of cached movie hashsets
+        """
+        self.max_size = max_size
+        self.records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, movie_hashsets, metric_fct):
+        """
+        :param movie_hashsets: movie hashset defining the storage configuration
+        :param metric_fct: function to calculate the metric (e.g. mean, median)
+        :return: cache key of the movie hashset and metric, the metric function being keyed by identity so that distinct
+                 functions sharing a name (e.g. lambdas) never share records
+        """
+        return canonical_hashset(movie_hashsets), metric_fct
+
+    def get(self, movie_hashsets, metric_fct):
+        """
+        Get the record of a movie hashset, creating an empty one on a miss.
+        :param movie_hashsets: movie hashset defining the storage configuration
+        :param metric_fct: function to calculate the metric (e.g. mean, median)
+        :return: EvaluationRecord
+        """
+        key = self.key(movie_hashsets, metric_fct)
+        if key in self.records:
+            self.hits += 1
+            self.records.move_to_end(key)
+            return self.records[key]
+
+        self.misses += 1
+        record = EvaluationRecord()
+        self.records[key] = record
+        if len(self.records) > self.max_size:
+            self.records.popitem(last=False)  # evict the least recently used record
+        return record
+
+    def hit_rate(self):
+        """
+        :return: fraction of lookups served from the cache
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.
+
+    def __len__(self):
+        return len(self.records)
+
+
+def simulate_replications(movie_hashsets, num_simulations, metric_fct=np.mean, simulation=None):
+    """
+    Run independent replications of the simulation for a movie hashset.
+    :param movie_hashsets: movie hashset defining the storage configuration
+    :param num_simulations: number of replications
+    :param metric_fct: function to calculate the metric (e.g. mean, median)
+    :param simulation: Simulation instance (optional)
+    :return: dictionary of arrays of the metric, control variate (maximal observed request rate per storage node and
+             interval), mean, max and min waiting time and number of processed requests per replication
+    """
+    simulation = Simulation() if simulation is None else simulation
+
+    replications = {"metric": [], "control_variate": [], "mean_wait": [], "max_wait": [], "min_wait": [], "num_requests": []}
+    for _ in range(num_simulations):
+        # run simulation
+        requests = simulation.run(movie_hashsets=movie_hashsets)
+
+        # get Statistics
+        stats = Stats(requests)
+        waiting_times = stats.get_waiting_time()
+        replications["metric"].append(metric_fct(waiting_times))
+        replications["mean_wait"].append(np.mean(waiting_times))
+        replications["max_wait"].append(np.max(waiting_times))
+        replications["min_wait"].append(np.min(waiting_times))
+        replications["num_requests"].append(len(waiting_times))
+        replications["control_variate"].append(observed_max_request_rate(requests))
+
+    return {name: np.array(values) for name, values in replications.items()}
+
+
+def concatenate_replications(replications_list):
+    """
+    :param replications_list: list of dictionaries of arrays per replication (see simulate_replications), None entries
+                              being skipped
+    :return: dictionary of the concatenated arrays, None if the list holds no dictionary
+    """
+    replications_list = [replications for replications in replications_list if replications is not None]
+    if len(replications_list) == 0:
+        return None
+    return {name: np.concatenate([replications[name] for replications in replications_list]) for name in replications_list[0]}
+
+
+def _seeded_replications(movie_hashsets, num_simulations, metric_fct=np.mean, seed=None):
+    """
+    Run the replications of a movie hashset from a seed, restoring the random state of the calling process afterwards.
+    :param movie_hashsets: movie hashset defining the storage configuration
+    :param num_simulations: number of replications
+    :param metric_fct: function to calculate the metric (e.g. mean, median)
+    :param seed: seed of the replications (optional)
+    :return: dictionary of arrays per replication (see simulate_replications)
+    """
+    if seed is not None:
+        np_state, random_state = np.random.get_state(), random.getstate()
+        np.random.seed(seed)
+        random.seed(seed)
+
+    replications = simulate_replications(movie_hashsets, num_simulations, metric_fct=metric_fct)
+
+    if seed is not None:
+        np.random.set_state(np_state)
+        random.setstate(random_state)
+
+    return replications
+
+
+def backend_replications(movie_hashsets, num_simulations, backend, metric_fct=np.mean, seed=0, replications_per_task=5):
+    """
+    Run the replications of a movie hashset over an evaluation backend, split into tasks of a few replications each run
+    from consecutive seeds, so that the replications of a single hashset are spread over the workers.
+    :param movie_hashsets: movie hashset defining the storage configuration
+    :param num_simulations: number of replications
+    :param backend: evaluation backend (see backend.EvaluationBackend)
+    :param metric_fct: function to calculate the metric (e.g. mean, median), must be picklable
+    :param seed: seed of the first task
+    :param replications_per_task: number of replications per task
+    :return: dictionary of arrays per replication (see simulate_replications)
+    """
+    sizes = [min(replications_per_task, num_simulations - start) for start in range(0, num_simulations, replications_per_task)]
+    if len(sizes) == 0:
+        return simulate_replications(movie_hashsets, 0)
+    results = backend.starmap(_seeded_replications, [(movie_hashsets, size, metric_fct, seed + k) for k, size in enumerate(sizes)])
+    return concatenate_replications(results)
+
+
+def evaluate_hashset(movie_hashsets, num_simulations, metric_fct=np.mean, seed=None, keep_replications=False):
+    """
+    Evaluate a movie hashset over independent replications. When a seed is given, the replications are run from it so
+    that hashsets evaluated with the same seed share their random numbers (common random numbers), and the random state
+    of the calling process is restored afterwards.
+    :param movie_hashsets: movie hashset defining the storage configuration
+    :param num_simulations: number of replications
+    :param metric_fct: function to calculate the metric (e.g. mean, median), must be picklable for parallel evaluation
+    :param seed: seed of the replications (optional)
+    :param keep_replications: whether to keep the per-replication outputs in the record, e.g. to log them
+    :return: EvaluationRecord of the replications
+    """
+    replications = _seeded_replications(movie_hashsets, num_simulations, metric_fct=metric_fct, seed=seed)
+
+    record = EvaluationRecord()
+    record.update(replications["metric"], replications["control_variate"])
+    if keep_replications:
+        record.replications = replications
+    return record
+
+
+def evaluate_batch(hashsets, num_simulations, metric_fct=np.mean, seed=None, n_workers=1, pool=None, backend=None, keep_replications=False):
+    """
+    Evaluate a batch of movie hashsets with the same seed, in parallel over a pool of worker processes.
+    :param hashsets: list of movie hashsets
+    :param num_simulations: number of replications per hashset, or list of numbers of replications of each hashset
+    :param metric_fct: function to calculate the metric (e.g. mean, median), must be picklable
+    :param seed: seed shared by the hashsets (optional)
+    :param n_workers: number of worker processes (1 evaluates in-process)
+    :param pool: persistent pool of n_workers worker processes (optional, by default a pool is created for the batch)
+    :param backend: evaluation backend (optional, see backend.EvaluationBackend), overrides n_workers and pool
+    :param keep_replications: whether to keep the per-replication outputs in the records (see evaluate_hashset)
+    :return: list of EvaluationRecord in the order of the hashsets
+    """
+    num_simulations = [num_simulations] * len(hashsets) if np.isscalar(num_simulations) else num_simulations
+    tasks = [(movie_hashsets, n, metric_fct, seed, keep_replications) for movie_hashsets, n in zip(hashsets, num_simulations)]
+    if backend is not None:
+        return backend.evaluate(tasks) if len(tasks) > 0 else []
+    if n_workers <= 1 or len(tasks) <= 1:
+        return [evaluate_hashset(*task) for task in tasks]
+
+    chunksize = max(1, len(tasks) // (4 * n_workers))
+    if pool is not None:
+        return pool.starmap(evaluate_hashset, tasks, chunksize=chunksize)
+
+    with Pool(processes=n_workers) as pool:
+        return pool.starmap(evaluate_hashset, tasks, chunksize=chunksize)
+
+
+def evaluate_objectives(movie_hashsets, num_simulations, seed=None):
+    """
+    Estimate the waiting time objectives of a movie hashset over independent replications.
+    :param movie_hashsets: movie hashset defining the storage configuration
+    :param num_simulations: number of replications
+    :param seed: seed of the replications (optional, see evaluate_hashset)
+    :return: array of the expected mean and expected maximal waiting time
+    """
+    replications = _seeded_replications(movie_hashsets, num_simulations, seed=seed)
+    return np.array([np.mean(replications["mean_wait"]), np.mean(replications["max_wait"])])
+
+
+class SharedEvaluationCache(EvaluationCache):
+
+    # sufficient statistics of an EvaluationRecord exchanged through the shared store
+    FIELDS = ("count", "sum_x", "sum_x2", "sum_y", "sum_y2", "sum_xy", "mse_bootstrap")
+
+    def __init__(self, store, max_size=1024):
+        """
+        Evaluation cache backed by a store shared between processes (e.g. a multiprocessing.Manager dict): a miss of
+        the local cache is served from the store, and publish pushes the records accessed since the last publication.
+        The store keeps, per movie hashset, the record with the most replications, so that replications are never
+        counted twice when several processes top up the same hashset.
+        :param store: shared mapping of the store keys (see store_key) to the sufficient statistics of the records
+        :param max_size: maximal number of locally cached movie hashsets
+        """
+        super().__init__(max_size=max_size)
+        self.store = store
+        self.accessed = set()
+        self.store_hits = 0
+
+    @staticmethod
+    def store_key(key):
+        """
+        :param key: cache key of a movie hashset and metric (see EvaluationCache.key)
+        :return: key of the shared store, the metric function being identified by its qualified name across processes
+        """
+        canonical, metric_fct = key
+        name = qualified_name(metric_fct)
+        if name is None:
+            raise ValueError("The metric function of a shared evaluation cache must be a module-level function.")
+        return canonical, name
+
+    def get(self, movie_hashsets, metric_fct):
+        key = self.key(movie_hashsets, metric_fct)
+        store_key = self.store_key(key)
+        if key not in self.records and store_key in self.store:
+            record = EvaluationRecord()
+            for field, value in zip(self.FIELDS, self.store[store_key]):
+                setattr(record, field, value)
+            self.records[key] = record
+            self.store_hits += 1
+            if len(self.records) > self.max_size:
+                self.records.popitem(last=False)
+        self.accessed.add(key)
+        return super().get(movie_hashsets, metric_fct)
+
+    def publish(self):
+        """
+        Push the records accessed since the last publication to the shared store.
+        """
+        for key in self.accessed:
+            record = self.records.get(key)
+            if record is None or record.count == 0:
+                continue
+            store_key = self.store_key(key)
+            stored = self.store.get(store_key)
+            if stored is None or stored[0] < record.count:
+                self.store[store_key] = tuple(getattr(record, field) for field in self.FIELDS)
+        self.accessed = set()
+
+
+def test_evaluation_cache():
+    """
+    Test that distinct metric functions sharing a name get distinct records, and that the shared store only accepts
+    metric functions identified by their name across processes.
+    """
+    from constants import INITIAL_MOVIE_HASHSET
+
+    cache = EvaluationCache()
+    metric_fcts = [lambda x: np.mean(x), lambda x: np.max(x)]
+    records = [cache.get(INITIAL_MOVIE_HASHSET, metric_fct) for metric_fct in metric_fcts]
+    assert records[0] is not records[1]
+    assert cache.get(INITIAL_MOVIE_HASHSET, metric_fcts[0]) is records[0]
+
+    shared_cache = SharedEvaluationCache({})
+    shared_cache.get(INITIAL_MOVIE_HASHSET, np.mean).update([1.], [1.])
+    shared_cache.publish()
+    assert SharedEvaluationCache(shared_cache.store).get(INITIAL_MOVIE_HASHSET, np.mean).count == 1
+    try:
+        shared_cache.get(INITIAL_MOVIE_HASHSET, metric_fcts[0])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A lambda metric should be rejected by the shared store")
+
+
+if __name__ == "__main__":
+    test_evaluation_cache()
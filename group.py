@@ -71,3 +71,24 @@ class Group:
             requests.extend([Request(group_id=self.group_id, movie_id=movie_id, storage_id=storage_map[movie_id], time_creation=time_creation) for time_creation, movie_id in zip(event_times, movie_ids)])
 
         return requests
+
+    def generate_requests_stationary(self, movies_hashsets, interval, start_time, end_time, time_end=np.inf):
+        """
+        Generates a list of requests for a group over [start_time, end_time) at the fixed request rate of a single
+        time interval, i.e. a stationary Poisson process used for steady-state runs longer than the simulation period.
+        :param movies_hashsets: Dictionary mapping storage node IDs to hashsets of movie IDs contained on storage nodes.
+        :param interval: index of the time interval whose request rate is used
+        :param start_time: start of the generation window
+        :param end_time: end of the generation window
+        :param time_end: end of the processing horizon passed to the requests (by default no horizon)
+        :return: List of Request objects sorted by creation time.
+        """
+        storage_map = movie_to_storage_map(self.group_id, movies_hashsets)
+        request_rate = GROUP_ACTIVITIES[self.group_id][interval]
+
+        n_event = np.random.poisson(request_rate * (end_time - start_time))
+        event_times = np.sort(np.random.uniform(start_time, end_time, n_event))
+
+        movie_ids = random.choices(list(GROUP_MOVIE_POPULARITIES[self.group_id].keys()), weights=list(GROUP_MOVIE_POPULARITIES[self.group_id].values()), k=n_event)
+
+        return [Request(group_id=self.group_id, movie_id=movie_id, storage_id=storage_map[movie_id], time_creation=time_creation, time_end=time_end) for time_creation, movie_id in zip(event_times, movie_ids)]
@@ -0,0 +1,217 @@
+import numpy as np
+from collections import OrderedDict
+
+from request import Request
+from storage import fcfs_handling_times
+from constants import TIME_INTERVALS, GROUP_ACTIVITIES, GROUP_STORAGE_OPTIONS, STORAGE_HANDLE_TIME_BETA, BOUND_SERVE_TIME
+from utils import GROUP_ORDER, STORAGE_ORDER, MOVIE_ORDER, MOVIE_POPULARITY, group_movie_to_storage_map
+
+
+def node_signatures(movies_hashsets):
+    """
+    Arrival signature of each storage node: the (group, movie) pairs whose requests are routed to the node. Under
+    shared arrival streams, two hashsets with the same signature for a node feed it the same requests.
+    :param movies_hashsets: movie hashset defining the storage configuration
+    :return: dictionary of the frozen set of (group_id, movie_id) routed to each storage node
+    """
+    routing = group_movie_to_storage_map(movies_hashsets)
+    signatures = {storage_id: set() for storage_id in STORAGE_ORDER}
+    for group_id in GROUP_ORDER:
+        for movie_id in MOVIE_ORDER:
+            signatures[routing[group_id][movie_id]].add((group_id, movie_id))
+    return {storage_id: frozenset(signature) for storage_id, signature in signatures.items()}
+
+
+class IncrementalEvaluator:
+
+    def __init__(self, metric_fct=np.mean, seed=0, max_arrivals=64, memory_budget=2**27):
+        """
+        Replications of the simulation under arrival streams shared by all the hashsets, re-simulating only the storage
+        nodes whose incoming requests changed. The requests of replication r are drawn from a stream seeded by
+        (seed, r, group) independently of the hashset, and the handling and serving times of a node from a stream
+        seeded by (seed, r, node), so that a node fed the same requests by two hashsets (same signature, see
+        node_signatures) yields the same waiting times, which are then reused instead of re-queued. The streams being
+        seeded, the evicted arrivals and results are regenerated identically when needed again.
+        :param metric_fct: function to calculate the metric (e.g. mean, median)
+        :param seed: seed of the shared streams
+        :param max_arrivals: maximal number of replications whose arrival streams are kept (LRU)
+        :param memory_budget: maximal number of bytes of the waiting times of the (node, signature) results kept (LRU)
+        """
+        self.metric_fct = metric_fct
+        self.seed = seed
+        self.max_arrivals = max_arrivals
+        self.memory_budget = memory_budget
+        self.arrivals = OrderedDict()  # replication -> group -> (creation times, movie indices)
+        self.node_results = OrderedDict()  # (storage_id, signature) -> replication -> (waiting times, max rate)
+        self.result_sizes = {}  # (storage_id, signature) -> number of bytes of its waiting times
+        self.memory_used = 0
+        self.nodes_simulated = 0
+        self.nodes_reused = 0
+
+        # deterministic send and service times of the requests per (group, movie, storage)
+        self.delays = {}
+        for group_id in GROUP_ORDER:
+            for storage_id in GROUP_STORAGE_OPTIONS[group_id]:
+                for movie_id in MOVIE_ORDER:
+                    request = Request(group_id=group_id, movie_id=movie_id, storage_id=storage_id, time_creation=0)
+                    self.delays[group_id, movie_id, storage_id] = (request.time_request_send, request.time_movie_service)
+
+    def _arrivals(self, replication):
+        """
+        Shared arrival streams of a replication (Poisson process per group and interval, see
+        Group.generate_requests_batch).
+        :param replication: index of the replication
+        :return: dictionary of the creation times and movie indices of the requests per group
+        """
+        if replication in self.arrivals:
+            self.arrivals.move_to_end(replication)
+        else:
+            streams = {}
+            for g, group_id in enumerate(GROUP_ORDER):
+                rng = np.random.default_rng([self.seed, replication, g])
+                times, movies = [], []
+                for interval, (start_time, end_time) in enumerate(TIME_INTERVALS):
+                    n_event = rng.poisson(GROUP_ACTIVITIES[group_id][interval] * (end_time - start_time))
+                    times.append(rng.uniform(start_time, end_time, n_event))
+                    movies.append(rng.choice(len(MOVIE_ORDER), size=n_event, p=MOVIE_POPULARITY[g]))
+                streams[group_id] = (np.concatenate(times), np.concatenate(movies))
+            self.arrivals[replication] = streams
+            if len(self.arrivals) > self.max_arrivals:
+                self.arrivals.popitem(last=False)  # evict the least recently used replication
+        return self.arrivals[replication]
+
+    def _simulate_node(self, storage_id, signature, replication):
+        """
+        FCFS queue of a storage node fed by the requests of its signature (see Storage.process).
+        :return: waiting times of the processed requests and maximal observed request rate per interval of the node
+        """
+        creation, arrival, service = [], [], []
+        for group_id, (times, movies) in self._arrivals(replication).items():
+            for movie_idx, movie_id in enumerate(MOVIE_ORDER):
+                if (group_id, movie_id) not in signature:
+                    continue
+                selected = times[movies == movie_idx]
+                time_send, time_service = self.delays[group_id, movie_id, storage_id]
+                creation.append(selected)
+                arrival.append(selected + time_send)
+                service.append(np.full(len(selected), time_service))
+
+        creation = np.concatenate(creation) if creation else np.array([])
+        max_rate = max(np.sum((creation >= t_start) & (creation <= t_end)) / (t_end - t_start) for t_start, t_end in TIME_INTERVALS)
+        if len(creation) == 0:
+            return np.array([]), max_rate
+
+        arrival, service = np.concatenate(arrival), np.concatenate(service)
+        order = np.argsort(arrival, kind="stable")
+        creation, arrival, service = creation[order], arrival[order], service[order]
+
+        # handling and serving times drawn as in Storage.process, for all the requests of the node in the order of
+        # arrival, the requests arriving after the horizon being last and not processed
+        rng = np.random.RandomState([self.seed, replication, len(GROUP_ORDER) + STORAGE_ORDER.index(storage_id)])
+        deltas_time_handle = rng.exponential(scale=STORAGE_HANDLE_TIME_BETA, size=len(arrival))
+        deltas_time_serve_random = rng.uniform(BOUND_SERVE_TIME[0], BOUND_SERVE_TIME[1], size=len(arrival))
+        n_processed = int(np.sum(arrival <= TIME_INTERVALS[-1][1]))
+
+        time_handled = fcfs_handling_times(arrival[:n_processed], deltas_time_handle[:n_processed])
+        return time_handled + service[:n_processed] + deltas_time_serve_random[:n_processed] - creation[:n_processed], max_rate
+
+    def _node_result(self, storage_id, signature, replication):
+        key = (storage_id, signature)
+        if key in self.node_results:
+            self.node_results.move_to_end(key)
+        else:
+            self.node_results[key] = {}
+            self.result_sizes[key] = 0
+
+        results = self.node_results[key]
+        if replication in results:
+            self.nodes_reused += 1
+            return results[replication]
+
+        self.nodes_simulated += 1
+        result = self._simulate_node(storage_id, signature, replication)
+        results[replication] = result
+        self.result_sizes[key] += result[0].nbytes
+        self.memory_used += result[0].nbytes
+
+        # evict the least recently used signatures above the memory budget, keeping the one in use
+        while self.memory_used > self.memory_budget and len(self.node_results) > 1:
+            evicted_key, _ = self.node_results.popitem(last=False)
+            self.memory_used -= self.result_sizes.pop(evicted_key)
+        return result
+
+    def replications(self, movie_hashsets, num_simulations, start=0):
+        """
+        Run replications start, ..., start + num_simulations - 1 of a movie hashset.
+        :param movie_hashsets: movie hashset defining the storage configuration
+        :param num_simulations: number of replications
+        :param start: index of the first replication, e.g. the number of replications already accumulated
+        :return: dictionary of arrays of the metric, control variate, mean, max and min waiting time and number of
+                 processed requests per replication (see evaluation.simulate_replications)
+        """
+        signatures = node_signatures(movie_hashsets)
+
+        replications = {"metric": [], "control_variate": [], "mean_wait": [], "max_wait": [], "min_wait": [], "num_requests": []}
+        for replication in range(start, start + num_simulations):
+            results = [self._node_result(storage_id, signatures[storage_id], replication) for storage_id in STORAGE_ORDER]
+            waiting_times = np.concatenate([waits for waits, _ in results])
+            replications["metric"].append(self.metric_fct(waiting_times))
+            replications["mean_wait"].append(np.mean(waiting_times))
+            replications["max_wait"].append(np.max(waiting_times))
+            replications["min_wait"].append(np.min(waiting_times))
+            replications["num_requests"].append(len(waiting_times))
+            replications["control_variate"].append(max(max_rate for _, max_rate in results))
+
+        return {name: np.array(values) for name, values in replications.items()}
+
+    def reuse_rate(self):
+        """
+        :return: fraction of the node simulations served from stored results
+        """
+        lookups = self.nodes_simulated + self.nodes_reused
+        return self.nodes_reused / lookups if lookups > 0 else 0.
+
+
+def test_incremental():
+    """
+    Test that the node queues of the incremental evaluator match Storage.process fed the same requests and random
+    numbers, and that bounding the stored arrivals and results does not change the replications.
+    """
+    from storage import Storage
+    from constants import INITIAL_MOVIE_HASHSET
+
+    evaluator = IncrementalEvaluator(seed=3)
+    signatures = node_signatures(INITIAL_MOVIE_HASHSET)
+    replication = 2
+    np_state = np.random.get_state()
+    for node_idx, storage_id in enumerate(STORAGE_ORDER):
+        waits, _ = evaluator._simulate_node(storage_id, signatures[storage_id], replication)
+
+        # the same requests, in the same order, processed by the storage node of the simulation
+        requests = []
+        for group_id, (times, movies) in evaluator._arrivals(replication).items():
+            for movie_idx, movie_id in enumerate(MOVIE_ORDER):
+                if (group_id, movie_id) in signatures[storage_id]:
+                    requests.extend(Request(group_id, movie_id, storage_id, time_creation) for time_creation in times[movies == movie_idx])
+        np.random.seed([3, replication, len(GROUP_ORDER) + node_idx])
+        processed = [request for request in Storage().process(requests) or [] if request.to_be_processed]
+        assert np.array_equal(waits, np.array([request.get_waiting_time() for request in processed])), storage_id
+    np.random.set_state(np_state)
+
+    hashsets = [
+        INITIAL_MOVIE_HASHSET,
+        {'ASN1': {8, 2, 6, 7}, 'ASN2': {8, 9, 5, 7}, 'MSN': set(range(10))},
+        {'ASN1': {0, 1, 2, 3}, 'ASN2': {4, 5, 6, 7}, 'MSN': set(range(10))},
+    ]
+    unbounded = IncrementalEvaluator(seed=5, max_arrivals=1000, memory_budget=2**40)
+    bounded = IncrementalEvaluator(seed=5, max_arrivals=2, memory_budget=2**16)
+    for movie_hashsets in hashsets + hashsets:
+        expected, result = unbounded.replications(movie_hashsets, 4), bounded.replications(movie_hashsets, 4)
+        assert all(np.array_equal(expected[name], result[name]) for name in expected)
+        assert len(bounded.arrivals) <= 2
+        assert bounded.memory_used <= bounded.memory_budget or len(bounded.node_results) == 1
+    assert bounded.memory_used == sum(waits.nbytes for results in bounded.node_results.values() for waits, _ in results.values())
+
+
+if __name__ == "__main__":
+    test_incremental()
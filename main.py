@@ -3,7 +3,8 @@ import numpy as np
 
 from constants import INITIAL_MOVIE_HASHSET
 from simulation import Simulation
-from stats import Stats, plot_comparison_histogram, plot_baseline_histogram
+from stats import Stats
+from report import save_metrics, report_figures, generate_report
 from optimization import Optimization
 
 # This script runs a simulation of a movie streaming system, optimizes the movie distribution along the storage nodes
@@ -119,39 +120,8 @@ def main(best_hashset=None):
     print(f"Baseline simulation time: {baseline_end_time - overall_start_time:.2f} seconds")
 
 
-    # Plot Baseline-only histograms
-    plot_baseline_histogram(
-        baseline_stats["max"],
-        "1st Baseline Histogram of Maximum Waiting Times",
-        "Maximum Waiting Time (s)"
-    )
-
-    plot_baseline_histogram(
-        baseline_stats["mean"],
-        "1st Baseline Histogram of Mean Waiting Times",
-        "Mean Waiting Time (s)"
-    )
-
-    plot_baseline_histogram(
-        baseline_stats["median"],
-        "1st Baseline Histogram of Median Waiting Times",
-        "Median Waiting Time (s)"
-    )
-
-    plot_baseline_histogram(
-        baseline_stats["var"],
-        "1st Baseline Histogram of Waiting Time Variance",
-        "Variance"
-    )
-
-    plot_baseline_histogram(
-        baseline_stats["above_threshold"],
-        "1st Baseline Histogram of Customers Waiting above Threshold",
-        "Number of Customers"
-    )
-
-
-
+    # Save the baseline metrics, their histograms are rendered by the report stage at the end
+    save_metrics("report_data/baseline.npz", baseline_stats)
 
     # === Run Optimization ===
     # Necessary only once, as the optimization function is not called in the simulation.
@@ -194,47 +164,15 @@ def main(best_hashset=None):
     print(f"\nTotal runtime: {final_time - overall_start_time:.2f} seconds")
     
     # === Comparison Plots ===
-    # Plot histograms comparing the baseline and optimized simulation statistics
-    # When dealing with plotting, if the optimized solution is already known,
-    # be careful to comment out the optimization block and uncomment the best_hashset line just above the current line.
-    # This is to avoid re-running the optimization process unnecessarily. 
-
-    plot_comparison_histogram(
-        baseline_stats["max"],
-        optimized_stats["max"],
-        "Histogram of Maximum Waiting Times",
-        "Maximum Waiting Time (s)"
-    )
-
-    plot_comparison_histogram(
-        baseline_stats["mean"],
-        optimized_stats["mean"],
-        "Histogram of Mean Waiting Times",
-        "Mean Waiting Time (s)"
-    )
-
-    plot_comparison_histogram(
-        baseline_stats["median"],
-        optimized_stats["median"],
-        "Histogram of Median Waiting Times",
-        "Median Waiting Time (s)"
+    # The baseline and comparison histograms are rendered from the saved metrics with the Agg backend in a pool of
+    # workers, without blocking. The figures whose inputs did not change since the last report are skipped, and the
+    # report can be regenerated without simulating with: python report.py
+    save_metrics("report_data/optimized.npz", optimized_stats)
+    generate_report(
+        report_figures("report_data/baseline.npz", "report_data/optimized.npz"),
+        output_dir="Plots",
     )
 
-    plot_comparison_histogram(
-        baseline_stats["var"],
-        optimized_stats["var"],
-        "Histogram of Waiting Time Variance",
-        "Variance"
-    )
-
-    plot_comparison_histogram(
-        baseline_stats["above_threshold"],
-        optimized_stats["above_threshold"],
-        "Histogram of Customers Waiting above Threshold",
-        "Number of Customers"
-    )
-
-
 
 if __name__ == "__main__":
     # This is the best hashset found during the optimization process
@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+import numpy as np
+
+import profiling
+from benchmark import scaled_scenario
+from simulation import Simulation
+from stats import Stats
+from optimization import Optimization
+
+# budgets of the peak memory per simulated request (in bytes)
+MEMORY_BUDGETS = {
+    "simulation": 400,  # a replication holds all its requests
+    "steady_state": 50,  # a streamed run only holds the requests of a chunk and the waiting times
+    "optimization": 1000,  # the replications of a candidate are run one after another
+}
+
+LOAD_SCALES = (1., 2., 4.)
+HORIZONS = (36000, 72000, 144000)
+
+
+def _measure(name, fct):
+    """
+    Peak memory allocated by a function.
+    :param name: name of the profiled phase
+    :param fct: function returning the number of simulated requests
+    :return: number of simulated requests and peak memory (in bytes)
+    """
+    profiling.enable(memory=True)
+    with profiling.phase(name):
+        num_requests = fct()
+    profiling.disable()
+    return num_requests, profiling.peak_memory(name)
+
+
+def _simulation():
+    requests = Simulation().run()
+    Stats(requests).get_waiting_time()
+    return len(requests)
+
+
+def _optimization(log_dir):
+    optimization = Optimization(random_seed=0)
+    optimization.STATS_LOG_PATH = os.path.join(log_dir, "stats.runlog")
+    optimization.HISTORY_LOG_PATH = os.path.join(log_dir, "history.runlog")
+    optimization(optimization_fct_names=["replace_one", "swap_one"], num_optimization_iters=3, num_iters_per_optimization=5, tolerance=5.)
+
+    # the replications are run one after another, so the peak is reached within a single replication
+    counters, timers = profiling.summary()["counters"], profiling.summary()["timers"]
+    return int(counters["simulation.requests"] / timers["simulation.generate"]["calls"])
+
+
+def memory_scaling(load_scales=LOAD_SCALES, horizons=HORIZONS, print_results=True):
+    """
+    Peak memory per simulated request of a replication and of a short optimization at increasing request rates, and of
+    a streamed steady-state run at increasing horizons.
+    :param load_scales: factors applied to the request rates of the groups
+    :param horizons: horizons of the steady-state runs
+    :param print_results: whether to print the measurements
+    :return: list of dictionaries of the scenario, its size, the number of requests, the peak memory and the peak
+             memory per request with its budget
+    """
+    log_dir = tempfile.mkdtemp()
+    runs = [("simulation", scale, _simulation) for scale in load_scales]
+    runs += [("optimization", scale, lambda: _optimization(log_dir)) for scale in load_scales]
+    runs += [("steady_state", horizon, lambda horizon=horizon: len(Simulation().run_steady_state(horizon=horizon))) for horizon in horizons]
+
+    results = []
+    for scenario, size, fct in runs:
+        np.random.seed(0)
+        with scaled_scenario(size if scenario != "steady_state" else 1.):
+            num_requests, peak = _measure(f"scaling.{scenario}", fct)
+        results.append({
+            "scenario": scenario,
+            "size": size,
+            "requests": num_requests,
+            "peak_memory": peak,
+            "bytes_per_request": peak / num_requests,
+            "budget": MEMORY_BUDGETS[scenario],
+        })
+        if print_results:
+            print(f"{scenario:15s} {size:10g} {num_requests:10d} requests, peak {peak / 2**20:8.2f} MB, {peak / num_requests:8.1f} bytes per request (budget {MEMORY_BUDGETS[scenario]})")
+
+    return results
+
+
+def _check_budgets(results):
+    for result in results:
+        assert result["bytes_per_request"] <= result["budget"], f"{result['scenario']} of size {result['size']}: {result['bytes_per_request']:.1f} bytes per request above the budget of {result['budget']}"
+
+
+def test_memory_scaling():
+    """
+    Test that the peak memory per simulated request stays within the budgets at the nominal and double sizes (the full
+    sweep up to the quadruple sizes runs with python memory_scaling.py).
+    """
+    _check_budgets(memory_scaling(load_scales=LOAD_SCALES[:2], horizons=HORIZONS[:2]))
+
+
+if __name__ == "__main__":
+    _check_budgets(memory_scaling())
@@ -0,0 +1,140 @@
+import time
+import numpy as np
+import random
+from multiprocessing import Manager, Pool
+
+from optimization import Optimization
+from evaluation import SharedEvaluationCache
+
+
+def _run_start(seed, optimization_kwargs, store, incumbent, lock, stop_tolerance, min_iterations, print_results):
+    """
+    Run one start of the multi-start optimization, sharing its evaluations and best configuration.
+    :return: summary of the start
+    """
+    np.random.seed(seed)
+    random.seed(seed)
+    optimization = Optimization(print_results=print_results, random_seed=seed)
+    optimization.evaluation_cache = SharedEvaluationCache(store, max_size=optimization.evaluation_cache.max_size)
+    optimization.STATS_LOG_PATH = f"pareto_output/pareto_stats_{seed}.runlog"  # one run log per concurrent start
+    optimization.HISTORY_LOG_PATH = f"optimization_fct_history_{seed}.runlog"
+    stopped_iteration = []
+
+    def callback(state):
+        optimization.evaluation_cache.publish()
+
+        # update the global incumbent
+        with lock:
+            if state["best_metric"] < incumbent["metric"]:
+                incumbent["metric"] = state["best_metric"]
+                incumbent["hashset"] = state["best_hashset"]
+                incumbent["seed"] = seed
+            global_metric = incumbent["metric"]
+
+        # stop the start once its best configuration is clearly behind the global incumbent
+        record = state["best_record"]
+        if state["iteration"] < min_iterations or record is None or incumbent["seed"] == seed:
+            return False
+        stop = state["best_metric"] - record.half_width() > global_metric + stop_tolerance
+        if stop:
+            stopped_iteration.append(state["iteration"])
+        return stop
+
+    start_time = time.time()
+    best_hashset, best_metric = optimization(**dict(optimization_kwargs, use_evaluation_cache=True, callback=callback))
+    return {
+        "seed": seed,
+        "best_hashset": best_hashset,
+        "best_metric": best_metric,
+        "time": time.time() - start_time,
+        "stopped_iteration": stopped_iteration[0] if stopped_iteration else None,
+        "store_hits": optimization.evaluation_cache.store_hits,
+    }
+
+
+def multi_start(seeds, optimization_kwargs, n_workers=1, stop_tolerance=0.5, min_iterations=10, print_results=False):
+    """
+    Multi-start optimization: the starts run concurrently in worker processes and share the statistics of the evaluated
+    hashsets through a common store (see evaluation.SharedEvaluationCache) and the global incumbent. A start is
+    stopped early once the lower 95% CI bound of its best metric exceeds the global incumbent by stop_tolerance.
+    :param seeds: random seed of each start
+    :param optimization_kwargs: parameters of Optimization.__call__ shared by the starts (must be picklable). The worker
+                                processes are daemonic and cannot have their own pool, so the starts run in parallel
+                                only if they evaluate in-process (n_workers of 1, the default). The evaluation cache is
+                                always used and the callback is set by the multi-start
+    :param n_workers: number of worker processes (1 runs the starts one after another in-process, each start being
+                      then free to evaluate its neighbours over its own pool)
+    :param stop_tolerance: margin (in units of the metric) behind the global incumbent at which a start is stopped
+    :param min_iterations: number of iterations before a start can be stopped
+    :param print_results: whether the starts print their results
+    :return: overall best movie hashset, its metric and the summaries of the starts (the run logs of a start are
+             written to pareto_output/pareto_stats_<seed>.runlog and optimization_fct_history_<seed>.runlog)
+    """
+    if "callback" in optimization_kwargs:
+        raise ValueError("The callback of the starts shares their incumbents and cannot be overridden.")
+    if n_workers > 1 and optimization_kwargs.get("n_workers", 1) > 1:
+        raise ValueError("Nested parallelism: the starts run in daemonic worker processes which cannot create a pool, "
+                         "set n_workers to 1 either in optimization_kwargs or for the starts.")
+
+    with Manager() as manager:
+        store = manager.dict()
+        incumbent = manager.dict(metric=np.inf, hashset=None, seed=None)
+        lock = manager.Lock()
+        tasks = [(seed, optimization_kwargs, store, incumbent, lock, stop_tolerance, min_iterations, print_results) for seed in seeds]
+
+        if n_workers <= 1:
+            summaries = [_run_start(*task) for task in tasks]
+        else:
+            with Pool(processes=n_workers) as pool:
+                summaries = pool.starmap(_run_start, tasks)
+
+    idx_best = int(np.argmin([summary["best_metric"] for summary in summaries]))
+    return summaries[idx_best]["best_hashset"], summaries[idx_best]["best_metric"], summaries
+
+
+def test_multistart():
+    """
+    Test that the shared incumbent is the best of the per-start results, that the starts publish their evaluations, that
+    the parallel starts return the best start and that nested parallelism and another callback are rejected.
+    """
+    import os
+    import tempfile
+
+    optimization_kwargs = {
+        "optimization_fct_names": ["replace_one", "swap_one"],
+        "num_optimization_iters": 4,
+        "num_iters_per_optimization": 10,
+        "tolerance": 0.5,
+        "use_mean_rate_constraint": True,
+        "use_evaluation_cache": True,  # set by the starts too
+    }
+
+    working_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())  # run logs of the starts
+    try:
+        with Manager() as manager:
+            store = manager.dict()
+            incumbent = manager.dict(metric=np.inf, hashset=None, seed=None)
+            lock = manager.Lock()
+            summaries = [_run_start(seed, optimization_kwargs, store, incumbent, lock, np.inf, 0, False) for seed in (0, 1)]
+            idx_best = int(np.argmin([summary["best_metric"] for summary in summaries]))
+            assert incumbent["metric"] == summaries[idx_best]["best_metric"]
+            assert incumbent["hashset"] == summaries[idx_best]["best_hashset"]
+            assert len(store) > 0
+
+        best_hashset, best_metric, summaries = multi_start([0, 1], optimization_kwargs, n_workers=2)
+        assert best_metric == min(summary["best_metric"] for summary in summaries)
+
+        for kwargs in ({**optimization_kwargs, "n_workers": 2}, {**optimization_kwargs, "callback": print}):
+            try:
+                multi_start([0, 1], kwargs, n_workers=2)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("Nested parallelism and another callback should be rejected")
+    finally:
+        os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    test_multistart()
@@ -0,0 +1,176 @@
+from functools import lru_cache
+from itertools import combinations
+
+import bitmask
+from utils import feasible_movie_sets
+
+# Neighbour tables of the assignment moves: the capacity-feasible movie subsets of each ASN are enumerated once, and the
+# feasible neighbours of a subset under each move are tabulated on first use, so that a move draws a neighbour uniformly
+# with a single random draw instead of rejection sampling.
+
+
+@lru_cache(maxsize=None)
+def feasible_masks(storage_id):
+    """
+    :param storage_id: storage node
+    :return: tuple of the bitmasks of all the movie subsets fitting in the capacity of the storage node
+    """
+    return tuple(bitmask.to_mask(movie_set) for movie_set in feasible_movie_sets(storage_id))
+
+
+@lru_cache(maxsize=None)
+def maximal_masks(storage_id):
+    """
+    :param storage_id: storage node
+    :return: tuple of the bitmasks of the feasible movie subsets to which no other movie can be added
+    """
+    return tuple(mask for mask in feasible_masks(storage_id)
+                 if not any(bitmask.fits(storage_id, mask | bit) for bit in bitmask.MOVIE_BITS.values() if not mask & bit))
+
+
+def _neighbours(storage_id, mask, num_movies, move):
+    """
+    Feasible neighbours of a movie subset under a move.
+    :param storage_id: storage node
+    :param mask: bitmask of the movie subset
+    :param num_movies: number of movies removed by the move
+    :param move: "remove" (remove the movies), "replace" (remove the movies and add as many other movies as possible, up
+                 to the same number) or "fill" (remove the movies and fill the storage)
+    :return: tuple of the bitmasks of the neighbours
+    """
+    maximal = set(maximal_masks(storage_id)) if move == "fill" else None
+    by_added = {}  # number of added movies -> neighbours
+    for other in feasible_masks(storage_id):
+        if bitmask.popcount(mask & ~other) != num_movies:
+            continue
+        added = bitmask.popcount(other & ~mask)
+        if move == "remove" and added == 0 or move == "replace" and 1 <= added <= num_movies or move == "fill" and other in maximal:
+            by_added.setdefault(added, []).append(other)
+
+    if move == "replace" and len(by_added) > 0:
+        return tuple(by_added[max(by_added)])  # replace as many movies as possible
+    return tuple(other for neighbours in by_added.values() for other in neighbours)
+
+
+@lru_cache(maxsize=None)
+def _neighbour_table(storage_id, num_movies, move):
+    """
+    :return: dict of the neighbours of every feasible movie subset of the storage node (see _neighbours)
+    """
+    return {mask: _neighbours(storage_id, mask, num_movies, move) for mask in feasible_masks(storage_id)}
+
+
+def neighbours(storage_id, mask, num_movies, move):
+    """
+    Tabulated feasible neighbours of a movie subset under a move (see _neighbours).
+    :param storage_id: storage node
+    :param mask: bitmask of the movie subset
+    :param num_movies: number of movies removed by the move
+    :param move: "remove", "replace" or "fill"
+    :return: tuple of the bitmasks of the neighbours (empty if the move is not possible)
+    """
+    table = _neighbour_table(storage_id, num_movies, move)
+    return table[mask] if mask in table else _neighbours(storage_id, mask, num_movies, move)
+
+
+@lru_cache(maxsize=65536)
+def swap_neighbours(mask_asn1, mask_asn2, num_movies):
+    """
+    Feasible swaps of movies between ASN1 and ASN2: num_movies movies of each ASN are moved to the other one, and the
+    swap is valid if both ASN keep their capacity and number of movies.
+    :param mask_asn1: bitmask of the movies of ASN1
+    :param mask_asn2: bitmask of the movies of ASN2
+    :param num_movies: number of movies swapped from each ASN
+    :return: tuple of (ASN1 bitmask, ASN2 bitmask) of the valid swaps
+    """
+    valid = []
+    for swapped_asn1 in combinations(bitmask.movie_ids(mask_asn1), num_movies):
+        for swapped_asn2 in combinations(bitmask.movie_ids(mask_asn2), num_movies):
+            swap_asn1, swap_asn2 = bitmask.to_mask(swapped_asn1), bitmask.to_mask(swapped_asn2)
+            next_asn1 = (mask_asn1 & ~swap_asn1) | swap_asn2
+            next_asn2 = (mask_asn2 | swap_asn1) & ~swap_asn2
+            if not (bitmask.fits("ASN1", next_asn1) and bitmask.fits("ASN2", next_asn2)):
+                continue
+            if bitmask.popcount(next_asn1) < bitmask.popcount(mask_asn1) or bitmask.popcount(next_asn2) < bitmask.popcount(mask_asn2):
+                continue
+            valid.append((next_asn1, next_asn2))
+    return tuple(valid)
+
+
+def test_neighbourhood():
+    """
+    Test that the neighbour tables equal the neighbourhoods of the set-based moves, enumerated with movie sets and the
+    movie sizes for every feasible movie set of the ASN, and for swaps between disjoint and overlapping pairs of sets.
+    """
+    from collections import Counter
+    import numpy as np
+    from constants import MOVIES_IDS, MOVIE_SIZES, STORAGE_SIZES
+
+    def fits(storage_id, movie_set):
+        return sum(MOVIE_SIZES[movie_id] for movie_id in movie_set) <= STORAGE_SIZES[storage_id]
+
+    def is_maximal(storage_id, movie_set):
+        return not any(fits(storage_id, movie_set | {movie_id}) for movie_id in MOVIES_IDS - movie_set)
+
+    def set_neighbours(storage_id, movie_set, num_movies, move):
+        # remove num_movies movies, then add other movies according to the move
+        by_added = {}
+        for removed in combinations(sorted(movie_set), num_movies):
+            kept = movie_set - set(removed)
+            others = sorted(MOVIES_IDS - movie_set)
+            for num_added in range(len(others) + 1):
+                for added in combinations(others, num_added):
+                    neighbour = kept | set(added)
+                    if not fits(storage_id, neighbour):
+                        continue
+                    if move == "remove" and num_added == 0 or move == "replace" and 1 <= num_added <= num_movies \
+                            or move == "fill" and is_maximal(storage_id, neighbour):
+                        by_added.setdefault(num_added, set()).add(frozenset(neighbour))
+        if move == "replace" and len(by_added) > 0:
+            return by_added[max(by_added)]
+        return set().union(*by_added.values())
+
+    storage_id = "ASN1"
+    for movie_set in feasible_movie_sets(storage_id):
+        mask = bitmask.to_mask(movie_set)
+        for num_movies in (1, 2, 3):
+            for move in ("remove", "replace", "fill"):
+                table = {frozenset(bitmask.to_set(other)) for other in neighbours(storage_id, mask, num_movies, move)}
+                assert table == set_neighbours(storage_id, movie_set, num_movies, move), (movie_set, num_movies, move)
+
+    def set_swaps(asn1, asn2, num_movies):
+        # swaps of the set-based move: the movies drawn in ASN1 move to ASN2, then the movies drawn in ASN2 move to ASN1
+        swaps = []
+        for swapped_asn1 in combinations(sorted(asn1), num_movies):
+            for swapped_asn2 in combinations(sorted(asn2), num_movies):
+                next_asn1, next_asn2 = set(asn1), set(asn2)
+                for movie_id in swapped_asn1:
+                    next_asn1.remove(movie_id)
+                    next_asn2.add(movie_id)
+                for movie_id in swapped_asn2:
+                    next_asn2.remove(movie_id)
+                    next_asn1.add(movie_id)
+                if fits("ASN1", next_asn1) and fits("ASN2", next_asn2) and len(next_asn1) >= len(asn1) and len(next_asn2) >= len(asn2):
+                    swaps.append((frozenset(next_asn1), frozenset(next_asn2)))
+        return swaps
+
+    # a disjoint pair, then random pairs sharing movies
+    rng = np.random.default_rng(0)
+    sets_asn1, sets_asn2 = list(feasible_movie_sets("ASN1")), list(feasible_movie_sets("ASN2"))
+    pairs = [({2, 3, 9}, {0, 1, 4})]
+    while len(pairs) < 6:
+        asn1, asn2 = set(sets_asn1[rng.integers(len(sets_asn1))]), set(sets_asn2[rng.integers(len(sets_asn2))])
+        if asn1 & asn2:
+            pairs.append((asn1, asn2))
+    for asn1, asn2 in pairs:
+        for num_movies in (1, 2):
+            swaps = set_swaps(asn1, asn2, num_movies)
+            table = [(frozenset(bitmask.to_set(mask_asn1)), frozenset(bitmask.to_set(mask_asn2)))
+                     for mask_asn1, mask_asn2 in swap_neighbours(bitmask.to_mask(asn1), bitmask.to_mask(asn2), num_movies)]
+            assert Counter(table) == Counter(swaps), (asn1, asn2, num_movies)
+            if asn1.isdisjoint(asn2):
+                assert len(swaps) > 0
+
+
+if __name__ == "__main__":
+    test_neighbourhood()
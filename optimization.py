@@ -1,25 +1,54 @@
 import numpy as np
 import copy
+import time
 from typing import Dict, Set
 
-import pandas as pd
-
 from simulation import Simulation
 from stats import Stats
 from constants import STORAGE_IDS, STORAGE_SIZES, MOVIES_IDS, MOVIE_SIZES, STORAGE_HANDLE_TIME_BETA, TIME_INTERVALS
-from utils import compute_mean_request_rate
-
-import os
+from utils import mean_request_rate_array, mean_request_rate_hit_rate, observed_max_request_rate, feasible_movie_sets, canonical_hashset, storage_used
+from evaluation import EvaluationCache, EvaluationRecord, simulate_replications, evaluate_batch, evaluate_objectives, backend_replications, concatenate_replications, qualified_name
+from pareto import ParetoArchive, non_dominated_sort, crowding_distance
+import bitmask
+import neighbourhood
+from incremental import IncrementalEvaluator
+from runlog import RunLog, STATS_SCHEMA, HISTORY_SCHEMA, new_run_id
+from telemetry import Telemetry
+from checkpoint import save_checkpoint, load_checkpoint, get_random_states, set_random_states
+from selection import RankingAndSelection
+from search import SearchState, Candidate, search_strategy
+import surrogate
+import profiling
+
+from collections import deque
+from statistics import NormalDist
+from multiprocessing import Pool
 
 class Optimization():
 
-    def __init__(self, print_results=False, random_seed=42):
+    # run logs of the replications of the candidates and of the history of the optimization functions
+    STATS_LOG_PATH = "pareto_output/pareto_stats.runlog"
+    HISTORY_LOG_PATH = "optimization_fct_history.runlog"
+
+    # number of replications of a single candidate per task sent to the backend
+    BACKEND_REPLICATIONS_PER_TASK = 5
+
+    def __init__(self, print_results=False, random_seed=42, cache_size=1024, backend=None):
         """
         :param print_results: whether to print the results
         :param random_seed: random seed for reproducibility
+        :param cache_size: maximal number of movie hashsets kept in the evaluation cache
+        :param backend: backend evaluating the hashsets, e.g. on remote workers (optional, see backend.py): the batches
+                        of hashsets, and in single candidate iterations the replications of the candidate, split into
+                        tasks of BACKEND_REPLICATIONS_PER_TASK replications. By default the evaluations run in-process
+                        or over a pool of n_workers processes
         """
         self.print_results = print_results
         self.rng = np.random.default_rng(random_seed)
+        self.evaluation_cache = EvaluationCache(max_size=cache_size)
+        self.pool = None  # pool of worker processes for parallel evaluations
+        self.pool_size = 0
+        self.backend = backend
 
     def __call__(
         self, 
@@ -33,7 +62,25 @@ class Optimization():
         save_optimization_fct_history=False,
         choose_optimization_fct_randomly=False,
         decreasing_tolerance=False,
-        min_n_simulation_control_variate=5
+        min_n_simulation_control_variate=5,
+        use_evaluation_cache=False,
+        selection_method=None,
+        batch_size=1,
+        n_workers=1,
+        screening_fraction=None,
+        strategy="vns",
+        initial_temperature=1.0,
+        cooling_rate=0.95,
+        tabu_tenure=20,
+        incremental_evaluation=False,
+        racing_batch_size=None,
+        racing_confidence=0.95,
+        telemetry_path=None,
+        telemetry_callback=None,
+        callback=None,
+        checkpoint_path=None,
+        checkpoint_every=10,
+        checkpoint_state=None
     ):
         """
         Optimize the storage configuration based on the requests and storage.
@@ -50,171 +97,1017 @@ class Optimization():
         :param decreasing_tolerance: automatically decrease the tolerance linearly from 1 to tolerance over
                                         the iterations.
         :param min_n_simulation_control_variate: minimum number of simulations to use the control variate method
+        :param use_evaluation_cache: whether to cache the replications of evaluated hashsets and top them up on revisits
+                                        instead of starting over
+        :param selection_method: ranking and selection method ("ocba" or "halving") allocating the simulations of an
+                                        iteration between the incumbent and the candidate instead of only simulating the
+                                        candidate (by default None)
+        :param batch_size: number of distinct neighbours of the incumbent generated by the optimization function and
+                                        evaluated concurrently at each iteration (by default a single candidate)
+        :param n_workers: number of worker processes evaluating the neighbours in batch mode (metric_fct must then be
+                                        picklable)
+        :param screening_fraction: in batch mode, fraction of the neighbours with the lowest surrogate mean waiting
+                                        time (see surrogate.py) which are simulated (by default all neighbours)
+        :param strategy: search strategy moving the current configuration, "vns" (accept if better), "annealing"
+                                        (simulated annealing with a noise-aware Metropolis rule) or "tabu" (tabu search
+                                        over the canonical hashsets, best combined with batch_size > 1), see search.py
+        :param initial_temperature: initial temperature of the simulated annealing (in units of the metric)
+        :param cooling_rate: geometric cooling rate of the simulated annealing temperature per iteration
+        :param tabu_tenure: number of recently visited hashsets which are tabu
+        :param incremental_evaluation: whether to simulate the candidates under arrival streams shared over the run,
+                                        re-simulating only the storage nodes whose incoming requests changed (see
+                                        incremental.py), instead of independent replications (single candidate
+                                        iterations without ranking and selection)
+        :param racing_batch_size: if given, the replications of a candidate are run in batches of this size and the
+                                        candidate is rejected as soon as it is worse than the current configuration with
+                                        racing_confidence (one-sided Welch bound), instead of running all of them
+        :param racing_confidence: confidence level of the early rejection of the racing mode
+        :param telemetry_path: path of a JSON-lines file receiving a record per iteration (operator, outcome,
+                                        replications and simulated requests per second, CI half-width versus tolerance,
+                                        constraint skips and cache hit rates, see telemetry.py) (optional)
+        :param telemetry_callback: function called with each telemetry record (optional, not saved in the checkpoints)
+        :param callback: function called after each iteration with a dictionary of the state of the optimization
+                                        (iteration, best and current metric, hashset and record), returning True to stop
+                                        the optimization (optional, not saved in the checkpoints)
+        :param checkpoint_path: path of the checkpoint file written every checkpoint_every iterations with the full state
+                                        of the optimization, and at the end of the run marked complete (optional, see
+                                        resume), metric_fct must then be a module-level function
+        :param checkpoint_every: number of iterations between two checkpoints
+        :param checkpoint_state: checkpoint loaded to continue the run from (see resume)
         :return: best movie hashset and its corresponding best metric
         """
+        call_kwargs = {name: value for name, value in locals().items() if name not in ("self", "checkpoint_state", "callback", "telemetry_callback")}
+        search = search_strategy(strategy, self.rng, initial_temperature, cooling_rate)
+        if incremental_evaluation and self.backend is not None:
+            raise ValueError("The incremental evaluation shares its arrival streams in-process and cannot run on a backend.")
+        if checkpoint_path is not None and qualified_name(metric_fct) is None:
+            raise ValueError("The metric function of a checkpointed optimization must be a module-level function to be pickled.")
+
         # Simulation class
         simulation = Simulation()
 
-        best_metric = np.inf
-        best_metric_mse_bootstrap = np.inf
-        best_hashset = None
-        fct_count = 0
-        constraint_approved = None
+        if checkpoint_state is None:
+            state = SearchState(
+                tabu_list=deque(maxlen=tabu_tenure),
+                incremental_seed=int(self.rng.integers(2**31)) if incremental_evaluation else None,
+                run_id=new_run_id(),
+            )
+        else:
+            state = checkpoint_state["state"]
+            self.evaluation_cache = checkpoint_state["evaluation_cache"]
+            set_random_states(self.rng, checkpoint_state["random_states"])
+        start_iteration = state.iteration
+
+        incremental_evaluator = IncrementalEvaluator(metric_fct=metric_fct, seed=state.incremental_seed) if incremental_evaluation else None
+
+        # append-only run logs, the records written after the checkpoint being dropped on resume
+        stats_log = RunLog(self.STATS_LOG_PATH, STATS_SCHEMA, run_id=state.run_id)
+        history_log = RunLog(self.HISTORY_LOG_PATH, HISTORY_SCHEMA, run_id=state.run_id) if save_optimization_fct_history else None
+        telemetry = Telemetry(telemetry_path, telemetry_callback) if telemetry_path is not None or telemetry_callback is not None else None
+        for log, log_size in ((stats_log, state.stats_log_size), (history_log, state.history_log_size), (telemetry, state.telemetry_size)):
+            if log is not None and log_size is not None:
+                log.truncate(log_size)
+
+        num_iterations_run = num_optimization_iters
+        for i in range(start_iteration, num_optimization_iters):
+            state.iteration = i
+            if callback is not None and i > start_iteration and self._callback(callback, state):
+                if self.print_results:
+                    print(f"Optimization stopped by the callback after {i} iterations.")
+                num_iterations_run = i
+                break
+
+            # checkpoint the full state of the optimization after every checkpoint_every iterations
+            if checkpoint_path is not None and i > start_iteration and i % checkpoint_every == 0:
+                self._checkpoint(checkpoint_path, call_kwargs, state, [stats_log, history_log, telemetry])
 
-        candidate_stats = []
-        pareto_stats = []
-        os.makedirs("pareto_output", exist_ok=True)
-        for i in range(num_optimization_iters):
             if self.print_results:
-                print(f"\nIteration {i + 1}/{num_optimization_iters} using function {optimization_fct_names[fct_count]}")
+                print(f"\nIteration {i + 1}/{num_optimization_iters} using function {optimization_fct_names[state.fct_count]}")
+            profiling.count("optimization.iterations")
+            iteration_start = time.perf_counter()
 
             # Randomly choose the optimization function
             if choose_optimization_fct_randomly:
-                fct_count = self.rng.integers(0, len(optimization_fct_names))
+                state.fct_count = self.rng.integers(0, len(optimization_fct_names))
+            fct_name = optimization_fct_names[state.fct_count]
 
-            # Call optimization function
-            optimization_fct = getattr(self, optimization_fct_names[fct_count])
-            movie_hashsets = optimization_fct(best_hashset=best_hashset)
+            # propose and evaluate a candidate, the best of a batch of neighbours once the current configuration is known
+            optimization_fct = getattr(self, fct_name)
+            iter_tolerance = np.linspace(1, tolerance, num_optimization_iters)[i] if decreasing_tolerance else tolerance
+            if batch_size > 1 and state.current_record is not None:
+                candidate = self._evaluate_batch_candidate(
+                    search,
+                    optimization_fct,
+                    state,
+                    simulation,
+                    stats_log,
+                    tolerance=iter_tolerance,
+                    num_iters_per_optimization=num_iters_per_optimization,
+                    metric_fct=metric_fct,
+                    use_mean_rate_constraint=use_mean_rate_constraint,
+                    use_control_variate=use_control_variate,
+                    use_evaluation_cache=use_evaluation_cache,
+                    selection_method=selection_method,
+                    batch_size=batch_size,
+                    n_workers=n_workers,
+                    screening_fraction=screening_fraction,
+                )
+            else:
+                candidate = self._evaluate_candidate(
+                    search,
+                    optimization_fct,
+                    state,
+                    simulation,
+                    stats_log,
+                    tolerance=iter_tolerance,
+                    num_iters_per_optimization=num_iters_per_optimization,
+                    metric_fct=metric_fct,
+                    use_mean_rate_constraint=use_mean_rate_constraint,
+                    use_control_variate=use_control_variate,
+                    min_n_simulation_control_variate=min_n_simulation_control_variate,
+                    use_evaluation_cache=use_evaluation_cache,
+                    selection_method=selection_method,
+                    incremental_evaluator=incremental_evaluator,
+                    racing_batch_size=racing_batch_size,
+                    racing_confidence=racing_confidence,
+                )
+            if candidate.skipped is not None:
+                if telemetry is not None:
+                    telemetry.emit(iteration=i, operator=fct_name, outcome=candidate.skipped, constraint_skips=state.constraint_skips)
+                state.next_move(len(optimization_fct_names))
+                continue
 
-            # Compute mean request rate per node and interval for constraints
-            if use_control_variate or use_mean_rate_constraint:
-                mean_request_rate = compute_mean_request_rate(movies_hashsets=movie_hashsets)
-                mu_CV = np.max(np.array([mean_request_rate[storage_id] for storage_id in STORAGE_IDS]).flatten())
-
-                constraint_approved = self.CONSTRAINT_mean_request_rate(mean_request_rate)
-                if use_mean_rate_constraint and not constraint_approved:
-                    if self.print_results:
-                        print(f"Request rate greater than handling rate. Skipping...")
-                        
-                    # Variable Neighbourhood Structure (VNS): update the function to optimize
-                    fct_count += 1
-                    if fct_count >= len(optimization_fct_names):
-                        fct_count = 0
-                    continue
+            # move the current configuration according to the search strategy
+            accepted = search.accept(candidate, state)
+            if accepted:
+                search.move(candidate, state)
+            if search.improves_best(candidate, accepted, state):
+                self._update_best(state, candidate, stats_log, history_log, fct_name, num_iters_per_optimization)
+
+            if telemetry is not None:
+                duration = time.perf_counter() - iteration_start
+                telemetry.emit(
+                    iteration=i,
+                    operator=fct_name,
+                    outcome="accepted" if accepted else ("raced_out" if candidate.rejected else "rejected"),
+                    improved=bool(candidate.improved),
+                    simulations=candidate.num_simulations,
+                    requests=candidate.num_requests,
+                    duration=duration,
+                    simulations_per_second=candidate.num_simulations / duration,
+                    requests_per_second=candidate.num_requests / duration if candidate.num_requests is not None else None,
+                    candidate_metric=candidate.metric,
+                    current_metric=state.current_metric,
+                    best_metric=state.best_metric,
+                    half_width=candidate.record.half_width(),
+                    tolerance=iter_tolerance,
+                    constraint_skips=state.constraint_skips,
+                    evaluation_cache_hit_rate=self.evaluation_cache.hit_rate() if use_evaluation_cache else None,
+                    incremental_reuse_rate=incremental_evaluator.reuse_rate() if incremental_evaluator is not None else None,
+                    rate_model_hit_rate=mean_request_rate_hit_rate(),
+                )
+
+            if not candidate.improved:
+                state.next_move(len(optimization_fct_names))
+
+        else:
+            if callback is not None:
+                state.iteration = num_optimization_iters
+                self._callback(callback, state)
+
+        # the last checkpoint is marked complete, resuming it returns the result instead of rerunning over the run logs
+        if checkpoint_path is not None:
+            state.iteration = num_iterations_run
+            self._checkpoint(checkpoint_path, call_kwargs, state, [stats_log, history_log, telemetry], complete=True)
+
+        stats_log.close()
+        if history_log is not None:
+            history_log.close()
+        if telemetry is not None:
+            telemetry.close()
+
+        if self.print_results and incremental_evaluator is not None:
+            print(f"Incremental evaluation: {incremental_evaluator.nodes_simulated} node simulations, {incremental_evaluator.nodes_reused} reused ({100*incremental_evaluator.reuse_rate():.1f}% reuse rate)")
+
+        if self.print_results and use_evaluation_cache:
+            print(f"Evaluation cache: {self.evaluation_cache.hits} hits, {self.evaluation_cache.misses} misses ({100*self.evaluation_cache.hit_rate():.1f}% hit rate)")
+
+        self.close()
+
+        return state.best_hashset, state.best_metric
+
+    def _callback(self, callback, state):
+        """
+        Call the iteration callback of __call__ with the state of the optimization.
+        :return: True if the callback requests to stop the optimization
+        """
+        return bool(callback({
+            "iteration": state.iteration,
+            "best_metric": state.best_metric,
+            "best_hashset": state.best_hashset,
+            "best_record": state.best_record,
+            "current_metric": state.current_metric,
+            "current_hashset": state.current_hashset,
+            "current_record": state.current_record,
+        }))
+
+    @profiling.timed("optimization.checkpoint")
+    def _checkpoint(self, checkpoint_path, call_kwargs, state, logs, complete=False):
+        """
+        Save the full state of the optimization, with the paths of its run logs, and flush the run logs.
+        :param checkpoint_path: path of the checkpoint file
+        :param call_kwargs: parameters of the optimization run
+        :param state: SearchState of the optimization, the sizes of its run logs being updated
+        :param logs: statistics run log, history run log and telemetry of the optimization (None for disabled logs)
+        :param complete: whether the run is finished
+        """
+        for log in logs:
+            if log is not None:
+                log.flush()
+
+        stats_log, history_log, telemetry = logs
+        state.stats_log_size = stats_log.num_records()
+        state.history_log_size = history_log.num_records() if history_log is not None else None
+        state.telemetry_size = telemetry.size() if telemetry is not None else None
+        save_checkpoint(checkpoint_path, {
+            "kwargs": call_kwargs,
+            "state": state,
+            "evaluation_cache": self.evaluation_cache,
+            "random_states": get_random_states(self.rng),
+            "print_results": self.print_results,
+            "log_paths": (self.STATS_LOG_PATH, self.HISTORY_LOG_PATH),
+            "complete": complete,
+        })
+
+    def resume(self, checkpoint_path):
+        """
+        Continue an optimization from a checkpoint (see the checkpoint_path parameter of __call__). The run continues
+        bit-identically to an uninterrupted run: the parameters, the SearchState, the evaluation cache and the states of
+        all the random generators are restored, the run logs of the checkpointed run are reopened and the checkpoints
+        keep being written to the same path. A finished run is not rerun, its result is returned.
+        :param checkpoint_path: path of the checkpoint file
+        :return: best movie hashset and its corresponding best metric
+        """
+        checkpoint = load_checkpoint(checkpoint_path)
+        self.print_results = checkpoint["print_results"]
+        self.STATS_LOG_PATH, self.HISTORY_LOG_PATH = checkpoint["log_paths"]
+        if checkpoint["complete"]:
+            return checkpoint["state"].best_hashset, checkpoint["state"].best_metric
+        kwargs = dict(checkpoint["kwargs"], checkpoint_path=checkpoint_path)
+        return self(**kwargs, checkpoint_state=checkpoint)
+
+    def _evaluate_candidate(
+        self,
+        search,
+        optimization_fct,
+        state,
+        simulation,
+        stats_log,
+        tolerance,
+        num_iters_per_optimization,
+        metric_fct=np.mean,
+        use_mean_rate_constraint=False,
+        use_control_variate=False,
+        min_n_simulation_control_variate=5,
+        use_evaluation_cache=False,
+        selection_method=None,
+        incremental_evaluator=None,
+        racing_batch_size=None,
+        racing_confidence=0.95,
+    ):
+        """
+        Evaluate the candidate proposed by the search strategy, simulating it alone (Monte-Carlo or control variate
+        estimate) or against the current configuration with ranking and selection, and log its replications.
+        :param search: SearchStrategy proposing the candidate
+        :param optimization_fct: optimization function generating a neighbour of the current configuration
+        :param state: SearchState, the estimate of the current configuration being refined by ranking and selection
+        :param simulation: Simulation instance of the bootstrap
+        :param stats_log: RunLog of the statistics
+        :param tolerance: tolerance of the iteration
+        :param num_iters_per_optimization: maximal number of simulations of the candidate
+        :param metric_fct: function to calculate the metric (e.g. mean, median)
+        :param use_mean_rate_constraint: whether to skip the candidates violating the mean rate constraint
+        :param use_control_variate: whether to use the control variate method
+        :param min_n_simulation_control_variate: minimum number of simulations to use the control variate method
+        :param use_evaluation_cache: whether to top up the cached replications of the candidate
+        :param selection_method: ranking and selection method ("ocba" or "halving") (optional)
+        :param incremental_evaluator: IncrementalEvaluator running the replications (optional)
+        :param racing_batch_size: number of replications between two racing checks (optional)
+        :param racing_confidence: confidence level of the early rejection of the racing
+        :return: evaluated Candidate
+        """
+        with profiling.phase("optimization.neighbour"):
+            movie_hashsets = search.propose(optimization_fct, state, self._sample_neighbours)
+
+        # Compute mean request rate per node and interval for constraints
+        mu_CV = None
+        if use_control_variate or use_mean_rate_constraint:
+            with profiling.phase("optimization.constraint"):
+                mean_request_rate = mean_request_rate_array(movies_hashsets=movie_hashsets)
+                mu_CV = mean_request_rate.max()
+                state.constraint_approved = self.CONSTRAINT_mean_request_rate(mean_request_rate)
+
+            if use_mean_rate_constraint and not state.constraint_approved:
+                if self.print_results:
+                    print(f"Request rate greater than handling rate. Skipping...")
+                profiling.count("optimization.constraint_skips")
+                state.constraint_skips += 1
+                return Candidate(hashset=movie_hashsets, skipped="constraint_skip")
+
+        # Compute bootstrap estimate of the MSE (reused from the cache on revisits)
+        record = self.evaluation_cache.get(movie_hashsets, metric_fct) if use_evaluation_cache else EvaluationRecord()
+        if record.mse_bootstrap is None:
+            record.mse_bootstrap = self._bootstrap_mse(simulation, movie_hashsets, metric_fct, tolerance)
+        n_simulations = int(np.ceil(record.mse_bootstrap*(1.96/tolerance)**2))
+        candidate = Candidate(
+            hashset=movie_hashsets,
+            record=record,
+            mu_CV=mu_CV if use_control_variate else None,
+            mse_bootstrap=record.mse_bootstrap,
+            budget=min(num_iters_per_optimization, n_simulations),
+        )
+
+        if selection_method is None or state.current_record is None or record is state.current_record:
+            # generate MC or CV estimate, only topping up the replications already accumulated for the hashset
+            num_simulations = max(candidate.budget - record.count, 0)
+            if incremental_evaluator is not None:
+                replicate_fct = lambda n, start: incremental_evaluator.replications(movie_hashsets, n, start=start)
+            elif self.backend is not None:
+                replicate_fct = lambda n, start: backend_replications(
+                    movie_hashsets, n, self.backend, metric_fct=metric_fct, seed=int(self.rng.integers(2**31)),
+                    replications_per_task=self.BACKEND_REPLICATIONS_PER_TASK,
+                )
+            else:
+                replicate_fct = lambda n, start: simulate_replications(movie_hashsets, n, metric_fct=metric_fct, simulation=simulation)
+
+            with profiling.capture("candidate_evaluation"), profiling.phase("optimization.replications"):
+                if racing_batch_size is not None and state.current_record is not None and record is not state.current_record:
+                    replications, candidate.rejected = self._race(replicate_fct, record, num_simulations, state.current_record, state.current_metric, racing_batch_size, racing_confidence)
+                    if self.print_results and candidate.rejected:
+                        print(f"Candidate rejected after {len(replications['metric'])}/{num_simulations} simulations.")
+                    num_simulations = len(replications["metric"])
+                else:
+                    replications = replicate_fct(num_simulations, record.count)
+                    record.update(replications["metric"], replications["control_variate"])
+            profiling.count("optimization.simulations", num_simulations)
+            candidate.num_simulations, candidate.num_requests = num_simulations, int(np.sum(replications["num_requests"]))
+            candidate.replications = replications
+            self._log_replications(stats_log, state.iteration, replications)
+
+            candidate.metric = record.mean() if (not use_control_variate) or n_simulations <= min_n_simulation_control_variate else record.control_variate_estimate(mu_CV)
+            candidate.improved = candidate.metric < state.current_metric and not candidate.rejected
+        else:
+            # ranking and selection between the current configuration and the candidate, refining the current estimate
+            count_before = state.current_record.count + record.count
+            mus_CV = [state.current_mu_CV, mu_CV] if use_control_variate else None
+            idx_selected, _, pcs = self.select(
+                [state.current_hashset, movie_hashsets],
+                budget=candidate.budget,
+                method=selection_method,
+                metric_fct=metric_fct,
+                records=[state.current_record, record],
+                mus_CV=mus_CV,
+                keep_replications=True,
+            )
+            state.current_metric = state.current_record.control_variate_estimate(state.current_mu_CV) if use_control_variate else state.current_record.mean()
+            if state.current_hashset is state.best_hashset:
+                state.best_metric = state.current_metric
+            candidate.metric = record.control_variate_estimate(mu_CV) if use_control_variate else record.mean()
+            candidate.improved = idx_selected == 1
+            candidate.num_simulations = state.current_record.count + record.count - count_before
+            candidate.replications = record.pop_replications()
+            replications = concatenate_replications([candidate.replications, state.current_record.pop_replications()])
+            self._log_replications(stats_log, state.iteration, replications)
+            if replications is not None:
+                candidate.num_requests = int(np.sum(replications["num_requests"]))
+
+            if self.print_results:
+                print(f"Candidate {candidate.metric:.2f} ({record.count} simulations) vs incumbent {state.current_metric:.2f} ({state.current_record.count} simulations), probability of correct selection {pcs:.3f}.")
+
+        return candidate
+
+    def _evaluate_batch_candidate(
+        self,
+        search,
+        optimization_fct,
+        state,
+        simulation,
+        stats_log,
+        tolerance,
+        num_iters_per_optimization,
+        metric_fct=np.mean,
+        use_mean_rate_constraint=False,
+        use_control_variate=False,
+        use_evaluation_cache=False,
+        selection_method=None,
+        batch_size=2,
+        n_workers=1,
+        screening_fraction=None,
+    ):
+        """
+        Evaluate a batch of distinct neighbours of the current configuration concurrently (see _evaluate_neighbourhood)
+        and return the best one as the candidate, the number of simulations being estimated from the bootstrap of the
+        current configuration. The replications of every evaluated hashset are logged.
+        :param search: SearchStrategy excluding neighbours
+        :param optimization_fct: optimization function generating a neighbour of the current configuration
+        :param state: SearchState, the estimate of the current configuration being refined by ranking and selection
+        :param simulation: Simulation instance of the bootstrap
+        :param stats_log: RunLog of the statistics
+        :param tolerance: tolerance of the iteration
+        :param num_iters_per_optimization: maximal number of simulations per neighbour
+        :param metric_fct: function to calculate the metric (e.g. mean, median)
+        :param use_mean_rate_constraint: whether to discard the neighbours violating the mean rate constraint
+        :param use_control_variate: whether to use the control variate method
+        :param use_evaluation_cache: whether to top up the cached replications of the neighbours
+        :param selection_method: ranking and selection method ("ocba" or "halving") (optional)
+        :param batch_size: number of distinct neighbours
+        :param n_workers: number of worker processes
+        :param screening_fraction: fraction of the neighbours simulated after the surrogate screening (optional)
+        :return: evaluated Candidate, skipped if no neighbour is feasible
+        """
+        n_simulations = int(np.ceil(state.current_mse_bootstrap*(1.96/tolerance)**2))
+        budget = min(num_iters_per_optimization, n_simulations)
+        movie_hashsets, record, mu_CV, metric, state.current_metric, improved, num_simulations, evaluated_records = self._evaluate_neighbourhood(
+            optimization_fct,
+            best_hashset=state.current_hashset,
+            best_record=state.current_record,
+            best_mu_CV=state.current_mu_CV,
+            best_metric=state.current_metric,
+            batch_size=batch_size,
+            num_simulations=budget,
+            metric_fct=metric_fct,
+            use_mean_rate_constraint=use_mean_rate_constraint,
+            use_control_variate=use_control_variate,
+            use_evaluation_cache=use_evaluation_cache,
+            selection_method=selection_method,
+            n_workers=n_workers,
+            screening_fraction=screening_fraction,
+            excluded=search.excluded(state),
+        )
+        if state.current_hashset is state.best_hashset:
+            state.best_metric = state.current_metric
+
+        # log the replications of every evaluated hashset, the best neighbour's ones being kept for its record
+        candidate = Candidate(
+            hashset=movie_hashsets,
+            record=record,
+            mu_CV=mu_CV if use_control_variate else None,
+            metric=metric,
+            improved=improved,
+            replications=record.replications if record is not None else None,
+            num_simulations=num_simulations,
+            budget=budget,
+        )
+        replications = concatenate_replications([evaluated.pop_replications() for evaluated in evaluated_records])
+        self._log_replications(stats_log, state.iteration, replications)
+        if replications is not None:
+            candidate.num_requests = int(np.sum(replications["num_requests"]))
+        if movie_hashsets is None:
+            if self.print_results:
+                print(f"No feasible neighbour. Skipping...")
+            candidate.skipped = "no_neighbour"
+            return candidate
 
-            # Compute bootstrap estimate of the MSE
+        # bootstrap estimate of the MSE of the best neighbour itself (reused from the cache on revisits)
+        if record.mse_bootstrap is None:
+            record.mse_bootstrap = self._bootstrap_mse(simulation, movie_hashsets, metric_fct, tolerance)
+        candidate.mse_bootstrap = record.mse_bootstrap
+        return candidate
+
+    def _update_best(self, state, candidate, stats_log, history_log, fct_name, num_iters_per_optimization):
+        """
+        Make a candidate the best configuration and log it.
+        :param state: SearchState
+        :param candidate: evaluated Candidate
+        :param stats_log: RunLog of the statistics, receiving the best replication of the candidate
+        :param history_log: RunLog of the optimization function history (None if disabled)
+        :param fct_name: name of the optimization function of the iteration
+        :param num_iters_per_optimization: maximal number of simulations of a candidate
+        """
+        state.best_metric = candidate.metric
+        state.best_metric_mse_bootstrap = candidate.mse_bootstrap
+        state.best_hashset = candidate.hashset
+        state.best_record = candidate.record
+        state.best_mu_CV = candidate.mu_CV
+
+        replications = candidate.replications
+        if replications is not None and len(replications["metric"]) > 0:
+            idx_best = np.argmin(replications["metric"])
+            stats_log.append(
+                iteration=state.iteration,
+                type="best",
+                mean_wait=replications["mean_wait"][idx_best],
+                max_wait=replications["max_wait"][idx_best],
+                min_wait=replications["min_wait"][idx_best],
+                rate=replications["control_variate"][idx_best],
+            )
+
+        if self.print_results:
+            print(f"New best metric: {state.best_metric:.2f} ± {1.96*np.sqrt(state.best_metric_mse_bootstrap/num_iters_per_optimization):.2f} (95% CI with {candidate.budget} simulations).")
+            print(f"New best hashsets: {state.best_hashset}")
+
+        # save the optimization function history
+        if history_log is not None:
+            history_log.append(
+                iteration=state.iteration,
+                function_name=fct_name,
+                metric_value=state.best_metric,
+                mse_bootstrap=state.best_metric_mse_bootstrap,
+                constraint_approved=-1 if state.constraint_approved is None else int(state.constraint_approved),
+            )
+
+    @staticmethod
+    def _bootstrap_mse(simulation, movie_hashsets, metric_fct, tolerance):
+        """
+        Bootstrap estimate of the MSE of the statistic of a movie hashset from a single simulation.
+        :param simulation: Simulation instance
+        :param movie_hashsets: movie hashset defining the storage configuration
+        :param metric_fct: function to calculate the metric (e.g. mean, median)
+        :param tolerance: tolerance of the estimate
+        :return: bootstrap MSE of the statistic
+        """
+        with profiling.capture("candidate_bootstrap"), profiling.phase("optimization.bootstrap"):
             requests_bootstrap = simulation.run(movie_hashsets=movie_hashsets)
             bootstrap_stats = Stats(requests_bootstrap)
-            iter_tolerance = np.linspace(1, tolerance, num_optimization_iters)[i] if decreasing_tolerance else tolerance
-            mse_bootstrap, n_simulations = bootstrap_stats.mse_bootstrap(f_statistic=metric_fct, tolerance=iter_tolerance)
-
-            # generate MC or CV estimate
-            metrics = []
-            control_variates = []
-            observed_rates = []
-            mean_waits = []
-            max_waits = []
-            min_waits = []
-
-            for _ in range(min(num_iters_per_optimization, n_simulations)):
-                # run simulation
-                requests = simulation.run(movie_hashsets=movie_hashsets)
-
-                # get Statistics
-                stats = Stats(requests)
-                waiting_times = stats.get_waiting_time()
-                metrics.append(metric_fct(waiting_times))
-                # store additional statistics
-                mean_waits.append(np.mean(waiting_times))
-                max_waits.append(np.max(waiting_times))
-                min_waits.append(np.min(waiting_times))
-                obs_rate = self.observed_max_request_rate(requests)
-                observed_rates.append(obs_rate)
-
-                candidate_stats.append({
-                    "iteration": i,
-                    "mean_wait": mean_waits[-1],
-                    "max_wait": max_waits[-1],
-                    "min_wait": min_waits[-1],
-                    "rate": observed_rates[-1],
-                    "type" : "candidate"
-                })
-
-
-                if use_control_variate: control_variates.append(self.observed_max_request_rate(requests))
-
-            # update the best configuration if the mean metric is lower
-            metrics_mean = np.mean(metrics) if (not use_control_variate) or n_simulations <= min_n_simulation_control_variate else self.control_variate_estimate(np.array(metrics), np.array(control_variates), mu_CV)
-            if metrics_mean < best_metric:
-                best_metric = metrics_mean
-                best_metric_mse_bootstrap = mse_bootstrap
-                best_hashset = movie_hashsets
-
-                idx_best = np.argmin(metrics)
-                best_mean_wait = mean_waits[idx_best]
-                best_max_wait = max_waits[idx_best]
-                best_min_wait = min_waits[idx_best]
-                best_obs_rate = observed_rates[idx_best]
-
-                pareto_stats.append({
-                    "iteration": i,
-                    "mean_wait": best_mean_wait,
-                    "max_wait": best_max_wait,
-                    "min_wait": best_min_wait,
-                    "rate": best_obs_rate,
-                    "type": "best"
-                })
+            mse_bootstrap, _ = bootstrap_stats.mse_bootstrap(f_statistic=metric_fct, tolerance=tolerance)
+        return mse_bootstrap
 
-                if self.print_results:
-                    print(f"New best metric: {best_metric:.2f} ± {1.96*np.sqrt(best_metric_mse_bootstrap/num_iters_per_optimization):.2f} (95% CI with {min(num_iters_per_optimization, n_simulations)} simulations).")
-                    print(f"New best hashsets: {best_hashset}")
+    @staticmethod
+    def _log_replications(stats_log, iteration, replications):
+        """
+        Append the replications of the candidates evaluated during an iteration to the statistics run log.
+        :param stats_log: RunLog of the statistics
+        :param iteration: index of the iteration
+        :param replications: dictionary of arrays per replication (see simulate_replications), None if none were run
+        """
+        if replications is None:
+            return
+        with profiling.phase("optimization.run_log"):
+            for j in range(len(replications["metric"])):
+                stats_log.append(
+                    iteration=iteration,
+                    type="candidate",
+                    mean_wait=replications["mean_wait"][j],
+                    max_wait=replications["max_wait"][j],
+                    min_wait=replications["min_wait"][j],
+                    rate=replications["control_variate"][j],
+                )
+
+    def _race(self, replicate_fct, record, num_simulations, current_record, current_metric, batch_size, confidence):
+        """
+        Race a candidate against the current configuration: the replications are run in batches and stopped as soon as
+        the one-sided Welch bound shows the candidate worse than the current configuration with the given confidence.
+        :param replicate_fct: function running n replications of the candidate from the replication index start and
+                              returning their dictionary of arrays (see evaluation.simulate_replications)
+        :param record: EvaluationRecord of the candidate, updated in-place
+        :param num_simulations: maximal number of replications
+        :param current_record: EvaluationRecord of the current configuration
+        :param current_metric: metric of the current configuration
+        :param batch_size: number of replications between two checks
+        :param confidence: confidence level of the rejection
+        :return: dictionary of arrays of the replications run and whether the candidate was rejected
+        """
+        z = NormalDist().inv_cdf(confidence)
+        batches = []
+        rejected = False
+        num_run = 0
+        while num_run < num_simulations and not rejected:
+            n = min(batch_size, num_simulations - num_run)
+            replications = replicate_fct(n, record.count)
+            record.update(replications["metric"], replications["control_variate"])
+            batches.append(replications)
+            num_run += n
+
+            # reject once the candidate mean exceeds the current metric by z standard errors of the difference
+            if record.count >= 2 and current_record.count >= 2:
+                std_diff = np.sqrt(record.variance() / record.count + current_record.variance() / current_record.count)
+                rejected = record.mean() - current_metric > z * std_diff
+
+        if len(batches) == 0:
+            return replicate_fct(0, record.count), False
+        return {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}, rejected
+
+    def _get_pool(self, n_workers):
+        """
+        Get the pool of worker processes, (re)created if the number of workers changed.
+        :param n_workers: number of worker processes
+        :return: multiprocessing Pool, or None to evaluate in-process
+        """
+        if n_workers <= 1:
+            return None
+        if self.pool is None or self.pool_size != n_workers:
+            self.close()
+            self.pool = Pool(processes=n_workers)
+            self.pool_size = n_workers
+        return self.pool
+
+    def close(self):
+        """
+        Terminate the pool of worker processes.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.pool_size = 0
+
+    def _sample_neighbours(self, optimization_fct, best_hashset, batch_size, use_mean_rate_constraint=False, max_tries_factor=10, excluded=None):
+        """
+        Sample distinct neighbours of the incumbent with an optimization function.
+        :param optimization_fct: optimization function generating a neighbour of the incumbent
+        :param best_hashset: incumbent movie hashset
+        :param batch_size: number of distinct neighbours
+        :param use_mean_rate_constraint: whether to discard the neighbours violating the mean rate constraint
+        :param max_tries_factor: the optimization function is called at most max_tries_factor * batch_size times, which
+                                 bounds the sampling of small neighbourhoods
+        :param excluded: canonical hashsets which cannot be sampled, e.g. the tabu list (optional)
+        :return: list of neighbour movie hashsets and list of their mean request rates
+        """
+        seen = {canonical_hashset(best_hashset)} | (set(excluded) if excluded is not None else set())
+        neighbours, mean_request_rates = [], []
+        for _ in range(max_tries_factor * batch_size):
+            movie_hashsets = optimization_fct(best_hashset=best_hashset)
+            key = canonical_hashset(movie_hashsets)
+            if key in seen:
+                continue
+            seen.add(key)
+
+            mean_request_rate = mean_request_rate_array(movies_hashsets=movie_hashsets)
+            if use_mean_rate_constraint and not self.CONSTRAINT_mean_request_rate(mean_request_rate):
+                continue
 
-                # save the optimization function history
-                if save_optimization_fct_history:
-                    with open("optimization_fct_history.csv", "a") as f:
-                        f.write(f"{i}, {optimization_fct_names[fct_count]}, {best_metric:.3f}, {best_metric_mse_bootstrap:.3f}, {constraint_approved}\n")
+            neighbours.append(movie_hashsets)
+            mean_request_rates.append(mean_request_rate)
+            if len(neighbours) == batch_size:
+                break
+
+        return neighbours, mean_request_rates
+
+    @profiling.timed("optimization.neighbourhood")
+    def _evaluate_neighbourhood(
+        self,
+        optimization_fct,
+        best_hashset,
+        best_record,
+        best_mu_CV,
+        best_metric,
+        batch_size,
+        num_simulations,
+        metric_fct=np.mean,
+        use_mean_rate_constraint=False,
+        use_control_variate=False,
+        use_evaluation_cache=False,
+        selection_method=None,
+        n_workers=1,
+        screening_fraction=None,
+        excluded=None,
+    ):
+        """
+        Evaluate a batch of distinct neighbours of the incumbent concurrently under common random numbers and return the
+        best one.
+        :param optimization_fct: optimization function generating a neighbour of the incumbent
+        :param best_hashset: incumbent movie hashset
+        :param best_record: EvaluationRecord of the incumbent
+        :param best_mu_CV: theoretical control variate of the incumbent
+        :param best_metric: metric of the incumbent
+        :param batch_size: number of distinct neighbours
+        :param num_simulations: number of simulations per neighbour
+        :param metric_fct: function to calculate the metric (e.g. mean, median)
+        :param use_mean_rate_constraint: whether to discard the neighbours violating the mean rate constraint
+        :param use_control_variate: whether to use the control variate method
+        :param use_evaluation_cache: whether to top up the cached replications of the neighbours
+        :param selection_method: ranking and selection method ("ocba" or "halving") allocating the simulations between
+                                 the incumbent and the neighbours (optional)
+        :param n_workers: number of worker processes
+        :param screening_fraction: fraction of the neighbours with the lowest surrogate mean waiting time which are
+                                   simulated (optional)
+        :param excluded: canonical hashsets which cannot be sampled, e.g. the tabu list (optional)
+        :return: best neighbour movie hashset (None if no feasible neighbour), its record, control variate and metric,
+                 the (refined) metric of the incumbent, whether the neighbour improves the incumbent, the number of
+                 simulations run and the records of the incumbent and neighbours, which keep the replications run
+                 (see EvaluationRecord.pop_replications)
+        """
+        neighbours, mean_request_rates = self._sample_neighbours(optimization_fct, best_hashset, batch_size, use_mean_rate_constraint, excluded=excluded)
+        if screening_fraction is not None and len(neighbours) > 0:
+            kept = surrogate.screen(neighbours, screening_fraction)
+            neighbours = [neighbours[j] for j in kept]
+            mean_request_rates = [mean_request_rates[j] for j in kept]
+        if len(neighbours) == 0:
+            return None, None, None, np.inf, best_metric, False, 0, []
+
+        mus_CV = [mean_request_rate.max() for mean_request_rate in mean_request_rates]
+        records = [self.evaluation_cache.get(movie_hashsets, metric_fct) if use_evaluation_cache else EvaluationRecord() for movie_hashsets in neighbours]
+        count_before = best_record.count + sum(record.count for record in records)
+
+        def estimate(record, mu_CV):
+            return record.control_variate_estimate(mu_CV) if use_control_variate else record.mean()
+
+        if selection_method is None:
+            # top up the neighbours to the same number of simulations with a shared seed
+            seed = int(self.rng.integers(2**31))
+            new_records = evaluate_batch(
+                neighbours,
+                [max(num_simulations - record.count, 0) for record in records],
+                metric_fct=metric_fct,
+                seed=seed,
+                n_workers=n_workers,
+                pool=self._get_pool(n_workers),
+                backend=self.backend,
+                keep_replications=True,
+            )
+            for record, new_record in zip(records, new_records):
+                record.merge(new_record)
+
+            idx_best = int(np.argmin([estimate(record, mu_CV) for record, mu_CV in zip(records, mus_CV)]))
+            metrics_mean = estimate(records[idx_best], mus_CV[idx_best])
+            improved = metrics_mean < best_metric
+        else:
+            # ranking and selection between the incumbent and the neighbours
+            idx_selected, _, pcs = self.select(
+                [best_hashset] + neighbours,
+                budget=num_simulations * len(neighbours),
+                method=selection_method,
+                metric_fct=metric_fct,
+                n_workers=n_workers,
+                records=[best_record] + records,
+                mus_CV=[best_mu_CV] + mus_CV if use_control_variate else None,
+                keep_replications=True,
+            )
+            best_metric = estimate(best_record, best_mu_CV)
+            idx_best = idx_selected - 1 if idx_selected > 0 else int(np.argmin([estimate(record, mu_CV) for record, mu_CV in zip(records, mus_CV)]))
+            metrics_mean = estimate(records[idx_best], mus_CV[idx_best])
+            improved = idx_selected > 0
+
+            if self.print_results:
+                print(f"Probability of correct selection: {pcs:.3f}")
+
+        if self.print_results:
+            print(f"Evaluated {len(neighbours)} neighbours, best neighbour metric: {metrics_mean:.2f}")
+
+        num_simulations_run = best_record.count + sum(record.count for record in records) - count_before
+        return neighbours[idx_best], records[idx_best], mus_CV[idx_best], metrics_mean, best_metric, improved, num_simulations_run, [best_record] + records
+
+    @profiling.timed("optimization.selection")
+    def select(self, hashsets, budget, method="ocba", metric_fct=np.mean, n0=5, increment=10, pcs_target=0.95, n_workers=1, records=None, mus_CV=None, keep_replications=False):
+        """
+        Select the best movie hashset of a pool of candidates with a ranking-and-selection procedure allocating the
+        simulations adaptively (see selection.RankingAndSelection).
+        :param hashsets: list of candidate movie hashsets
+        :param budget: total number of simulations
+        :param method: "ocba" (Optimal Computing Budget Allocation) or "halving" (successive halving)
+        :param metric_fct: function to calculate the metric (e.g. mean, median), must be picklable if n_workers > 1
+        :param n0: number of initial simulations per candidate (OCBA)
+        :param increment: number of simulations allocated per OCBA round
+        :param pcs_target: probability of correct selection at which the OCBA rounds stop early (None to use the budget)
+        :param n_workers: number of worker processes
+        :param records: EvaluationRecord per candidate holding the simulations already run (optional), updated in-place
+        :param mus_CV: theoretical control variate per candidate to use the control variate estimate (optional)
+        :param keep_replications: whether to keep the per-replication outputs in the records (see evaluate_hashset)
+        :return: index of the selected candidate, records per candidate and approximate probability of correct selection
+        """
+        def evaluate_fct(hashsets, num_simulations, seed):
+            return evaluate_batch(hashsets, num_simulations, metric_fct=metric_fct, seed=seed, n_workers=n_workers, pool=self._get_pool(n_workers), backend=self.backend, keep_replications=keep_replications)
+
+        estimate_fct = None if mus_CV is None else (lambda idx, record: record.control_variate_estimate(mus_CV[idx]))
+
+        ranking_and_selection = RankingAndSelection(evaluate_fct, method=method, n0=n0, increment=increment, pcs_target=pcs_target, rng=self.rng)
+        return ranking_and_selection(hashsets, budget, records=records, estimate_fct=estimate_fct)
+
+    def enumerate(
+        self,
+        metric_fct=np.mean,
+        num_simulations_screening=5,
+        num_simulations=50,
+        num_finalists=10,
+        use_mean_rate_constraint=True,
+        use_control_variate=False,
+        selection_method=None,
+        screening_fraction=None,
+        n_workers=1,
+        seed=None,
+    ):
+        """
+        Optimize the storage configuration by exhaustive enumeration of the feasible (ASN1, ASN2) movie hashsets.
+        Every hashset is screened with a few simulations, then the most promising ones are evaluated with the full
+        budget. All the hashsets of a stage share the same seed (common random numbers) and are evaluated in parallel.
+        :param metric_fct: function to calculate the metric (e.g. mean, median), must be picklable
+        :param num_simulations_screening: number of simulations per hashset in the screening stage
+        :param num_simulations: number of additional simulations per finalist
+        :param num_finalists: number of hashsets evaluated with the full budget
+        :param use_mean_rate_constraint: whether to discard the hashsets violating the mean rate constraint
+        :param use_control_variate: whether to use the control variate method
+        :param selection_method: ranking and selection method ("ocba" or "halving") allocating the
+                                 num_simulations * num_finalists simulations of the final stage (by default evenly)
+        :param screening_fraction: fraction of the feasible hashsets with the lowest surrogate mean waiting time (see
+                                   surrogate.py) which are simulated (by default all feasible hashsets)
+        :param n_workers: number of worker processes
+        :param seed: seed of the simulations (by default drawn from the random generator of the optimization)
+        :return: best movie hashset, its corresponding metric and the 95% CI half-width of the metric
+        """
+        seed = int(self.rng.integers(2**31)) if seed is None else seed
+
+        # enumerate the feasible hashsets and prune them with the mean rate constraint
+        hashsets = []
+        mus_CV = []
+        for asn1_set in feasible_movie_sets("ASN1"):
+            for asn2_set in feasible_movie_sets("ASN2"):
+                movie_hashsets = {"MSN": set(MOVIES_IDS), "ASN1": asn1_set, "ASN2": asn2_set}
+                mean_request_rate = mean_request_rate_array(movies_hashsets=movie_hashsets)
+                if use_mean_rate_constraint and not self.CONSTRAINT_mean_request_rate(mean_request_rate):
+                    continue
+                hashsets.append(movie_hashsets)
+                mus_CV.append(mean_request_rate.max())
+
+        if screening_fraction is not None:
+            kept = surrogate.screen(hashsets, screening_fraction)
+            if self.print_results:
+                print(f"Surrogate screening kept {len(kept)}/{len(hashsets)} feasible hashsets.")
+            hashsets = [hashsets[j] for j in kept]
+            mus_CV = [mus_CV[j] for j in kept]
+
+        if self.print_results:
+            print(f"Screening {len(hashsets)} feasible hashsets with {num_simulations_screening} simulations each...")
+
+        def estimate(record, mu_CV):
+            return record.control_variate_estimate(mu_CV) if use_control_variate else record.mean()
+
+        # screening stage
+        records = evaluate_batch(hashsets, num_simulations_screening, metric_fct=metric_fct, seed=seed, n_workers=n_workers, pool=self._get_pool(n_workers), backend=self.backend)
+        finalists = np.argsort([estimate(record, mu_CV) for record, mu_CV in zip(records, mus_CV)])[:num_finalists]
+
+        if self.print_results:
+            print(f"Evaluating {len(finalists)} finalists with {num_simulations} additional simulations each...")
+
+        # final stage, with replications independent from the screening stage
+        if selection_method is None:
+            final_records = evaluate_batch([hashsets[j] for j in finalists], num_simulations, metric_fct=metric_fct, seed=seed + 1, n_workers=n_workers, pool=self._get_pool(n_workers), backend=self.backend)
+            for j, record in zip(finalists, final_records):
+                records[j].merge(record)
+            idx_best = finalists[np.argmin([estimate(records[j], mus_CV[j]) for j in finalists])]
+        else:
+            idx_selected, _, pcs = self.select(
+                [hashsets[j] for j in finalists],
+                budget=num_simulations * len(finalists),
+                method=selection_method,
+                metric_fct=metric_fct,
+                n_workers=n_workers,
+                records=[records[j] for j in finalists],
+                mus_CV=[mus_CV[j] for j in finalists] if use_control_variate else None,
+            )
+            idx_best = finalists[idx_selected]
+            if self.print_results:
+                print(f"Probability of correct selection: {pcs:.3f}")
+
+        final_metrics = [estimate(records[j], mus_CV[j]) for j in finalists]
+        best_hashset = hashsets[idx_best]
+        best_metric = estimate(records[idx_best], mus_CV[idx_best])
+        best_half_width = records[idx_best].half_width()
+
+        if self.print_results:
+            for j, metric in sorted(zip(finalists, final_metrics), key=lambda x: x[1]):
+                print(f"{metric:.3f} ± {records[j].half_width():.3f} : {hashsets[j]}")
+            print(f"Best metric: {best_metric:.3f} ± {best_half_width:.3f} (95% CI with {records[idx_best].count} simulations).")
+
+        self.close()
+
+        return best_hashset, best_metric, best_half_width
+
+    def nsga2(
+        self,
+        population_size=20,
+        num_generations=10,
+        num_simulations=10,
+        mutation_fct_names=("replace_one", "swap_one", "replace_one_fill", "remove_one"),
+        crossover_rate=0.9,
+        use_mean_rate_constraint=True,
+        n_workers=1,
+        output_path="pareto_output/pareto_front.csv",
+    ):
+        """
+        Multi-objective optimization of the storage configuration with NSGA-II, minimizing the expected mean waiting
+        time, the expected maximal waiting time and the storage used on the ASN. Every evaluated hashset updates an
+        incremental archive of the non-dominated hashsets, whose front is written to output_path.
+        :param population_size: number of hashsets of the population
+        :param num_generations: number of generations
+        :param num_simulations: number of simulations per hashset
+        :param mutation_fct_names: names of the optimization functions used as mutation operators
+        :param crossover_rate: probability of crossing two parents over, the offspring otherwise copies a parent
+        :param use_mean_rate_constraint: whether to discard the hashsets violating the mean rate constraint
+        :param n_workers: number of worker processes
+        :param output_path: path of the CSV file of the Pareto front
+        :return: ParetoArchive of the non-dominated hashsets
+        """
+        archive = ParetoArchive(["mean_wait", "max_wait", "storage_used"])
+        evaluated = {}  # canonical hashset -> objective vector
+
+        def feasible(movie_hashsets):
+            return not use_mean_rate_constraint or self.CONSTRAINT_mean_request_rate(mean_request_rate_array(movies_hashsets=movie_hashsets))
+
+        def evaluate(hashsets):
+            # the hashsets of a generation share the same seed (common random numbers)
+            hashsets = [movie_hashsets for movie_hashsets in hashsets if canonical_hashset(movie_hashsets) not in evaluated]
+            seed = int(self.rng.integers(2**31))
+            tasks = [(movie_hashsets, num_simulations, seed) for movie_hashsets in hashsets]
+            pool = self._get_pool(n_workers)
+            if self.backend is not None:
+                results = self.backend.starmap(evaluate_objectives, tasks)
+            elif pool is not None and len(tasks) > 1:
+                results = pool.starmap(evaluate_objectives, tasks)
             else:
-                # Variable Neighbourhood Structure (VNS): update the function to optimize
-                fct_count += 1
-                if fct_count >= len(optimization_fct_names):
-                    fct_count = 0
+                results = [evaluate_objectives(*task) for task in tasks]
+            for movie_hashsets, waiting_times in zip(hashsets, results):
+                key = canonical_hashset(movie_hashsets)
+                evaluated[key] = np.append(waiting_times, storage_used(movie_hashsets))
+                archive.add(key, evaluated[key], movie_hashsets)
+
+        def tournament(ranks, distances):
+            i, j = self.rng.integers(0, len(ranks), size=2)
+            if ranks[i] != ranks[j]:
+                return i if ranks[i] < ranks[j] else j
+            return i if distances[i] >= distances[j] else j
+
+        # initial population of distinct feasible hashsets
+        population, keys = [], set()
+        for _ in range(10 * population_size):
+            movie_hashsets = self.random()
+            key = canonical_hashset(movie_hashsets)
+            if key not in keys and feasible(movie_hashsets):
+                population.append(movie_hashsets)
+                keys.add(key)
+            if len(population) == population_size:
+                break
+        evaluate(population)
+
+        for generation in range(num_generations):
+            objectives = np.array([evaluated[canonical_hashset(movie_hashsets)] for movie_hashsets in population])
+            ranks, distances = np.zeros(len(population), dtype=int), np.zeros(len(population))
+            for rank, front in enumerate(non_dominated_sort(objectives)):
+                ranks[front] = rank
+                distances[front] = crowding_distance(objectives[front])
+
+            # offspring: binary tournament, uniform crossover of the ASN movie sets and mutation
+            offspring, keys = [], {canonical_hashset(movie_hashsets) for movie_hashsets in population}
+            for _ in range(10 * population_size):
+                parent_a = population[tournament(ranks, distances)]
+                parent_b = population[tournament(ranks, distances)]
+                if self.rng.random() < crossover_rate:
+                    child = {storage_id: set((parent_a if self.rng.random() < 0.5 else parent_b)[storage_id]) for storage_id in STORAGE_IDS}
+                else:
+                    child = copy.deepcopy(parent_a)
+                mutation_fct = getattr(self, mutation_fct_names[self.rng.integers(0, len(mutation_fct_names))])
+                child = mutation_fct(best_hashset=child)
+
+                key = canonical_hashset(child)
+                if key not in keys and feasible(child):
+                    offspring.append(child)
+                    keys.add(key)
+                if len(offspring) == population_size:
+                    break
+            evaluate(offspring)
+
+            # environmental selection of the next population by rank, then crowding distance
+            combined = population + offspring
+            objectives = np.array([evaluated[canonical_hashset(movie_hashsets)] for movie_hashsets in combined])
+            population = []
+            for front in non_dominated_sort(objectives):
+                if len(population) + len(front) > population_size:
+                    distances = crowding_distance(objectives[front])
+                    front = [front[k] for k in np.argsort(-distances)[:population_size - len(population)]]
+                population.extend(combined[k] for k in front)
+                if len(population) == population_size:
+                    break
+
+            if self.print_results:
+                print(f"Generation {generation + 1}/{num_generations}: {len(archive)} non-dominated hashsets in the archive ({len(evaluated)} evaluated).")
 
-        df_all = pd.DataFrame(candidate_stats + pareto_stats)
-        df_all.to_csv("pareto_output/pareto_stats.csv", index=False)
+        archive.to_csv(output_path)
+        if self.print_results:
+            for objectives, movie_hashsets in archive.front():
+                print(f"mean {objectives[0]:.3f} | max {objectives[1]:.3f} | storage {objectives[2]:.0f} : {movie_hashsets}")
 
-        return best_hashset, best_metric
+        self.close()
 
+        return archive
 
     def random(self, best_hashset=None):
         """
-        Randomly generate a movie hashset for each storage option.
+        Randomly generate a movie hashset for each storage option, the movies of each ASN being drawn uniformly among
+        the feasible movie sets to which no other movie can be added.
         :param best_hashset: not used
         :return: movie hashsets
         """
         
         movie_hashsets: Dict[str, Set[int]] = {}
-        for id in STORAGE_IDS:
+        for id in sorted(STORAGE_IDS):  # fixed order so that seeded runs are reproducible across processes
             
             # if the storage is MSN, add all movies
             if id == "MSN":
                 movie_hashsets[id] = set(MOVIES_IDS)
                 continue
 
-            # if the storage is ASN1 or ASN2, randomly select movies
-            movie_hashsets[id] = set()
-            capacity = STORAGE_SIZES[id]
-            while capacity > 0:
-
-                # get random movie id
-                movie_id = self.rng.choice(list(MOVIES_IDS)).item()
-
-                # check if the movie is not already in the hashset
-                if movie_id not in movie_hashsets[id]:
-
-                    # check if there is enough capacity to add the movie
-                    if capacity - MOVIE_SIZES[movie_id] >= 0:
-                        movie_hashsets[id].add(movie_id)
-                        capacity -= MOVIE_SIZES[movie_id]
-
-                # check if the hashset is full
-                if len(movie_hashsets[id]) == len(MOVIES_IDS):
-                    break
-
-                # check if smallest movie size is larger than the remaining capacity
-                remaining_movie_ids = MOVIES_IDS - movie_hashsets[id]
-                remaining_movie_sizes = [MOVIE_SIZES[i] for i in remaining_movie_ids]
-                if capacity < min(remaining_movie_sizes):
-                    break
+            # if the storage is ASN1 or ASN2, randomly select a full movie set
+            candidates = neighbourhood.maximal_masks(id)
+            movie_hashsets[id] = bitmask.to_set(candidates[self.rng.integers(len(candidates))])
 
         return movie_hashsets
     
@@ -321,28 +1214,11 @@ class Optimization():
         :param num_movies_to_remove: number of movies to remove
         :return: optimized movie hashsets
         """
-        best_hashset = copy.deepcopy(best_hashset)
-
         # initialize the movie hashsets with a random configuration
         if best_hashset is None:
             return self.random()
-        
-        next_hashset:Dict[str, Set[int]] = {}
-        for storage_id, movie_set in best_hashset.items():
-
-            # if the storage is MSN, add all movies
-            if storage_id == "MSN":
-                next_hashset[storage_id] = MOVIES_IDS
-                continue
 
-            # if the storage is ASN1 or ASN2, remove the movies
-            movie_to_remove = self.rng.choice(tuple(movie_set), size=num_movies_to_remove, replace=False)
-            for movie_id in movie_to_remove:
-                movie_set.remove(movie_id)
-
-            next_hashset[storage_id] = movie_set
-
-        return next_hashset
+        return self._move(best_hashset, num_movies_to_remove, "remove")
     
     def _replace(self, best_hashset:Dict[str, Set[int]]=None, num_movies_to_replace=1, fill_storage=False):
         """
@@ -353,47 +1229,33 @@ class Optimization():
                              if False, replace movies, i.e. keep the same number of movies
         :return: optimized movie hashsets
         """
-        best_hashset = copy.deepcopy(best_hashset)
-
         # initialize the movie hashsets with a random configuration
         if best_hashset is None:
             return self.random()
-        
-        # remove the movies from the hashset
-        next_hashset = self._remove(best_hashset=best_hashset, num_movies_to_remove=num_movies_to_replace)
-        
-        # add the movies to the hashset
-        for storage_id, movie_set in next_hashset.items():
 
-            # continue if the storage is MSN
-            if storage_id == "MSN":
-                continue
+        return self._move(best_hashset, num_movies_to_replace, "fill" if fill_storage else "replace")
 
-            added_movies_count = 0
-            capacity = STORAGE_SIZES[storage_id] - sum([MOVIE_SIZES[i] for i in movie_set])
-            for movie_id in self.rng.permutation(list(MOVIES_IDS)):
-                movie_id = movie_id.item()
-
-                # check if the movie is not already in the hashset
-                if movie_id in movie_set:
-                    continue
-
-                # check if there is enough capacity to add the movie
-                if capacity - MOVIE_SIZES[movie_id] < 0:
-                    continue
-
-                # add the movie to the hashset
-                movie_set.add(movie_id)
-                capacity -= MOVIE_SIZES[movie_id]
-                added_movies_count += 1
+    def _move(self, best_hashset, num_movies, move):
+        """
+        Draw uniformly a feasible neighbour of the movies of each ASN from the neighbour tables (see neighbourhood.py).
+        An ASN without feasible neighbour (e.g. fewer movies than to remove) is kept unchanged.
+        :param best_hashset: best movie hashset from previous iteration
+        :param num_movies: number of movies removed
+        :param move: "remove", "replace" or "fill"
+        :return: optimized movie hashsets
+        """
+        next_masks = {}
+        for storage_id, mask in bitmask.to_masks(best_hashset).items():
 
-                # stop if the movies should only be replaced without filling the storage
-                if not fill_storage and (added_movies_count == num_movies_to_replace):
-                    break
+            # if the storage is MSN, add all movies
+            if storage_id == "MSN":
+                next_masks[storage_id] = bitmask.ALL_MOVIES
+                continue
 
-            next_hashset[storage_id] = movie_set
+            candidates = neighbourhood.neighbours(storage_id, mask, num_movies, move)
+            next_masks[storage_id] = candidates[self.rng.integers(len(candidates))] if len(candidates) > 0 else mask
 
-        return next_hashset
+        return bitmask.to_hashsets(next_masks)
     
     def _swap(self, best_hashset:Dict[str, Set[int]]=None, num_movies_to_swap=1):
         """
@@ -402,61 +1264,29 @@ class Optimization():
         :param num_movies_to_swap: number of movies to swap
         :return: optimized movie hashsets
         """
-        best_hashset = copy.deepcopy(best_hashset)
-
         # initialize the movie hashsets with a random configuration
         if best_hashset is None:
             return self.random()
         
-        # swap the movies between ASN1 and ASN2
-        next_hashset:Dict[str, Set[int]] = None
-        iter = 0
-        while True:
-            next_hashset = copy.deepcopy(best_hashset)
-
-            # try max 1000 times to find a valid configuration
-            iter += 1
-            if iter > 1000:
-                break
+        # draw uniformly a valid swap between ASN1 and ASN2, the hashset is kept unchanged if there is none
+        next_masks = bitmask.to_masks(best_hashset)
+        swaps = neighbourhood.swap_neighbours(next_masks["ASN1"], next_masks["ASN2"], num_movies_to_swap)
+        if len(swaps) > 0:
+            next_masks["ASN1"], next_masks["ASN2"] = swaps[self.rng.integers(len(swaps))]
 
-            # choose random movies to swap
-            movies_to_swap_asn1 = self.rng.choice(tuple(best_hashset["ASN1"]), size=num_movies_to_swap, replace=False)
-            movies_to_swap_asn2 = self.rng.choice(tuple(best_hashset["ASN2"]), size=num_movies_to_swap, replace=False)
-
-            # remove movies from ASN1 and ASN2 and add them to the other storage
-            for movie_id in movies_to_swap_asn1:
-                next_hashset["ASN1"].remove(movie_id)
-                next_hashset["ASN2"].add(movie_id.item())
-
-            for movie_id in movies_to_swap_asn2:
-                next_hashset["ASN2"].remove(movie_id)
-                next_hashset["ASN1"].add(movie_id.item())
-                
-            # verify if the storage capacity is not exceeded
-            if STORAGE_SIZES["ASN1"] < sum([MOVIE_SIZES[i] for i in next_hashset["ASN1"]]):
-                continue
-            if STORAGE_SIZES["ASN2"] < sum([MOVIE_SIZES[i] for i in next_hashset["ASN2"]]):
-                continue
-            if len(next_hashset["ASN1"]) < len(best_hashset["ASN1"]):
-                continue
-            if len(next_hashset["ASN2"]) < len(best_hashset["ASN2"]):
-                continue
-            break
-
-        return next_hashset
+        return bitmask.to_hashsets(next_masks)
 
     def CONSTRAINT_mean_request_rate(self, mean_request_rate):
         """
         Constraint function to check if the mean request rate is at most the handling rate.
-        :param mean_request_rate: mean request rate per storage node and interval
+        :param mean_request_rate: array of the mean request rate per storage node and interval (see
+                                  utils.mean_request_rate_array), or dictionary of the rates per storage node
         :return: True if the constraint is satisfied, False otherwise
         """
+        if isinstance(mean_request_rate, dict):
+            mean_request_rate = [mean_request_rate[storage_id] for storage_id in STORAGE_IDS]
         handling_rate = 1/STORAGE_HANDLE_TIME_BETA
-        for storage_id in STORAGE_IDS:
-            for interval in range(len(mean_request_rate[storage_id])):
-                if mean_request_rate[storage_id][interval] > handling_rate:
-                    return False
-        return True
+        return bool(np.all(np.asarray(mean_request_rate) <= handling_rate))
 
     def observed_request_rate(self, requests, total_duration):
         """
@@ -473,15 +1303,7 @@ class Optimization():
         :param requests: (unfiltered) requests generated by the simulation
         :return: maximum rate per storage node and time interval
         """
-        rates = []
-        for storage_id in STORAGE_IDS:
-            for time_interval in TIME_INTERVALS:
-                duration = time_interval[1] - time_interval[0]
-                filtered_requests = [r for r in requests if
-                                     r.storage_id == storage_id and time_interval[0] <= r.time_creation <=
-                                     time_interval[1]]
-                rates.append(len(filtered_requests) / duration)
-        return max(rates)
+        return observed_max_request_rate(requests)
 
     def control_variate_estimate(self, X, Y, mu):
         """
@@ -543,5 +1365,35 @@ def test_optimization():
     print(f"Final waiting time: {waiting_time_best:.2f}")
 
 
+def test_batch_runlog():
+    """
+    Test that the replications of every neighbour evaluated by the batch neighbourhood and the ranking and selection are
+    logged as candidates, and that the best neighbour keeps its own bootstrap estimate.
+    """
+    import os
+    import tempfile
+    from runlog import read_runlog
+
+    for selection_method in (None, "ocba"):
+        optimization = Optimization(print_results=False, random_seed=0)
+        optimization.STATS_LOG_PATH = os.path.join(tempfile.mkdtemp(), "stats.runlog")
+        events = []
+        best_hashset, _ = optimization(
+            ["replace_one", "swap_one"],
+            num_optimization_iters=2,
+            num_iters_per_optimization=10,
+            tolerance=2.,
+            batch_size=3,
+            selection_method=selection_method,
+            use_evaluation_cache=True,
+            telemetry_callback=events.append,
+        )
+        records = read_runlog(optimization.STATS_LOG_PATH)
+        assert np.sum(records["type"] == b"candidate") == sum(event["simulations"] for event in events if "simulations" in event)
+        assert np.sum(records["type"] == b"best") > 0
+        assert optimization.evaluation_cache.get(best_hashset, np.mean).mse_bootstrap is not None
+
+
 if __name__ == "__main__":
-    test_optimization()
\ No newline at end of file
+    test_optimization()
+    test_batch_runlog()
\ No newline at end of file
@@ -7,6 +7,54 @@ import matplotlib.pyplot as plt
 
 
 from optimization import Optimization
+from runlog import read_runlog_frame
+from multistart import multi_start
+
+
+OPTIMIZATION_FCT_NAMES = [
+    "random",
+    "replace_one", 
+    "replace_two", 
+    "replace_three",
+    "swap_one", 
+    "swap_two",
+    "swap_three",
+    "replace_one_fill", 
+    "replace_two_fill", 
+    "replace_three_fill",
+    "remove_one", 
+    "remove_two",
+    "remove_three",
+]
+
+OPTIMIZATION_KWARGS = dict(
+    optimization_fct_names=OPTIMIZATION_FCT_NAMES,
+    num_optimization_iters=100, 
+    num_iters_per_optimization=250,
+    metric_fct=np.mean,
+    tolerance=0.01,
+    use_control_variate=True,
+    use_mean_rate_constraint=True,
+    save_optimization_fct_history=True,
+    choose_optimization_fct_randomly=True,
+    decreasing_tolerance=True,
+)
+
+
+def print_summary(best_hashsets, best_waiting_times, total_time):
+    """
+    Print the summary of the runs of the optimization.
+    :param best_hashsets: best hashset per run
+    :param best_waiting_times: best waiting time per run
+    :param total_time: total time of the runs
+    """
+    print(f"\n\nBest hashsets: {best_hashsets}")
+    print(f"Best waiting times: {best_waiting_times}")
+    print(f"Average time per optimization: {total_time / len(best_hashsets):.3f} seconds")
+    print(f"Average waiting time: {np.mean(best_waiting_times):.3f}")
+    print(f"Standard deviation of waiting time: {np.std(best_waiting_times):.3f}")
+    print(f"Overall best hashset: {best_hashsets[np.argmin(best_waiting_times)]}")
+    print(f"Overall best waiting time: {np.min(best_waiting_times):.3f}")
 
 
 def run_optimization(
@@ -15,21 +63,6 @@ def run_optimization(
     """
     Test the optimization class.
     """
-    optimization_fct_names = [
-        "random",
-        "replace_one", 
-        "replace_two", 
-        "replace_three",
-        "swap_one", 
-        "swap_two",
-        "swap_three",
-        "replace_one_fill", 
-        "replace_two_fill", 
-        "replace_three_fill",
-        "remove_one", 
-        "remove_two",
-        "remove_three",
-    ]
     start_time = time.time()
     best_hashsets = []
     best_waiting_times = []
@@ -39,41 +72,54 @@ def run_optimization(
             print_results=True,
             random_seed=i,
         )
-        best_hashset, waiting_time_best = optimization(
-            optimization_fct_names=optimization_fct_names,
-            num_optimization_iters=100, 
-            num_iters_per_optimization=250,
-            metric_fct=np.mean,
-            tolerance=0.01,
-            use_control_variate=True,
-            use_mean_rate_constraint=True,
-            save_optimization_fct_history=True,
-            choose_optimization_fct_randomly=True,
-            decreasing_tolerance=True,
-        )
+        optimization.STATS_LOG_PATH = f"pareto_output/pareto_stats_{i}.runlog"  # one run log per seed
+        optimization.HISTORY_LOG_PATH = f"optimization_fct_history_{i}.runlog"
+        # continue the run of this seed from its last checkpoint if it was interrupted, a finished seed is not rerun
+        checkpoint_path = f"checkpoints/optimization_{i}.pkl"
+        if os.path.exists(checkpoint_path):
+            best_hashset, waiting_time_best = optimization.resume(checkpoint_path)
+        else:
+            best_hashset, waiting_time_best = optimization(
+                **OPTIMIZATION_KWARGS,
+                checkpoint_path=checkpoint_path,
+                checkpoint_every=10,
+            )
         best_hashsets.append(best_hashset)
         best_waiting_times.append(waiting_time_best)
 
         print(f"\n\nFinal hashset: {best_hashset}")
         print(f"Final waiting time: {waiting_time_best:.2f}")
 
-    print(f"\n\nBest hashsets: {best_hashsets}")
-    print(f"Best waiting times: {best_waiting_times}")
-    print(f"Average time per optimization: {(time.time() - start_time) / num_runs:.3f} seconds")
-    print(f"Average waiting time: {np.mean(best_waiting_times):.3f}")
-    print(f"Standard deviation of waiting time: {np.std(best_waiting_times):.3f}")
-    print(f"Overall best hashset: {best_hashsets[np.argmin(best_waiting_times)]}")
-    print(f"Overall best waiting time: {np.min(best_waiting_times):.3f}")
+    print_summary(best_hashsets, best_waiting_times, time.time() - start_time)
+
+
+def run_multi_start_optimization(
+    num_runs=10,
+    n_workers=4,
+):
+    """
+    Run the seeds of the optimization concurrently, sharing the evaluated hashsets and stopping the seeds falling
+    clearly behind the global incumbent (see multistart.py).
+    """
+    start_time = time.time()
+    _, _, summaries = multi_start(range(num_runs), OPTIMIZATION_KWARGS, n_workers=n_workers)
+    best_hashsets = [summary["best_hashset"] for summary in summaries]
+    best_waiting_times = [summary["best_metric"] for summary in summaries]
+
+    for summary in summaries:
+        stopped = f", stopped after {summary['stopped_iteration']} iterations" if summary["stopped_iteration"] is not None else ""
+        print(f"\n\nSeed {summary['seed']} ({summary['time']:.1f} seconds, {summary['store_hits']} shared evaluations reused{stopped})")
+        print(f"Final hashset: {summary['best_hashset']}")
+        print(f"Final waiting time: {summary['best_metric']:.2f}")
+
+    print_summary(best_hashsets, best_waiting_times, time.time() - start_time)
 
-def analyze_optimization_fct_history():
+def analyze_optimization_fct_history(path="optimization_fct_history.runlog"):
     """
     Analyze the optimization function history.
+    :param path: path of the run log of the optimization function history (all the runs appended to it are analyzed)
     """
-    # df = pd.read_csv("plots/optimization_fct_history.csv")
-    df = pd.read_csv("optimization_constraint_on_fct_history.csv")
-    df = df.rename(columns={"# iteration": "iteration"})
-    df = df.rename(columns={" function_name": "function_name"})
-    df = df.rename(columns={" metric_value": "metric_value"})
+    df = read_runlog_frame(path)
 
 
     # sort df according to the column iteration
@@ -111,7 +157,7 @@ def analyze_optimization_fct_history():
     ax.scatter(
         df["iteration"],
         df["metric_value"],
-        c=[fct_colors[fct[1:]] for fct in df["function_name"]],
+        c=[fct_colors[fct] for fct in df["function_name"]],
         s=30,
     )
     ax.hlines(
@@ -143,7 +189,7 @@ def analyze_optimization_fct_history():
         df_count = df_count / df_count.sum()
 
         df_count = df_count.sort_index()
-        colors = [fct_colors[fct[1:]] for fct in df_count.index]
+        colors = [fct_colors[fct] for fct in df_count.index]
 
         ax = axs[i+1]
         ax.pie(df_count, labels=df_count.index, colors=colors, autopct='%1.1f%%', startangle=140)
@@ -0,0 +1,354 @@
+import csv
+import os
+import numpy as np
+
+# bound on the number of pairwise comparisons held in memory by the dominance checks of the k-objective skyline
+_MAX_PAIRS = 2**22
+
+
+def dominates(a, b):
+    """
+    Pareto dominance for minimization.
+    :param a: objective vector
+    :param b: objective vector
+    :return: True if a is no worse than b on every objective and strictly better on at least one
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    return bool(np.all(a <= b) and np.any(a < b))
+
+
+def non_dominated_sort(objectives):
+    """
+    Fast non-dominated sorting of NSGA-II.
+    :param objectives: array of objective vectors (candidates x objectives)
+    :return: list of fronts, each a list of candidate indices, from the non-dominated front onwards
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    n = len(objectives)
+    dominated_by = [[] for _ in range(n)]  # candidates dominated by each candidate
+    domination_count = np.zeros(n, dtype=int)  # number of candidates dominating each candidate
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            if dominates(objectives[i], objectives[j]):
+                dominated_by[i].append(j)
+                domination_count[j] += 1
+            elif dominates(objectives[j], objectives[i]):
+                dominated_by[j].append(i)
+                domination_count[i] += 1
+
+    fronts = [[i for i in range(n) if domination_count[i] == 0]]
+    while len(fronts[-1]) > 0:
+        next_front = []
+        for i in fronts[-1]:
+            for j in dominated_by[i]:
+                domination_count[j] -= 1
+                if domination_count[j] == 0:
+                    next_front.append(j)
+        fronts.append(next_front)
+    return fronts[:-1]
+
+
+def crowding_distance(objectives):
+    """
+    Crowding distance of the candidates of a front: sum over the objectives of the normalized distance between the
+    two neighbours of each candidate, the extreme candidates having an infinite distance.
+    :param objectives: array of objective vectors of a front (candidates x objectives)
+    :return: crowding distance per candidate
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    n, m = objectives.shape
+    distances = np.zeros(n)
+    if n <= 2:
+        return np.full(n, np.inf)
+
+    for k in range(m):
+        order = np.argsort(objectives[:, k])
+        span = objectives[order[-1], k] - objectives[order[0], k]
+        distances[order[0]] = distances[order[-1]] = np.inf
+        if span > 0:
+            distances[order[1:-1]] += (objectives[order[2:], k] - objectives[order[:-2], k]) / span
+    return distances
+
+
+def _dominated(points, by):
+    """
+    :param points: array of objective vectors (points x objectives)
+    :param by: array of objective vectors (points x objectives)
+    :return: mask of the points dominated by any of the vectors of by, compared in blocks of bounded memory
+    """
+    dominated = np.zeros(len(points), dtype=bool)
+    if len(points) == 0:
+        return dominated
+    step = max(1, _MAX_PAIRS // (len(points) * points.shape[1]))
+    for start in range(0, len(by), step):
+        block = by[start:start + step][None, :, :]
+        dominated |= np.any(np.all(block <= points[:, None, :], axis=2) & np.any(block < points[:, None, :], axis=2), axis=1)
+    return dominated
+
+
+def _prefilter(objectives):
+    """
+    Discard in O(n) the points dominated by a few pivots, the minimizers of positively weighted sums of the normalized
+    objectives, which are non-dominated. On typical clouds of points only a small fraction survives the filter. The
+    objectives are processed column by column, which is much faster than row-wise reductions over millions of points.
+    :return: indices of the remaining points
+    """
+    columns = [np.ascontiguousarray(objectives[:, k]) for k in range(objectives.shape[1])]
+    normalized = [(column - column.min()) / (column.max() - column.min() or 1.) for column in columns]
+    total = sum(normalized)
+    pivots = [np.argmin(total)] + [np.argmin(total + 9 * column) for column in normalized]
+
+    dominated = np.zeros(len(objectives), dtype=bool)
+    for pivot in objectives[np.unique(pivots)]:
+        weakly, strictly = np.ones(len(objectives), dtype=bool), np.zeros(len(objectives), dtype=bool)
+        for column, value in zip(columns, pivot):
+            weakly &= column >= value
+            strictly |= column > value
+        dominated |= weakly & strictly
+    return np.flatnonzero(~dominated)
+
+
+def _front_mask_2d(objectives):
+    """
+    Sort-and-sweep in O(n log n): after sorting by the first objective, a point is non-dominated if it is the lowest of
+    the points sharing its first objective and strictly below the second objective of all the points with a lower first
+    objective.
+    """
+    n = len(objectives)
+    order = np.argsort(objectives[:, 0])
+    x, y = objectives[order, 0], objectives[order, 1]
+
+    group_start = np.ones(n, dtype=bool)
+    group_start[1:] = x[1:] != x[:-1]
+    starts = np.flatnonzero(group_start)
+    group = np.cumsum(group_start) - 1
+    group_min = np.minimum.reduceat(y, starts)
+    previous_min = np.full(len(starts), np.inf)  # minimum of y over the points with a lower x
+    previous_min[1:] = np.minimum.accumulate(group_min)[:-1]
+
+    mask = np.empty(n, dtype=bool)
+    mask[order] = (y == group_min[group]) & (y < previous_min[group])
+    return mask
+
+
+def _front_mask_kd(objectives, block_size=8192):
+    """
+    Sort-filter skyline: after a lexicographic sort, a point can only be dominated by the points before it, so the
+    points are checked in blocks against the front found so far, which never loses a point, and then within their block.
+    The cost is O(n f) for a front of f points, small for the clouds of evaluated assignments.
+    """
+    n = len(objectives)
+    order = np.lexsort(objectives.T[::-1])
+    objectives = objectives[order]
+
+    mask = np.zeros(n, dtype=bool)
+    front = objectives[:0]
+    for start in range(0, n, block_size):
+        block = objectives[start:start + block_size]
+        candidates = np.flatnonzero(~_dominated(block, front))
+        candidates = candidates[~_dominated(block[candidates], block[candidates])]
+        mask[order[start + candidates]] = True
+        front = np.concatenate([front, block[candidates]])
+    return mask
+
+
+def pareto_front_mask(objectives):
+    """
+    Non-dominated points for minimization, with a sort-and-sweep for 2 objectives and a sort-filter skyline otherwise.
+    Identical non-dominated points are all kept.
+    :param objectives: array of objective vectors (points x objectives)
+    :return: boolean mask of the non-dominated points
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    if len(objectives) == 0:
+        return np.zeros(0, dtype=bool)
+    if objectives.shape[1] == 1:
+        return objectives[:, 0] == objectives[:, 0].min()
+
+    mask = np.zeros(len(objectives), dtype=bool)
+    kept = _prefilter(objectives)
+    mask[kept] = _front_mask_2d(objectives[kept]) if objectives.shape[1] == 2 else _front_mask_kd(objectives[kept])
+    return mask
+
+
+class StreamingParetoFront:
+
+    def __init__(self):
+        """
+        Front of the non-dominated points of a stream of chunks, the front of the union of the chunks being the front of
+        the previous front and of the new chunk, so that only the front is kept in memory.
+        """
+        self.objectives = None
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.num_points = 0
+
+    def update(self, objectives, indices=None):
+        """
+        :param objectives: array of objective vectors of the chunk (points x objectives)
+        :param indices: indices of the points of the chunk (by default their position in the stream)
+        """
+        objectives = np.asarray(objectives, dtype=float)
+        if indices is None:
+            indices = np.arange(self.num_points, self.num_points + len(objectives))
+        self.num_points += len(objectives)
+        if self.objectives is not None:
+            objectives = np.concatenate([self.objectives, objectives])
+            indices = np.concatenate([self.indices, indices])
+        mask = pareto_front_mask(objectives)
+        self.objectives, self.indices = objectives[mask], np.asarray(indices)[mask]
+
+    def front(self):
+        """
+        :return: objective vectors and indices of the non-dominated points, sorted lexicographically by objectives
+        """
+        if self.objectives is None:
+            return np.zeros((0, 0)), self.indices
+        order = np.lexsort(self.objectives.T[::-1])
+        return self.objectives[order], self.indices[order]
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def pareto_front_runlog(path, objective_names, filters=None, chunk_size=2**20):
+    """
+    Pareto front of the records of a run log, streamed in chunks.
+    :param path: path of the binary log file (e.g. pareto_output/pareto_stats.runlog)
+    :param objective_names: names of the minimized fields
+    :param filters: dictionary of the values of the fields of the kept records (e.g. {"type": "candidate"})
+    :param chunk_size: number of records per chunk
+    :return: objective vectors and indices of the non-dominated records in the log
+    """
+    from runlog import read_runlog_chunks
+
+    stream = StreamingParetoFront()
+    offset = 0
+    for records in read_runlog_chunks(path, chunk_size=chunk_size):
+        kept = np.ones(len(records), dtype=bool)
+        for name, value in (filters or {}).items():
+            kept &= records[name] == (value.encode() if records.dtype[name].kind == "S" else value)
+        idx = np.flatnonzero(kept)
+        stream.update(np.column_stack([records[name][idx] for name in objective_names]), offset + idx)
+        offset += len(records)
+    return stream.front()
+
+
+def pareto_front_csv(path, objective_names, filters=None, chunk_size=2**20):
+    """
+    Pareto front of the rows of a CSV file, streamed in chunks.
+    :param path: path of the CSV file with a header
+    :param objective_names: names of the minimized columns
+    :param filters: dictionary of the values of the columns of the kept rows (e.g. {"type": "candidate"})
+    :param chunk_size: number of rows per chunk
+    :return: objective vectors and indices (0 being the first row after the header) of the non-dominated rows
+    """
+    import pandas as pd
+
+    stream = StreamingParetoFront()
+    columns = list(dict.fromkeys(list(objective_names) + list(filters or {})))
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+        for name, value in (filters or {}).items():
+            chunk = chunk[chunk[name] == value]
+        stream.update(chunk[list(objective_names)].to_numpy(dtype=float), chunk.index.to_numpy())
+    return stream.front()
+
+
+class ParetoArchive:
+
+    def __init__(self, objective_names):
+        """
+        Archive of the non-dominated movie hashsets, updated incrementally after each evaluation.
+        :param objective_names: names of the minimized objectives
+        """
+        self.objective_names = list(objective_names)
+        self.objectives = {}  # key -> objective vector
+        self.items = {}  # key -> movie hashset
+        self.num_updates = 0
+
+    def add(self, key, objectives, item):
+        """
+        Insert an evaluated movie hashset if it is not dominated by the archive, and remove the archived hashsets it
+        dominates. A hashset already archived under the same key is replaced by its new evaluation.
+        :param key: key of the movie hashset (e.g. its canonical form)
+        :param objectives: objective vector of the movie hashset
+        :param item: movie hashset
+        :return: True if the movie hashset entered the archive
+        """
+        objectives = np.asarray(objectives, dtype=float)
+        self.num_updates += 1
+        self.objectives.pop(key, None)
+        self.items.pop(key, None)
+
+        if any(dominates(archived, objectives) for archived in self.objectives.values()):
+            return False
+
+        for archived_key in [k for k, archived in self.objectives.items() if dominates(objectives, archived)]:
+            del self.objectives[archived_key]
+            del self.items[archived_key]
+
+        self.objectives[key] = objectives
+        self.items[key] = item
+        return True
+
+    def front(self):
+        """
+        :return: list of (objective vector, movie hashset) of the archive, sorted by the first objective
+        """
+        return sorted(((self.objectives[key], self.items[key]) for key in self.objectives), key=lambda x: tuple(x[0]))
+
+    def to_csv(self, path):
+        """
+        Write the front of the archive, one row per movie hashset with its objectives and movie sets per storage node.
+        :param path: path of the CSV file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        front = self.front()
+        storage_ids = sorted(front[0][1].keys()) if len(front) > 0 else []
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.objective_names + storage_ids)
+            for objectives, item in front:
+                writer.writerow([f"{value:.6g}" for value in objectives] + [" ".join(str(movie_id) for movie_id in sorted(item[storage_id])) for storage_id in storage_ids])
+
+    def __len__(self):
+        return len(self.objectives)
+
+
+def test_pareto_front():
+    """
+    Test the fronts of the sweep, the skyline and the streaming against the pairwise dominance, with ties (the fronts of
+    millions of points are timed by the pareto_front benchmark, see benchmark.py).
+    """
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    for num_objectives in (1, 2, 3, 4):
+        for n in (0, 1, 50, 500):
+            objectives = rng.integers(0, 8, size=(n, num_objectives)).astype(float)  # many ties and duplicates
+            expected = np.array([not any(dominates(other, point) for other in objectives) for point in objectives], dtype=bool)
+            assert np.array_equal(pareto_front_mask(objectives), expected), (num_objectives, n)
+
+            stream = StreamingParetoFront()
+            for start in range(0, n, 64):
+                stream.update(objectives[start:start + 64])
+            assert np.array_equal(np.sort(stream.front()[1]), np.flatnonzero(expected)), (num_objectives, n)
+
+    # streaming over a run log, only keeping the candidates
+    from runlog import RunLog, STATS_SCHEMA
+    path = os.path.join(tempfile.mkdtemp(), "stats.runlog")
+    objectives = rng.random((10000, 2))
+    types = rng.choice(["candidate", "best"], size=len(objectives))
+    with RunLog(path, STATS_SCHEMA) as log:
+        for (max_wait, min_wait), record_type in zip(objectives, types):
+            log.append(iteration=0, type=record_type, mean_wait=0., max_wait=max_wait, min_wait=min_wait, rate=0.)
+    _, indices = pareto_front_runlog(path, ["max_wait", "min_wait"], filters={"type": "candidate"}, chunk_size=1000)
+    candidates = np.flatnonzero(types == "candidate")
+    assert np.array_equal(np.sort(indices), candidates[pareto_front_mask(objectives[candidates])])
+
+
+if __name__ == "__main__":
+    test_pareto_front()
@@ -0,0 +1,213 @@
+import os
+import matplotlib.pyplot as plt
+
+# Plotting functions, kept apart from the simulation, statistics and optimization core so that the core only needs NumPy
+# and matplotlib is only imported by the processes which draw figures.
+
+
+def _finish(fig, filepath, dpi, show):
+    """
+    Save a figure and show it, or close it so that the figures rendered without display (e.g. with the Agg backend of
+    the report workers) do not accumulate.
+    """
+    if filepath is not None:
+        if os.path.dirname(filepath):
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        fig.savefig(filepath, bbox_inches='tight', dpi=dpi)
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+    return filepath
+
+
+def plot_run_histograms(max_waiting_times, mean_waiting_times, median_waiting_times, filepath=None, dpi=None, show=True):
+    """
+    Plot the histograms of the maximum, mean and median waiting times per run.
+    :param max_waiting_times: maximum waiting time per run
+    :param mean_waiting_times: mean waiting time per run
+    :param median_waiting_times: median waiting time per run
+    :param filepath: path where the figure is saved (optional)
+    :param dpi: resolution of the saved figure (by default the matplotlib one)
+    :param show: whether to show the figure (blocking) rather than close it
+    :return: path of the saved figure
+    """
+    fig, axes = plt.subplots(3, 1, figsize=(10, 15))
+
+    ax = axes[0]
+    ax.hist(max_waiting_times, bins=20, color='skyblue', edgecolor='black')
+    ax.set_title('Histogram of Maximum Waiting Times per Run')
+    ax.set_xlabel('Maximum Waiting Time (s)')
+    ax.set_ylabel('Frequency')
+
+    ax = axes[1]
+    ax.hist(mean_waiting_times, bins=20, color='skyblue', edgecolor='black')
+    ax.set_title('Histogram of Mean Waiting Times per Run')
+    ax.set_xlabel('Mean Waiting Time (s)')
+    ax.set_ylabel('Frequency')
+
+    ax = axes[2]
+    ax.hist(median_waiting_times, bins=20, color='skyblue', edgecolor='black')
+    ax.set_title('Histogram of Median Waiting Times per Run')
+    ax.set_xlabel('Median Waiting Time (s)')
+    ax.set_ylabel('Frequency')
+
+    fig.tight_layout()
+    return _finish(fig, filepath, dpi, show)
+
+
+# Independent function to plot histograms
+# This function is not part of the Stats class and is used for plotting
+def plot_comparison_histogram(
+    baseline_data, optimized_data, title, xlabel, bins=20, filepath=None, dpi=None, show=True
+):
+    """
+    Plot a histogram comparing baseline and optimized simulation statistics.
+
+    Args:
+        baseline_data (list or np.array): Data from baseline configuration.
+        optimized_data (list or np.array): Data from optimized configuration.
+        title (str): Plot title.
+        xlabel (str): Label for the x-axis.
+        bins (int): Number of histogram bins.
+        filepath (str): Path of the saved figure (by default in 'Plots', named after the title).
+        dpi (int): Resolution of the saved figure (by default the matplotlib one).
+        show (bool): Whether to show the figure (blocking) rather than close it.
+
+    Returns the path of the saved figure.
+    """
+    # plt.figure(figsize=(8, 6))
+    # plt.hist(baseline_data, bins=bins, alpha=0.6, label='Baseline', color='skyblue', edgecolor='black')
+    # plt.hist(optimized_data, bins=bins, alpha=0.6, label='Optimized', color='salmon', edgecolor='black')
+    # plt.title(title, fontsize=24)
+    # plt.xlabel(xlabel, fontsize=18)
+    # plt.ylabel('Frequency', fontsize=18)
+    # plt.xticks(fontsize=14)
+    # plt.yticks(fontsize=14)
+    # plt.legend(fontsize=18)
+    # plt.grid(True)
+    # # Create 'Plots' folder if it doesn't exist
+    # os.makedirs("Plots", exist_ok=True)
+    # # Save the plot with a unique filename based on the title
+    # filename = title.lower().replace(" ", "_") + ".png"
+    # filepath = os.path.join("Plots", filename)
+    # plt.savefig(filepath, bbox_inches='tight')
+    # plt.show()
+    # # plt.show(block=False) # Shows the plot without blocking the script
+    # # plt.close()
+
+
+    # plt.figure(figsize=(8, 6))
+
+    # # Compute histograms manually
+    # counts_baseline, bins_baseline = np.histogram(baseline_data, bins=bins)
+    # counts_optimized, bins_optimized = np.histogram(optimized_data, bins=bins)
+
+    # # Compute bin centers
+    # bin_centers = 0.5 * (bins_baseline[1:] + bins_baseline[:-1])
+    # width = (bins_baseline[1] - bins_baseline[0]) * 0.4
+
+    # # Plot side-by-side bars
+    # plt.bar(bin_centers - width/2, counts_baseline, width=width, alpha=0.7, label='Baseline', color='skyblue', edgecolor='black')
+    # plt.bar(bin_centers + width/2, counts_optimized, width=width, alpha=0.7, label='Optimized', color='salmon', edgecolor='black')
+
+    # plt.title(title, fontsize=24)
+    # plt.xlabel(xlabel, fontsize=18)
+    # plt.ylabel("Frequency", fontsize=18)
+    # plt.xticks(fontsize=14)
+    # plt.yticks(fontsize=14)
+    # plt.legend(fontsize=18)
+    # plt.grid(True)
+
+    # os.makedirs("Plots", exist_ok=True)
+    # filename = title.lower().replace(" ", "_") + ".png"
+    # plt.savefig(os.path.join("Plots", filename), bbox_inches='tight')
+    # plt.show()
+
+    fig, axes = plt.subplots(1, 2, figsize=(14, 6), sharey=True)
+
+    # Plot baseline
+    axes[0].hist(baseline_data, bins=bins, color='skyblue', edgecolor='black')
+    axes[0].set_title("1st Baseline", fontsize=18)
+    axes[0].set_xlabel(xlabel, fontsize=14)
+    axes[0].set_ylabel("Frequency", fontsize=14)
+    axes[0].tick_params(axis='both', labelsize=12)
+    axes[0].grid(True)
+
+    # Plot optimized
+    axes[1].hist(optimized_data, bins=bins, color='salmon', edgecolor='black')
+    axes[1].set_title("Optimized", fontsize=18)
+    axes[1].set_xlabel(xlabel, fontsize=14)
+    axes[1].tick_params(axis='both', labelsize=12)
+    axes[1].grid(True)
+
+    # Overall title
+    fig.suptitle(title, fontsize=24)
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+
+    # Save in 'Plots' folder
+    if filepath is None:
+        filename = title.lower().replace(" ", "_") + ".png"
+        filepath = os.path.join("Plots", filename)
+    return _finish(fig, filepath, dpi, show)
+
+# Independent function to plot a single histogram (Baseline only)
+def plot_baseline_histogram(data, title, xlabel, bins=20, filepath=None, dpi=None, show=True):
+    """
+    Plot a histogram for baseline simulation statistics.
+
+    Args:
+        data (list or np.array): Data from baseline configuration.
+        title (str): Plot title.
+        xlabel (str): Label for the x-axis.
+        bins (int): Number of histogram bins.
+        filepath (str): Path of the saved figure (by default in 'Plots', named after the title).
+        dpi (int): Resolution of the saved figure (by default the matplotlib one).
+        show (bool): Whether to show the figure (blocking) rather than close it.
+
+    Returns the path of the saved figure.
+    """
+    fig = plt.figure(figsize=(8, 6))
+    plt.hist(data, bins=bins, alpha=0.7, color='skyblue', edgecolor='black', label='Baseline')
+    plt.title(title, fontsize=24)
+    plt.xlabel(xlabel, fontsize=18)
+    plt.ylabel('Frequency', fontsize=18)
+    plt.xticks(fontsize=14)
+    plt.yticks(fontsize=14)
+    plt.legend(fontsize=18)
+    plt.grid(True)
+    # Save the plot with a unique filename based on the title
+    if filepath is None:
+        filename = "baseline_" + title.lower().replace(" ", "_") + ".png"
+        filepath = os.path.join("Plots", filename)
+    return _finish(fig, filepath, dpi, show)
+
+
+def plot_candidate_best(candidates_x, candidates_y, best_x, best_y, title, xlabel, ylabel, best_label="Best",
+                        filepath=None, dpi=None, show=True):
+    """
+    Scatter plot of the replications of the candidates with the path of the best solutions (or the Pareto front).
+    :param candidates_x: x values of the candidates
+    :param candidates_y: y values of the candidates
+    :param best_x: x values of the best solutions
+    :param best_y: y values of the best solutions
+    :param title: plot title
+    :param xlabel: label of the x-axis
+    :param ylabel: label of the y-axis
+    :param best_label: legend of the best solutions
+    :param filepath: path where the figure is saved (optional)
+    :param dpi: resolution of the saved figure (by default the matplotlib one)
+    :param show: whether to show the figure (blocking) rather than close it
+    :return: path of the saved figure
+    """
+    fig = plt.figure(figsize=(8, 6))
+    plt.scatter(candidates_x, candidates_y, alpha=0.3, label="Candidates", color="gray")
+    plt.plot(best_x, best_y, 'o-', label=best_label, color="orange")
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    return _finish(fig, filepath, dpi, show)
+
@@ -0,0 +1,247 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+_NULL_PHASE = nullcontext()
+
+
+class Profiler:
+
+    def __init__(self):
+        """
+        Named timers and counters of the phases of the simulation and optimization. The timers are inclusive: the time
+        of a phase includes the time of the phases nested in it (e.g. simulation.queue in optimization.replications).
+        Each process has its own profiler, the phases run by the workers of a pool are not collected.
+        With memory tracking, the peak of the memory allocated by a phase above the memory allocated at its start is
+        also recorded with tracemalloc (which slows down the allocations, so the timers are then inflated).
+        """
+        self.enabled = False
+        self.memory = False
+        self.timers = defaultdict(lambda: [0, 0.])  # name -> [number of calls, total time]
+        self.counters = defaultdict(int)
+        self.peaks = defaultdict(int)  # name -> maximal peak of the memory allocated by the phase
+        self.memory_stack = []  # [allocated memory at the start, peak of the nested phases] of the running phases
+        self.armed = {}  # name -> output path of the cProfile capture of the next run of the phase
+        self.captures = {}  # name -> pstats.Stats of the last capture of the phase
+
+    @contextmanager
+    def phase(self, name):
+        if self.memory:
+            self._start_memory()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            timer = self.timers[name]
+            timer[0] += 1
+            timer[1] += time.perf_counter() - start_time
+            if self.memory:
+                self.peaks[name] = max(self.peaks[name], self._stop_memory())
+
+    def _start_memory(self):
+        # the tracemalloc peak is reset for the nested phase, the peak reached so far is kept for the enclosing phase
+        current, peak = tracemalloc.get_traced_memory()
+        if len(self.memory_stack) > 0:
+            self.memory_stack[-1][1] = max(self.memory_stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        self.memory_stack.append([current, 0])
+
+    def _stop_memory(self):
+        start, nested_peak = self.memory_stack.pop()
+        peak = max(nested_peak, tracemalloc.get_traced_memory()[1])
+        if len(self.memory_stack) > 0:
+            self.memory_stack[-1][1] = max(self.memory_stack[-1][1], peak)
+        return peak - start
+
+    def reset(self):
+        self.timers.clear()
+        self.counters.clear()
+        self.peaks.clear()
+        self.captures.clear()
+
+
+PROFILER = Profiler()
+
+
+def enable(reset=True, memory=False):
+    """
+    Enable the timers and counters.
+    :param reset: whether to reset the timers and counters
+    :param memory: whether to track the peak memory of the phases with tracemalloc (started if needed)
+    """
+    if reset:
+        PROFILER.reset()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    PROFILER.memory = memory
+    PROFILER.enabled = True
+
+
+def disable():
+    PROFILER.enabled = False
+    PROFILER.memory = False
+    PROFILER.memory_stack.clear()
+
+
+def phase(name):
+    """
+    Context manager timing a phase, a shared no-op context when the profiler is disabled.
+    :param name: name of the phase
+    """
+    return PROFILER.phase(name) if PROFILER.enabled else _NULL_PHASE
+
+
+def timed(name):
+    """
+    Decorator timing each call of a function as a phase.
+    :param name: name of the phase
+    """
+    def decorator(fct):
+        @wraps(fct)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return fct(*args, **kwargs)
+            with PROFILER.phase(name):
+                return fct(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    """
+    Increment a counter.
+    :param name: name of the counter
+    :param n: increment
+    """
+    if PROFILER.enabled:
+        PROFILER.counters[name] += n
+
+
+def capture_next(name, path=None):
+    """
+    Arm a cProfile capture of the next run of a capturable phase (see capture), independently of enable.
+    :param name: name of the phase (e.g. "candidate_evaluation")
+    :param path: path where the profile is dumped (optional, readable with pstats or snakeviz)
+    """
+    PROFILER.armed[name] = path
+
+
+def capture(name):
+    """
+    Scope of a capturable phase, profiled with cProfile only if a capture was armed with capture_next, a shared no-op
+    context otherwise.
+    :param name: name of the phase
+    """
+    return _capture(name, PROFILER.armed.pop(name)) if name in PROFILER.armed else _NULL_PHASE
+
+
+@contextmanager
+def _capture(name, path):
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        PROFILER.captures[name] = pstats.Stats(profile)
+        if path is not None:
+            profile.dump_stats(path)
+
+
+def captured(name, sort="cumulative", limit=20):
+    """
+    :param name: name of the captured phase
+    :param sort: sort key of the functions (see pstats.Stats.sort_stats)
+    :param limit: number of functions printed
+    :return: report of the last capture of the phase
+    """
+    stream = io.StringIO()
+    stats = PROFILER.captures[name]
+    stats.stream = stream
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+def summary():
+    """
+    :return: dictionary of the timers (calls, total and mean time in seconds, and peak memory in bytes with memory
+             tracking) and counters
+    """
+    return {
+        "timers": {
+            name: {"calls": calls, "total": total, "mean": total / calls if calls > 0 else 0., "peak_memory": PROFILER.peaks.get(name)}
+            for name, (calls, total) in sorted(PROFILER.timers.items())
+        },
+        "counters": dict(sorted(PROFILER.counters.items())),
+    }
+
+
+def peak_memory(name):
+    """
+    :param name: name of the phase
+    :return: maximal peak of the memory allocated by the phase (in bytes) since the profiler was reset
+    """
+    return PROFILER.peaks[name]
+
+
+def report():
+    """
+    :return: table of the timers sorted by total time, followed by the counters
+    """
+    timers = summary()["timers"]
+    lines = [f"{'phase':40s} {'calls':>10s} {'total (s)':>12s} {'mean (ms)':>12s} {'peak (MB)':>12s}"]
+    for name, timer in sorted(timers.items(), key=lambda item: -item[1]["total"]):
+        peak = f"{timer['peak_memory'] / 2**20:12.2f}" if timer["peak_memory"] is not None else f"{'':12s}"
+        lines.append(f"{name:40s} {timer['calls']:10d} {timer['total']:12.3f} {1000 * timer['mean']:12.3f} {peak}")
+    for name, value in summary()["counters"].items():
+        lines.append(f"{name:40s} {value:10d}")
+    return "\n".join(lines)
+
+
+def export(path):
+    """
+    Write the timers and counters to a JSON file.
+    :param path: path of the JSON file
+    """
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=2)
+
+
+def test_profiling():
+    """
+    Test the phases collected during a short optimization and the capture of a candidate evaluation.
+    """
+    import os
+    import tempfile
+    from optimization import Optimization
+
+    log_dir = tempfile.mkdtemp()
+    optimization = Optimization(random_seed=0)
+    optimization.STATS_LOG_PATH = os.path.join(log_dir, "stats.runlog")
+    optimization.HISTORY_LOG_PATH = os.path.join(log_dir, "history.runlog")
+
+    enable()
+    capture_next("candidate_evaluation", path=os.path.join(log_dir, "candidate.prof"))
+    optimization(optimization_fct_names=["replace_one", "swap_one"], num_optimization_iters=3, num_iters_per_optimization=5, tolerance=5.)
+    disable()
+
+    timers = summary()["timers"]
+    for name in ("simulation.generate", "simulation.queue", "stats.bootstrap", "optimization.replications"):
+        assert timers[name]["calls"] > 0, name
+    assert os.path.exists(os.path.join(log_dir, "candidate.prof"))
+    assert "candidate_evaluation" not in PROFILER.armed and capture("candidate_evaluation") is _NULL_PHASE
+    export(os.path.join(log_dir, "profile.json"))
+
+    print(report())
+    print(captured("candidate_evaluation", limit=10))
+
+
+if __name__ == "__main__":
+    import profiling  # the instrumented modules use the profiler of the imported module, not of __main__
+    profiling.test_profiling()
@@ -0,0 +1,306 @@
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+from multiprocessing import Pool
+
+import numpy as np
+
+# version of the figures, to be increased when a change of the report (other than of plotting.py, whose source is part
+# of the fingerprints) invalidates the rendered figures
+REPORT_VERSION = 1
+MANIFEST_NAME = "report_manifest.json"
+
+# histograms of the per-run metrics of main.run_simulation: (metric, title, x-axis label)
+HISTOGRAMS = [
+    ("max", "Histogram of Maximum Waiting Times", "Maximum Waiting Time (s)"),
+    ("mean", "Histogram of Mean Waiting Times", "Mean Waiting Time (s)"),
+    ("median", "Histogram of Median Waiting Times", "Median Waiting Time (s)"),
+    ("var", "Histogram of Waiting Time Variance", "Variance"),
+    ("above_threshold", "Histogram of Customers Waiting above Threshold", "Number of Customers"),
+]
+
+# scatter plots of the replications of the candidates of an optimization run:
+# (filename, x, y, title, x-axis label, y-axis label)
+CANDIDATE_SCATTERS = [
+    ("max_vs_mean_wait.png", "max_wait", "mean_wait", "Maximum vs Mean Waiting Time", "Maximum Waiting Time", "Mean Waiting Time"),
+    ("request_rate_vs_mean_wait.png", "rate", "mean_wait", "Request Rate vs Mean Waiting Time", "Request Rate", "Mean Waiting Time"),
+]
+
+# Pareto fronts of the replications of the candidates of an optimization run, both objectives being minimized:
+# (filename, x, y, title, x-axis label, y-axis label)
+PARETO_FRONTS = [
+    ("pareto_max_min_pareto_front.png", "max_wait", "min_wait", "Pareto Front: Maximum vs Minimum Waiting Time", "Maximum Waiting Time", "Minimum Waiting Time"),
+]
+
+
+def save_metrics(path, stats):
+    """
+    Save the per-run metrics of a set of simulations so that their figures can be rendered (again) without simulating.
+    :param path: path of the .npz file
+    :param stats: dictionary of the per-run metrics (see main.run_simulation)
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **{name: np.asarray(values) for name, values in stats.items()})
+
+
+def load_metrics(path):
+    """
+    :param path: path of the .npz file
+    :return: dictionary of the per-run metrics
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def _candidate_arrays(runlog_path):
+    # columns of the candidates and bests of the last run appended to the run log, read without pandas
+    from runlog import read_runlog
+
+    records = read_runlog(runlog_path)
+    if len(records) == 0:
+        return None
+    records = records[records["run_id"] == records["run_id"][-1]]
+    candidates = records[records["type"] == b"candidate"]
+    best = records[records["type"] == b"best"]
+    return candidates, best
+
+
+def report_figures(baseline_path=None, optimized_path=None, runlog_path=None):
+    """
+    List the figures of a report: the histograms of the baseline metrics, the comparison of the baseline and optimized
+    metrics, and the candidates versus the best solutions and the Pareto fronts of the last optimization run of a run log.
+    :param baseline_path: path of the saved metrics of the baseline (optional)
+    :param optimized_path: path of the saved metrics of the optimized assignment (optional, compared to the baseline)
+    :param runlog_path: path of the run log of the replications of the candidates (optional)
+    :return: list of figures, each a dictionary of the name of its plotting function, its filename and its arguments
+    """
+    figures = []
+    baseline = load_metrics(baseline_path) if baseline_path is not None else None
+    optimized = load_metrics(optimized_path) if optimized_path is not None else None
+
+    for metric, title, xlabel in HISTOGRAMS:
+        if baseline is not None:
+            baseline_title = f"1st Baseline {title}"
+            figures.append({
+                "fct": "plot_baseline_histogram",
+                "filename": "baseline_" + baseline_title.lower().replace(" ", "_") + ".png",
+                "kwargs": {"data": baseline[metric], "title": baseline_title, "xlabel": xlabel},
+            })
+        if baseline is not None and optimized is not None:
+            figures.append({
+                "fct": "plot_comparison_histogram",
+                "filename": title.lower().replace(" ", "_") + ".png",
+                "kwargs": {"baseline_data": baseline[metric], "optimized_data": optimized[metric], "title": title, "xlabel": xlabel},
+            })
+
+    arrays = _candidate_arrays(runlog_path) if runlog_path is not None and os.path.exists(runlog_path) else None
+    if arrays is not None:
+        candidates, best = arrays
+        for filename, x, y, title, xlabel, ylabel in CANDIDATE_SCATTERS:
+            figures.append({
+                "fct": "plot_candidate_best",
+                "filename": filename,
+                "kwargs": {
+                    "candidates_x": candidates[x], "candidates_y": candidates[y], "best_x": best[x], "best_y": best[y],
+                    "title": title, "xlabel": xlabel, "ylabel": ylabel,
+                },
+            })
+
+        from pareto import pareto_front_mask
+
+        for filename, x, y, title, xlabel, ylabel in PARETO_FRONTS:
+            front = candidates[pareto_front_mask(np.column_stack([candidates[x], candidates[y]]))]
+            front = front[np.argsort(front[x], kind="stable")]
+            figures.append({
+                "fct": "plot_candidate_best",
+                "filename": filename,
+                "kwargs": {
+                    "candidates_x": candidates[x], "candidates_y": candidates[y], "best_x": front[x], "best_y": front[y],
+                    "title": title, "xlabel": xlabel, "ylabel": ylabel, "best_label": "Pareto Front",
+                },
+            })
+    return figures
+
+
+@lru_cache(maxsize=None)
+def plotting_source_hash():
+    """
+    :return: hash of the source of plotting.py, read without importing matplotlib, so that a change of the plotting code
+             invalidates the rendered figures
+    """
+    with open(importlib.util.find_spec("plotting").origin, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def fingerprint(figure, dpi, source_hash=None):
+    """
+    :param figure: figure of a report (see report_figures)
+    :param dpi: resolution of the rendered figure
+    :param source_hash: hash of the plotting code (by default the one of plotting.py, see plotting_source_hash)
+    :return: hash of the plotting function and code, the arguments (data included), the resolution and the report
+             version
+    """
+    source_hash = plotting_source_hash() if source_hash is None else source_hash
+    digest = hashlib.sha256(json.dumps([REPORT_VERSION, source_hash, figure["fct"], dpi]).encode())
+    for name, value in sorted(figure["kwargs"].items()):
+        digest.update(name.encode())
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            digest.update(f"{value.dtype.str}{value.shape}".encode())
+            digest.update(value.tobytes())
+        else:
+            digest.update(json.dumps(value).encode())
+    return digest.hexdigest()[:16]
+
+
+def _init_worker():
+    # the Agg backend renders to files only, so the workers never open a window or block
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+
+
+def _render(task):
+    figure, filepath, dpi = task
+    import plotting
+
+    getattr(plotting, figure["fct"])(**figure["kwargs"], filepath=filepath, dpi=dpi, show=False)
+    return figure["filename"]
+
+
+def _load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def generate_report(figures, output_dir="Plots", dpi=150, n_workers=4, force=False, print_results=True):
+    """
+    Render the figures of a report to PNG files with the Agg backend in a pool of workers. The figures whose file
+    exists with the fingerprint of its inputs recorded in the manifest of the output directory are skipped.
+    :param figures: list of figures (see report_figures)
+    :param output_dir: directory of the rendered figures and of their manifest
+    :param dpi: resolution of the figures
+    :param n_workers: number of worker processes
+    :param force: whether to render the unchanged figures again
+    :param print_results: whether to print the progress
+    :return: dictionary of the filename of each figure to "rendered" or "skipped"
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+    keys = {figure["filename"]: fingerprint(figure, dpi) for figure in figures}
+
+    status, tasks = {}, []
+    for figure in figures:
+        filepath = os.path.join(output_dir, figure["filename"])
+        if not force and manifest.get(figure["filename"]) == keys[figure["filename"]] and os.path.exists(filepath):
+            status[figure["filename"]] = "skipped"
+        else:
+            tasks.append((figure, filepath, dpi))
+    if print_results:
+        print(f"{len(figures)} figures, {len(figures) - len(tasks)} unchanged, {len(tasks)} to render")
+
+    start_time = time.time()
+    if len(tasks) > 0:
+        # rendered in workers even with a single one, so that the backend of the calling process is left untouched
+        with Pool(processes=max(1, min(n_workers, len(tasks))), initializer=_init_worker) as pool:
+            for filename in pool.imap_unordered(_render, tasks):
+                status[filename] = "rendered"
+                manifest[filename] = keys[filename]
+        _save_manifest(output_dir, manifest)
+    if print_results:
+        print(f"Report written to {output_dir} in {time.time() - start_time:.2f} seconds")
+
+    return status
+
+
+def test_report():
+    """
+    Test that a report is rendered without display, that an unchanged report is skipped and that only the figures whose
+    inputs changed are rendered again.
+    """
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    rng = np.random.default_rng(0)
+    stats = {metric: rng.exponential(size=100) for metric, _, _ in HISTOGRAMS}
+    save_metrics(os.path.join(directory, "baseline.npz"), stats)
+    save_metrics(os.path.join(directory, "optimized.npz"), stats)
+    figures = report_figures(os.path.join(directory, "baseline.npz"), os.path.join(directory, "optimized.npz"))
+    output_dir = os.path.join(directory, "Plots")
+
+    status = generate_report(figures, output_dir=output_dir, dpi=50, n_workers=2)
+    assert len(status) == 2 * len(HISTOGRAMS) and set(status.values()) == {"rendered"}
+    assert all(os.path.exists(os.path.join(output_dir, filename)) for filename in status)
+
+    status = generate_report(figures, output_dir=output_dir, dpi=50, n_workers=2)
+    assert set(status.values()) == {"skipped"}
+
+    stats["mean"] = stats["mean"] + 1
+    save_metrics(os.path.join(directory, "optimized.npz"), stats)
+    figures = report_figures(os.path.join(directory, "baseline.npz"), os.path.join(directory, "optimized.npz"))
+    status = generate_report(figures, output_dir=output_dir, dpi=50, n_workers=2)
+    assert [filename for filename, value in status.items() if value == "rendered"] == ["histogram_of_mean_waiting_times.png"]
+
+    # the fingerprints follow the source of plotting.py, so a change of the plotting code renders every figure again
+    import plotting
+
+    with open(plotting.__file__, "rb") as f:
+        assert plotting_source_hash() == hashlib.sha256(f.read()).hexdigest()
+    for figure in figures:
+        assert fingerprint(figure, 50) == fingerprint(figure, 50, source_hash=plotting_source_hash())
+        assert fingerprint(figure, 50) != fingerprint(figure, 50, source_hash=hashlib.sha256(b"changed").hexdigest())
+
+    # the figures of an empty run log are skipped, those of a run log include its Pareto front
+    from runlog import RunLog, STATS_SCHEMA
+
+    runlog_path = os.path.join(directory, "stats.runlog")
+    with RunLog(runlog_path, STATS_SCHEMA):
+        pass
+    assert report_figures(runlog_path=runlog_path) == []
+    with RunLog(runlog_path, STATS_SCHEMA) as runlog:
+        for j in range(20):
+            runlog.append(iteration=j, type="candidate", mean_wait=rng.exponential(), max_wait=rng.exponential(),
+                          min_wait=rng.exponential(), rate=rng.exponential())
+    figures = report_figures(runlog_path=runlog_path)
+    status = generate_report(figures, output_dir=output_dir, dpi=50, n_workers=2)
+    assert set(status) == {filename for filename, *_ in CANDIDATE_SCATTERS + PARETO_FRONTS}
+    assert set(status.values()) == {"rendered"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the figures of a report from saved metrics and run logs.")
+    parser.add_argument("--baseline", default="report_data/baseline.npz", help="path of the saved metrics of the baseline")
+    parser.add_argument("--optimized", default="report_data/optimized.npz", help="path of the saved metrics of the optimized assignment")
+    parser.add_argument("--runlog", default="pareto_output/pareto_stats.runlog", help="path of the run log of the candidates")
+    parser.add_argument("--output-dir", default="Plots", help="directory of the rendered figures")
+    parser.add_argument("--dpi", type=int, default=150, help="resolution of the figures")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--force", action="store_true", help="render the unchanged figures again")
+    args = parser.parse_args(argv)
+
+    figures = report_figures(
+        baseline_path=args.baseline if os.path.exists(args.baseline) else None,
+        optimized_path=args.optimized if os.path.exists(args.optimized) else None,
+        runlog_path=args.runlog,
+    )
+    generate_report(figures, output_dir=args.output_dir, dpi=args.dpi, n_workers=args.workers, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
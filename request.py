@@ -3,8 +3,12 @@ import numpy as np
 from constants import MU_SERVE_TIME, RHO_SEND_TIME, MOVIE_SIZES, TIME_INTERVALS
 
 class Request:
+
+    # fixed attributes instead of a per-instance __dict__, a run holding thousands of requests
+    __slots__ = ("group_id", "movie_id", "storage_id", "time_creation", "time_arrived", "time_served", "time_handled",
+                 "time_request_send", "time_movie_service", "to_be_processed")
     
-    def __init__(self, group_id, movie_id, storage_id, time_creation):
+    def __init__(self, group_id, movie_id, storage_id, time_creation, time_end=TIME_INTERVALS[-1][1]):
         """
         Initialize a Request object with automatic timing calculations.
         
@@ -12,6 +16,7 @@ class Request:
             group_id: Identifier for the group making the request (1, 2, or 3)
             movie_id: Identifier for the requested movie (0-9)
             storage_id: Identifier for the storage location (MSN, ASN1, ASN2)
+            time_end: End of the processing horizon (by default the end of the last interval)
         """
         # Basic request properties
         self.group_id = group_id
@@ -29,7 +34,7 @@ class Request:
         self.time_arrived = self.time_creation + self.time_request_send
 
         # Check if arrival is within processing bounds
-        if self.time_arrived > TIME_INTERVALS[-1][1]:  # end of last interval
+        if self.time_arrived > time_end:  # end of the processing horizon
             self.to_be_processed = False
             self.time_handled = np.inf
             self.time_served = np.inf
@@ -0,0 +1,217 @@
+import json
+import os
+import uuid
+import numpy as np
+
+# Schemas of the run logs: fixed-size records so that the log is appended in blocks and read back with a single
+# np.fromfile. String fields are fixed-length bytes.
+STATS_SCHEMA = [
+    ("run_id", "S16"),
+    ("iteration", "<i4"),
+    ("type", "S9"),  # "candidate" (replication of a candidate) or "best" (replication of a new best)
+    ("mean_wait", "<f8"),
+    ("max_wait", "<f8"),
+    ("min_wait", "<f8"),
+    ("rate", "<f8"),
+]
+
+HISTORY_SCHEMA = [
+    ("run_id", "S16"),
+    ("iteration", "<i4"),
+    ("function_name", "S24"),
+    ("metric_value", "<f8"),
+    ("mse_bootstrap", "<f8"),
+    ("constraint_approved", "<i1"),  # 1 approved, 0 violated, -1 not checked
+]
+
+
+def new_run_id():
+    """
+    :return: random identifier of a run
+    """
+    return uuid.uuid4().hex[:16]
+
+
+class RunLog:
+
+    def __init__(self, path, schema, run_id=None, buffer_size=4096):
+        """
+        Typed append-only log of records, buffered in a fixed-size array written in blocks so that the memory stays
+        bounded during long runs. The schema is stored in a JSON sidecar file (path + ".json") and several runs can be
+        appended to the same log, each record holding the run id.
+        :param path: path of the binary log file
+        :param schema: list of (field name, numpy type) of the records
+        :param run_id: identifier of the run (by default a random one)
+        :param buffer_size: number of records buffered before a write
+        """
+        self.path = path
+        self.dtype = np.dtype(schema)
+        self.run_id = new_run_id() if run_id is None else run_id
+        self.buffer = np.zeros(buffer_size, dtype=self.dtype)
+        self.num_buffered = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        schema_path = f"{path}.json"
+        if os.path.exists(path) and os.path.exists(schema_path):
+            if np.dtype(_load_schema(schema_path)) != self.dtype:
+                raise ValueError(f"Schema of the run log {path} does not match.")
+        else:
+            with open(schema_path, "w") as f:
+                json.dump({"schema": [list(field) for field in schema]}, f)
+            open(path, "wb").close()
+
+    def append(self, **record):
+        """
+        Append a record, the run id being filled in.
+        :param record: values of the fields of the record
+        """
+        row = self.buffer[self.num_buffered]
+        row["run_id"] = self.run_id
+        for name, value in record.items():
+            row[name] = value
+        self.num_buffered += 1
+        if self.num_buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered records to the log file.
+        """
+        if self.num_buffered == 0:
+            return
+        with open(self.path, "ab") as f:
+            self.buffer[:self.num_buffered].tofile(f)
+        self.num_buffered = 0
+
+    def num_records(self):
+        """
+        :return: number of records of the log, including the buffered ones
+        """
+        return os.path.getsize(self.path) // self.dtype.itemsize + self.num_buffered
+
+    def truncate(self, num_records):
+        """
+        Drop the records after the first num_records ones, e.g. those written after a checkpoint.
+        :param num_records: number of records kept, at most the number of records of the log
+        """
+        self.flush()
+        if num_records > self.num_records():
+            raise ValueError(f"The run log {self.path} has {self.num_records()} records, it cannot be truncated to {num_records}.")
+        with open(self.path, "r+b") as f:
+            f.truncate(num_records * self.dtype.itemsize)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _load_schema(schema_path):
+    with open(schema_path) as f:
+        return [tuple(field) for field in json.load(f)["schema"]]
+
+
+def read_runlog(path, run_id=None):
+    """
+    Load a run log into a NumPy structured array.
+    :param path: path of the binary log file
+    :param run_id: only keep the records of this run (optional)
+    :return: structured array of the records
+    """
+    records = np.fromfile(path, dtype=np.dtype(_load_schema(f"{path}.json")))
+    if run_id is not None:
+        records = records[records["run_id"] == run_id.encode()]
+    return records
+
+
+def read_runlog_chunks(path, chunk_size=2**20):
+    """
+    Iterate over a run log in chunks of records, memory-mapped so that logs larger than the memory can be scanned.
+    :param path: path of the binary log file
+    :param chunk_size: number of records per chunk
+    :return: iterator over the structured arrays of the chunks, in the order of the log
+    """
+    dtype = np.dtype(_load_schema(f"{path}.json"))
+    num_records = os.path.getsize(path) // dtype.itemsize
+    if num_records == 0:
+        return
+    records = np.memmap(path, dtype=dtype, mode="r", shape=(num_records,))
+    for start in range(0, num_records, chunk_size):
+        yield np.array(records[start:start + chunk_size])
+
+
+def read_runlog_frame(path, run_id=None):
+    """
+    Load a run log into a pandas DataFrame, the string fields being decoded.
+    :param path: path of the binary log file
+    :param run_id: only keep the records of this run (optional)
+    :return: DataFrame of the records
+    """
+    import pandas as pd
+
+    records = read_runlog(path, run_id=run_id)
+    return pd.DataFrame({
+        name: np.char.decode(records[name]) if records.dtype[name].kind == "S" else records[name]
+        for name in records.dtype.names
+    })
+
+
+def test_runlog():
+    """
+    Test that the records appended to a run log over several blocks and runs are read back unchanged, whole, per run
+    and in memory-mapped chunks, and that a log is only reopened with its own schema.
+    """
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "stats.runlog")
+    rng = np.random.default_rng(0)
+    expected = []
+    for run_id in ("first", "second"):
+        with RunLog(path, STATS_SCHEMA, run_id=run_id, buffer_size=7) as runlog:
+            for iteration in range(25):
+                record = {"iteration": iteration, "type": "candidate" if iteration % 5 else "best", "mean_wait": rng.exponential(),
+                          "max_wait": rng.exponential(), "min_wait": rng.exponential(), "rate": rng.exponential()}
+                runlog.append(**record)
+                expected.append({"run_id": run_id, **record})
+            assert runlog.num_records() == len(expected)
+
+    records = read_runlog(path)
+    assert len(records) == len(expected)
+    for row, record in zip(records, expected):
+        for name, value in record.items():
+            assert row[name] == (value.encode() if isinstance(value, str) else value)
+    assert np.array_equal(read_runlog(path, run_id="second"), records[25:])
+
+    for chunk_size in (1, 10, len(records), 2**20):
+        chunks = list(read_runlog_chunks(path, chunk_size=chunk_size))
+        assert all(len(chunk) <= chunk_size for chunk in chunks)
+        assert np.array_equal(np.concatenate(chunks), records)
+
+    runlog = RunLog(path, STATS_SCHEMA)
+    runlog.truncate(30)
+    assert np.array_equal(read_runlog(path), records[:30])
+    runlog.truncate(0)
+    assert len(read_runlog(path)) == 0 and list(read_runlog_chunks(path)) == []
+    try:
+        runlog.truncate(1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A run log should not be truncated beyond its records")
+    try:
+        RunLog(path, HISTORY_SCHEMA)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A run log should not be reopened with another schema")
+
+
+if __name__ == "__main__":
+    test_runlog()
@@ -0,0 +1,281 @@
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+
+from utils import canonical_hashset
+
+
+@dataclass
+class SearchState:
+    """
+    State of the search loop of the optimization, saved in the checkpoints (see Optimization.resume).
+    :param iteration: index of the next iteration
+    :param best_hashset: best movie hashset found
+    :param best_metric: estimated metric of the best movie hashset
+    :param best_metric_mse_bootstrap: bootstrap MSE of the metric of the best movie hashset
+    :param best_record: EvaluationRecord of the best movie hashset
+    :param best_mu_CV: theoretical control variate of the best movie hashset
+    :param current_hashset: current movie hashset of the search strategy (the best one for VNS)
+    :param current_metric: estimated metric of the current movie hashset
+    :param current_mse_bootstrap: bootstrap MSE of the metric of the current movie hashset
+    :param current_record: EvaluationRecord of the current movie hashset
+    :param current_mu_CV: theoretical control variate of the current movie hashset
+    :param fct_count: index of the optimization function of the next iteration
+    :param constraint_approved: whether the last candidate checked satisfied the mean rate constraint (None if unchecked)
+    :param constraint_skips: number of candidates skipped by the mean rate constraint
+    :param tabu_list: canonical hashsets recently visited by the tabu search
+    :param incremental_seed: seed of the arrival streams of the incremental evaluation
+    :param run_id: id of the run in the run logs
+    :param stats_log_size: number of records of the statistics run log at the checkpoint
+    :param history_log_size: number of records of the history run log at the checkpoint
+    :param telemetry_size: size of the telemetry file at the checkpoint
+    """
+    iteration: int = 0
+    best_hashset: dict = None
+    best_metric: float = np.inf
+    best_metric_mse_bootstrap: float = np.inf
+    best_record: object = None
+    best_mu_CV: float = None
+    current_hashset: dict = None
+    current_metric: float = np.inf
+    current_mse_bootstrap: float = np.inf
+    current_record: object = None
+    current_mu_CV: float = None
+    fct_count: int = 0
+    constraint_approved: bool = None
+    constraint_skips: int = 0
+    tabu_list: deque = field(default_factory=deque)
+    incremental_seed: int = None
+    run_id: str = None
+    stats_log_size: int = None
+    history_log_size: int = None
+    telemetry_size: int = None
+
+    def next_move(self, num_moves):
+        """
+        Variable Neighbourhood Structure (VNS): move on cyclically to the next optimization function.
+        :param num_moves: number of optimization functions
+        """
+        self.fct_count += 1
+        if self.fct_count >= num_moves:
+            self.fct_count = 0
+
+
+@dataclass
+class Candidate:
+    """
+    Candidate of an iteration of the search and the outcome of its evaluation.
+    :param hashset: movie hashset of the candidate
+    :param record: EvaluationRecord of the candidate
+    :param mu_CV: theoretical control variate of the candidate (None without control variate)
+    :param mse_bootstrap: bootstrap MSE of the metric of the candidate
+    :param metric: estimated metric of the candidate
+    :param improved: whether the candidate is better than the current configuration
+    :param rejected: whether the racing rejected the candidate before all its replications
+    :param replications: dictionary of arrays of the replications of the candidate run during the iteration
+    :param num_simulations: number of simulations run during the iteration
+    :param num_requests: number of requests simulated during the iteration (None if unknown)
+    :param budget: number of simulations allotted to the candidate
+    :param skipped: why the candidate was not evaluated, "no_neighbour" or "constraint_skip" (None if evaluated)
+    """
+    hashset: dict = None
+    record: object = None
+    mu_CV: float = None
+    mse_bootstrap: float = np.inf
+    metric: float = np.inf
+    improved: bool = False
+    rejected: bool = False
+    replications: dict = None
+    num_simulations: int = 0
+    num_requests: int = None
+    budget: int = 0
+    skipped: str = None
+
+
+class SearchStrategy(ABC):
+    """
+    Search strategy of the optimization moving a current configuration: at each iteration the strategy proposes a
+    candidate neighbour of the current configuration, the candidate is evaluated by the evaluation engine of the
+    optimization shared by all the strategies, and the strategy accepts it or not as the new current configuration.
+    """
+
+    def excluded(self, state):
+        """
+        :param state: SearchState
+        :return: canonical hashsets which cannot be proposed (None if any neighbour can)
+        """
+        return None
+
+    def propose(self, optimization_fct, state, sample_neighbours):
+        """
+        Propose a candidate neighbour of the current configuration.
+        :param optimization_fct: optimization function generating a neighbour of the current configuration
+        :param state: SearchState
+        :param sample_neighbours: function sampling distinct neighbours out of excluded hashsets (see
+                                  Optimization._sample_neighbours)
+        :return: movie hashset of the candidate
+        """
+        return optimization_fct(best_hashset=state.current_hashset)
+
+    @abstractmethod
+    def accept(self, candidate, state):
+        """
+        Acceptance rule of an evaluated candidate as the current configuration.
+        :param candidate: evaluated Candidate
+        :param state: SearchState
+        :return: True if the candidate is accepted
+        """
+
+    def move(self, candidate, state):
+        """
+        Move the current configuration to an accepted candidate.
+        :param candidate: accepted Candidate
+        :param state: SearchState
+        """
+        state.current_hashset = candidate.hashset
+        state.current_metric = candidate.metric
+        state.current_mse_bootstrap = candidate.mse_bootstrap
+        state.current_record = candidate.record
+        state.current_mu_CV = candidate.mu_CV
+
+    def improves_best(self, candidate, accepted, state):
+        """
+        :param candidate: evaluated Candidate
+        :param accepted: whether the candidate was accepted
+        :param state: SearchState
+        :return: True if the candidate becomes the best configuration
+        """
+        return candidate.metric < state.best_metric
+
+
+class VariableNeighbourhoodSearch(SearchStrategy):
+    """
+    Variable Neighbourhood Search (VNS): only the improvements are accepted, the current configuration being the best one.
+    """
+
+    def accept(self, candidate, state):
+        return candidate.improved
+
+    def improves_best(self, candidate, accepted, state):
+        return accepted
+
+
+class SimulatedAnnealing(SearchStrategy):
+
+    def __init__(self, rng, initial_temperature=1.0, cooling_rate=0.95):
+        """
+        Simulated annealing accepting a worse candidate with the noise-aware Metropolis probability
+        exp(-delta/T - sigma^2/(2 T^2)), where sigma^2 is the variance of the estimated difference delta, which
+        compensates the acceptance of differences only worse because of the estimation noise.
+        :param rng: random generator of the optimization
+        :param initial_temperature: initial temperature (in units of the metric)
+        :param cooling_rate: geometric cooling rate of the temperature per iteration
+        """
+        self.rng = rng
+        self.initial_temperature = initial_temperature
+        self.cooling_rate = cooling_rate
+
+    def temperature(self, iteration):
+        return self.initial_temperature * self.cooling_rate**iteration
+
+    def accept(self, candidate, state):
+        if candidate.improved:
+            return True
+
+        temperature = self.temperature(state.iteration)
+        delta = candidate.metric - state.current_metric
+        noise = candidate.record.variance() / candidate.record.count + state.current_record.variance() / state.current_record.count
+        return self.rng.random() < np.exp(-delta / temperature - noise / (2 * temperature**2))
+
+
+class TabuSearch(SearchStrategy):
+    """
+    Tabu search always moving to the candidate, which is not one of the recently visited hashsets of the tabu list of
+    the SearchState (best combined with a batch of neighbours).
+    """
+
+    def excluded(self, state):
+        return state.tabu_list
+
+    def propose(self, optimization_fct, state, sample_neighbours):
+        movie_hashsets = optimization_fct(best_hashset=state.current_hashset)
+        if canonical_hashset(movie_hashsets) in state.tabu_list:
+            neighbours, _ = sample_neighbours(optimization_fct, state.current_hashset, 1, excluded=state.tabu_list)
+            movie_hashsets = neighbours[0] if len(neighbours) > 0 else movie_hashsets
+        return movie_hashsets
+
+    def accept(self, candidate, state):
+        return True
+
+    def move(self, candidate, state):
+        super().move(candidate, state)
+        state.tabu_list.append(canonical_hashset(candidate.hashset))
+
+
+def search_strategy(name, rng, initial_temperature=1.0, cooling_rate=0.95):
+    """
+    :param name: name of the search strategy, "vns", "annealing" or "tabu"
+    :param rng: random generator of the optimization
+    :param initial_temperature: initial temperature of the simulated annealing
+    :param cooling_rate: cooling rate of the simulated annealing
+    :return: SearchStrategy
+    """
+    if name == "vns":
+        return VariableNeighbourhoodSearch()
+    if name == "annealing":
+        return SimulatedAnnealing(rng, initial_temperature, cooling_rate)
+    if name == "tabu":
+        return TabuSearch()
+    raise ValueError(f"Unknown search strategy {name}.")
+
+
+def test_search():
+    """
+    Test the cyclic move index, the acceptance rules of the search strategies and the proposals of the tabu search out
+    of the tabu list.
+    """
+    from evaluation import EvaluationRecord
+
+    state = SearchState(tabu_list=deque(maxlen=2))
+    for fct_count in (1, 2, 0, 1):
+        state.next_move(3)
+        assert state.fct_count == fct_count
+
+    rng = np.random.default_rng(0)
+    records = [EvaluationRecord() for _ in range(2)]
+    for record, mean in zip(records, (10., 11.)):
+        record.update(rng.normal(mean, 1., 20), rng.normal(0., 1., 20))
+    state.current_record, state.current_metric, state.best_metric = records[0], records[0].mean(), records[0].mean()
+    worse = Candidate(hashset={0: {1, 2}}, record=records[1], metric=records[1].mean(), improved=False)
+    better = Candidate(hashset={0: {1, 3}}, record=records[1], metric=records[0].mean() - 1, improved=True)
+
+    vns = search_strategy("vns", rng)
+    assert vns.accept(better, state) and not vns.accept(worse, state)
+    assert vns.improves_best(worse, False, state) is False
+
+    state.iteration = 0
+    hot, cold = search_strategy("annealing", rng, initial_temperature=1e6), search_strategy("annealing", rng, initial_temperature=1e-3)
+    assert hot.accept(better, state) and cold.accept(better, state)
+    assert all(hot.accept(worse, state) for _ in range(20)) and not any(cold.accept(worse, state) for _ in range(20))
+    assert hot.improves_best(better, True, state) and not hot.improves_best(worse, True, state)
+
+    tabu = search_strategy("tabu", rng)
+    assert tabu.accept(worse, state)
+    tabu.move(worse, state)
+    assert state.current_hashset is worse.hashset and list(state.tabu_list) == [canonical_hashset(worse.hashset)]
+    sample_neighbours = lambda optimization_fct, hashset, batch_size, excluded: ([better.hashset], None)
+    assert tabu.propose(lambda best_hashset: worse.hashset, state, sample_neighbours) is better.hashset
+    assert tabu.propose(lambda best_hashset: better.hashset, state, None) is better.hashset
+    assert vns.excluded(state) is None and tabu.excluded(state) is state.tabu_list
+
+    try:
+        search_strategy("genetic", rng)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("An unknown search strategy should be rejected")
+
+
+if __name__ == "__main__":
+    test_search()
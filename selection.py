@@ -0,0 +1,221 @@
+import numpy as np
+from math import erf, sqrt
+
+from evaluation import EvaluationRecord
+
+
+def normal_cdf(x):
+    """
+    Cumulative distribution function of the standard normal distribution.
+    :param x: quantile
+    :return: P(Z <= x)
+    """
+    return 0.5 * (1 + erf(x / sqrt(2)))
+
+
+def probability_correct_selection(means, variances, counts):
+    """
+    Approximate probability of correct selection (Bonferroni lower bound, APCS-B) of the candidate with the lowest mean.
+    :param means: estimated mean of the statistic per candidate
+    :param variances: estimated variance of the statistic per candidate
+    :param counts: number of replications per candidate
+    :return: probability that the selected candidate is the best one
+    """
+    means, variances, counts = np.asarray(means, dtype=float), np.asarray(variances, dtype=float), np.asarray(counts, dtype=float)
+    if len(means) == 1:
+        return 1.
+    if np.any(counts < 2):
+        return 0.
+
+    b = np.argmin(means)
+    pcs = 1.
+    for i in range(len(means)):
+        if i == b:
+            continue
+        std_diff = np.sqrt(variances[i] / counts[i] + variances[b] / counts[b])
+        pcs -= normal_cdf(-(means[i] - means[b]) / std_diff) if std_diff > 0 else 0.
+    return max(pcs, 0.)
+
+
+def ocba_allocation(means, variances, counts, increment):
+    """
+    Optimal Computing Budget Allocation (OCBA) of an increment of replications for the selection of the candidate with
+    the lowest mean: N_i / N_j = (sigma_i / delta_i)^2 / (sigma_j / delta_j)^2 for i, j != b and
+    N_b = sigma_b * sqrt(sum_{i != b} N_i^2 / sigma_i^2).
+    :param means: estimated mean of the statistic per candidate
+    :param variances: estimated variance of the statistic per candidate
+    :param counts: number of replications already run per candidate
+    :param increment: number of additional replications to allocate
+    :return: number of additional replications per candidate
+    """
+    means, counts = np.asarray(means, dtype=float), np.asarray(counts, dtype=int)
+    stds = np.sqrt(np.maximum(np.asarray(variances, dtype=float), 1e-12))
+    k = len(means)
+    b = np.argmin(means)
+    if k == 1:
+        return np.array([increment])
+
+    deltas = np.maximum(means - means[b], 1e-12)
+    ratios = np.zeros(k)
+    others = np.arange(k) != b
+    ratios[others] = (stds[others] / deltas[others]) ** 2
+    ratios[b] = stds[b] * np.sqrt(np.sum(ratios[others] ** 2 / stds[others] ** 2))
+
+    # target allocation of the total budget, then allocate only to the candidates below their target
+    total = counts.sum() + increment
+    targets = total * ratios / ratios.sum()
+    additional = np.maximum(targets - counts, 0)
+    if additional.sum() == 0:
+        additional[b] = 1.
+    additional = np.floor(additional / additional.sum() * increment).astype(int)
+
+    # distribute the rounding remainder to the candidates with the largest deficit
+    remainder = increment - additional.sum()
+    for i in np.argsort(-(targets - counts - additional))[:remainder]:
+        additional[i] += 1
+    return additional
+
+
+class RankingAndSelection:
+
+    def __init__(self, evaluate_fct, method="ocba", n0=5, increment=10, pcs_target=None, rng=None):
+        """
+        Ranking-and-selection engine allocating replications adaptively to a pool of candidate movie hashsets.
+        :param evaluate_fct: function evaluating a list of hashsets with a list of numbers of replications and a seed
+                             shared by the hashsets, returning a list of EvaluationRecord (see evaluation.evaluate_batch)
+        :param method: allocation method, "ocba" (Optimal Computing Budget Allocation) or "halving" (successive halving)
+        :param n0: number of initial replications per candidate (OCBA)
+        :param increment: number of replications allocated per OCBA round
+        :param pcs_target: stop the OCBA rounds before exhausting the budget once the approximate probability of
+                           correct selection reaches this target (optional)
+        :param rng: random generator drawing the seed of each round (optional)
+        """
+        if method not in ("ocba", "halving"):
+            raise ValueError(f"Unknown ranking and selection method {method}.")
+
+        self.evaluate_fct = evaluate_fct
+        self.method = method
+        self.n0 = n0
+        self.increment = increment
+        self.pcs_target = pcs_target
+        self.rng = np.random.default_rng() if rng is None else rng
+
+    def __call__(self, hashsets, budget, records=None, estimate_fct=None):
+        """
+        Select the candidate with the lowest expected statistic.
+        :param hashsets: list of candidate movie hashsets
+        :param budget: total number of additional replications
+        :param records: EvaluationRecord per candidate holding the replications already run (optional), updated in-place
+        :param estimate_fct: function estimating the statistic of a candidate from its index and record (optional, by
+                             default the Monte-Carlo mean)
+        :return: index of the selected candidate, records per candidate and approximate probability of correct selection
+        """
+        records = [EvaluationRecord() for _ in hashsets] if records is None else records
+        estimate_fct = (lambda idx, record: record.mean()) if estimate_fct is None else estimate_fct
+
+        if self.method == "ocba":
+            contenders = self._ocba(hashsets, budget, records, estimate_fct)
+        else:
+            contenders = self._successive_halving(hashsets, budget, records, estimate_fct)
+
+        means = [estimate_fct(idx, record) for idx, record in enumerate(records)]
+        pcs = probability_correct_selection(means, [record.variance() for record in records], [record.count for record in records])
+
+        return min(contenders, key=lambda idx: means[idx]), records, pcs
+
+    def _evaluate(self, hashsets, records, num_simulations):
+        """
+        Run additional replications for the candidates with a seed shared by the candidates of the round.
+        :param hashsets: list of candidate movie hashsets
+        :param records: EvaluationRecord per candidate, updated in-place
+        :param num_simulations: number of additional replications per candidate
+        :return: number of replications run
+        """
+        idx = [i for i, n in enumerate(num_simulations) if n > 0]
+        if len(idx) == 0:
+            return 0
+
+        seed = int(self.rng.integers(2**31))
+        new_records = self.evaluate_fct([hashsets[i] for i in idx], [int(num_simulations[i]) for i in idx], seed)
+        for i, new_record in zip(idx, new_records):
+            records[i].merge(new_record)
+        return int(sum(num_simulations[i] for i in idx))
+
+    def _ocba(self, hashsets, budget, records, estimate_fct):
+        """
+        Sequential OCBA: initial replications, then rounds of increment replications allocated to the contenders.
+        :return: indices of the candidates eligible for selection
+        """
+        # initial stage (at least two replications to estimate the variances)
+        n0 = max(self.n0, 2)
+        spent = self._evaluate(hashsets, records, [max(n0 - record.count, 0) for record in records])
+
+        while spent < budget:
+            increment = min(self.increment, budget - spent)
+            means = [estimate_fct(idx, record) for idx, record in enumerate(records)]
+            variances = [record.variance() for record in records]
+            counts = [record.count for record in records]
+            if self.pcs_target is not None and probability_correct_selection(means, variances, counts) >= self.pcs_target:
+                break
+
+            additional = ocba_allocation(means, variances, counts, increment)
+            spent += self._evaluate(hashsets, records, additional)
+
+        return list(range(len(hashsets)))
+
+    def _successive_halving(self, hashsets, budget, records, estimate_fct):
+        """
+        Successive halving: the budget is split evenly over log2(k) rounds, the surviving candidates share the budget of
+        a round and the worse half is dropped after each round.
+        :return: indices of the surviving candidates
+        """
+        active = list(range(len(hashsets)))
+        num_rounds = max(int(np.ceil(np.log2(len(hashsets)))), 1)
+
+        spent = 0
+        for r in range(num_rounds):
+            n_r = max((budget - spent) // (num_rounds - r) // len(active), 2)
+            num_simulations = [n_r if idx in active else 0 for idx in range(len(hashsets))]
+            spent += self._evaluate(hashsets, records, num_simulations)
+
+            # keep the better half of the candidates
+            active = sorted(active, key=lambda idx: estimate_fct(idx, records[idx]))[:int(np.ceil(len(active) / 2))]
+            if len(active) == 1 or spent >= budget:
+                break
+
+        return active
+
+
+def test_selection():
+    """
+    Test that the OCBA allocation spends exactly its increment and favours the competitor closest to the best candidate,
+    and that both ranking-and-selection methods pick the best of synthetic candidates within the budget.
+    """
+    for increment in (1, 7, 10, 100):
+        additional = ocba_allocation([1., 1.2, 3., 5.], [1., 1., 1., 1.], [5, 5, 5, 5], increment)
+        assert additional.sum() == increment and np.all(additional >= 0)
+    additional = ocba_allocation([1., 1.2, 3., 5.], [1., 1., 1., 1.], [5, 5, 5, 5], 100)
+    assert additional[1] > additional[2] >= additional[3], "The close competitor should get more replications"
+
+    true_means = [3., 1., 1.5, 4., 6.]
+
+    def evaluate_fct(hashsets, num_simulations, seed):
+        rng = np.random.default_rng(seed)
+        records = []
+        for idx, n in zip(hashsets, num_simulations):
+            record = EvaluationRecord()
+            X = rng.normal(true_means[idx], 1., size=n)
+            record.update(X, np.zeros(n))
+            records.append(record)
+        return records
+
+    for method in ("ocba", "halving"):
+        ranking_and_selection = RankingAndSelection(evaluate_fct, method=method, rng=np.random.default_rng(0))
+        idx_selected, records, pcs = ranking_and_selection(list(range(len(true_means))), budget=300)
+        assert idx_selected == 1
+        assert sum(record.count for record in records) <= 300
+        assert 0. <= pcs <= 1.
+
+
+if __name__ == "__main__":
+    test_selection()
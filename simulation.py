@@ -1,11 +1,11 @@
 from typing import List
 import numpy as np
-import matplotlib.pyplot as plt
 
 from request import Request
 from group import Group
 from storage import Storage
 from constants import GROUP_IDS, STORAGE_IDS, INITIAL_MOVIE_HASHSET
+import profiling
 
 
 class Simulation():
@@ -23,27 +23,76 @@ class Simulation():
         # generate requests
         requests = []
 
-        for group_id in GROUP_IDS:
-            group = Group(group_id=group_id)
-            requests.extend(group.generate_requests_batch(movie_hashsets) if batch else group.generate_requests(movie_hashsets))
+        with profiling.phase("simulation.generate"):
+            for group_id in sorted(GROUP_IDS):  # fixed order so that seeded runs are reproducible across processes
+                group = Group(group_id=group_id)
+                requests.extend(group.generate_requests_batch(movie_hashsets) if batch else group.generate_requests(movie_hashsets))
+        profiling.count("simulation.requests", len(requests))
         # print(requests)
 
         # sort requests by storage location
-        requests_sorted = {id: [] for id in STORAGE_IDS}  
-        for request in requests:
-            requests_sorted[request.storage_id].append(request)
+        with profiling.phase("simulation.route"):
+            requests_sorted = {id: [] for id in sorted(STORAGE_IDS)}
+            for request in requests:
+                requests_sorted[request.storage_id].append(request)
 
         # simulate storage
-        storage = Storage()
-        for storage_id, r_ in requests_sorted.items():
-            if len(r_) > 0:
-                requests_sorted[storage_id] = storage.process(r_)
+        with profiling.phase("simulation.queue"):
+            storage = Storage()
+            for storage_id, r_ in requests_sorted.items():
+                if len(r_) > 0:
+                    requests_sorted[storage_id] = storage.process(r_)
 
         requests = []
         for r_ in requests_sorted.values():
             requests.extend(r_)
         return requests
 
+    def run_steady_state(self, movie_hashsets=INITIAL_MOVIE_HASHSET, interval=1, horizon=36000, chunk_duration=1200) -> np.ndarray:
+        """
+        Run a single long simulation at the fixed request rates of one time interval. The run is streamed in chunks of
+        chunk_duration: each chunk is generated, processed with the queue state carried over from the previous chunk and
+        reduced to its waiting times, so that only one chunk of requests is held in memory at a time.
+        :param movie_hashsets: movie hashset defining the storage configuration (by default the initial configuration)
+        :param interval: index of the time interval whose request rates are used
+        :param horizon: total simulated time
+        :param chunk_duration: duration of a streamed chunk
+        :return: waiting times of the processed requests ordered by creation time
+        """
+        storage = Storage()
+        time_free = {storage_id: -np.inf for storage_id in STORAGE_IDS}  # time at which each node becomes idle
+        pending = {storage_id: [] for storage_id in STORAGE_IDS}  # requests arriving after the end of their chunk
+
+        waiting_times = []
+        for chunk_start in np.arange(0, horizon, chunk_duration):
+            chunk_end = min(chunk_start + chunk_duration, horizon)
+            last_chunk = chunk_end >= horizon
+
+            requests_sorted = {storage_id: pending[storage_id] for storage_id in sorted(STORAGE_IDS)}
+            for group_id in sorted(GROUP_IDS):
+                group = Group(group_id=group_id)
+                for request in group.generate_requests_stationary(movie_hashsets, interval, chunk_start, chunk_end, time_end=horizon):
+                    requests_sorted[request.storage_id].append(request)
+
+            # only process the requests which arrived before the end of the chunk to keep the FCFS order across chunks
+            processed = []
+            for storage_id, r_ in requests_sorted.items():
+                pending[storage_id] = [] if last_chunk else [r for r in r_ if r.time_arrived > chunk_end]
+                r_ = r_ if last_chunk else [r for r in r_ if r.time_arrived <= chunk_end]
+                if len(r_) == 0:
+                    continue
+
+                r_ = storage.process(r_, time_free=time_free[storage_id])
+                handled = [r.time_handled for r in r_ if r.to_be_processed]
+                if len(handled) > 0:
+                    time_free[storage_id] = max(handled)
+                processed.extend(r for r in r_ if r.to_be_processed)
+
+            processed.sort(key=lambda r: r.time_creation)
+            waiting_times.append(np.array([r.get_waiting_time() for r in processed]))
+
+        return np.concatenate(waiting_times) if waiting_times else np.array([])
+
 
 def test_simulation():
     # Parameters
@@ -72,28 +121,41 @@ def test_simulation():
         median_waiting_times.append(np.median(waiting_times))
 
     # plot max, mean, and median waiting times
-    fig, axes = plt.subplots(3, 1, figsize=(10, 15))
-
-    ax = axes[0]
-    ax.hist(max_waiting_times, bins=20, color='skyblue', edgecolor='black')
-    ax.set_title('Histogram of Maximum Waiting Times per Run')
-    ax.set_xlabel('Maximum Waiting Time (s)')
-    ax.set_ylabel('Frequency')
-
-    ax = axes[1]
-    ax.hist(mean_waiting_times, bins=20, color='skyblue', edgecolor='black')
-    ax.set_title('Histogram of Mean Waiting Times per Run')
-    ax.set_xlabel('Mean Waiting Time (s)')
-    ax.set_ylabel('Frequency')
-
-    ax = axes[2]
-    ax.hist(median_waiting_times, bins=20, color='skyblue', edgecolor='black')
-    ax.set_title('Histogram of Median Waiting Times per Run')
-    ax.set_xlabel('Median Waiting Time (s)')
-    ax.set_ylabel('Frequency')
+    from plotting import plot_run_histograms
+    plot_run_histograms(max_waiting_times, mean_waiting_times, median_waiting_times)
+
+def test_steady_state():
+    """
+    Test that the single-run steady-state estimate of a stable time interval agrees with the estimate of independent
+    replications, and that a run too short for the batch means is rejected.
+    """
+    import random
+    from stats import Stats
+
+    np.random.seed(0)
+    random.seed(0)
+    simulation = Simulation()
 
-    plt.tight_layout()
-    plt.show()
+    mean, half_width, _ = Stats.steady_state_estimate(simulation.run_steady_state(interval=0, horizon=36000))
+
+    num_replications = 10
+    replication_means = []
+    for _ in range(num_replications):
+        waiting_times = simulation.run_steady_state(interval=0, horizon=7200)
+        replication_means.append(np.mean(waiting_times[Stats.mser_truncation(waiting_times):]))
+    replication_mean = np.mean(replication_means)
+    replication_half_width = (Stats.student_t_quantile(0.975, num_replications - 1)
+                              * np.std(replication_means, ddof=1) / np.sqrt(num_replications))
+    assert abs(mean - replication_mean) <= half_width + replication_half_width, \
+        "Steady-state estimate should agree with the replication estimate"
+
+    try:
+        Stats.steady_state_estimate(simulation.run_steady_state(interval=0, horizon=5))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A run shorter than the number of batches should be rejected")
 
 if __name__ == "__main__":
     test_simulation()
+    test_steady_state()
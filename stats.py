@@ -1,7 +1,6 @@
 import numpy as np
-import os
-import matplotlib.pyplot as plt
 from request import Request
+import profiling
 
 class Stats:
     def __init__(self, requests):
@@ -17,6 +16,7 @@ class Stats:
         # print(f"Requests identified as processed: {len(self.requests)}\n")
         # print(f"First 5 processed request status: {[req.processed for req in self.requests[:5]]}")
 
+    @profiling.timed("stats.waiting_time")
     def get_waiting_time(self):
         """Returns the waiting times as a NumPy array."""
         return np.array([req.get_waiting_time() for req in self.requests])
@@ -42,6 +42,7 @@ class Stats:
         exp_decay = np.exp(-decay_rate * (waiting_times - critical_wait_time))
         return exp_decay / (1 + exp_decay)
 
+    @profiling.timed("stats.bootstrap")
     def mse_bootstrap(self, f_statistic, num_bootstrap=10000, tolerance=0.05):
         """ Calculates the bootstrap MSE of a statistic of choice and returns the bootstrap statistics.
 
@@ -79,122 +80,132 @@ class Stats:
         
         return mse_bootstrap, n_simulations
 
-# Independent function to plot histograms
-# This function is not part of the Stats class and is used for plotting
-def plot_comparison_histogram(
-    baseline_data, optimized_data, title, xlabel, bins=20
-):
-    """
-    Plot a histogram comparing baseline and optimized simulation statistics.
-
-    Args:
-        baseline_data (list or np.array): Data from baseline configuration.
-        optimized_data (list or np.array): Data from optimized configuration.
-        title (str): Plot title.
-        xlabel (str): Label for the x-axis.
-        bins (int): Number of histogram bins.
-    """
-    # plt.figure(figsize=(8, 6))
-    # plt.hist(baseline_data, bins=bins, alpha=0.6, label='Baseline', color='skyblue', edgecolor='black')
-    # plt.hist(optimized_data, bins=bins, alpha=0.6, label='Optimized', color='salmon', edgecolor='black')
-    # plt.title(title, fontsize=24)
-    # plt.xlabel(xlabel, fontsize=18)
-    # plt.ylabel('Frequency', fontsize=18)
-    # plt.xticks(fontsize=14)
-    # plt.yticks(fontsize=14)
-    # plt.legend(fontsize=18)
-    # plt.grid(True)
-    # # Create 'Plots' folder if it doesn't exist
-    # os.makedirs("Plots", exist_ok=True)
-    # # Save the plot with a unique filename based on the title
-    # filename = title.lower().replace(" ", "_") + ".png"
-    # filepath = os.path.join("Plots", filename)
-    # plt.savefig(filepath, bbox_inches='tight')
-    # plt.show()
-    # # plt.show(block=False) # Shows the plot without blocking the script
-    # # plt.close()
-
-
-    # plt.figure(figsize=(8, 6))
-
-    # # Compute histograms manually
-    # counts_baseline, bins_baseline = np.histogram(baseline_data, bins=bins)
-    # counts_optimized, bins_optimized = np.histogram(optimized_data, bins=bins)
-
-    # # Compute bin centers
-    # bin_centers = 0.5 * (bins_baseline[1:] + bins_baseline[:-1])
-    # width = (bins_baseline[1] - bins_baseline[0]) * 0.4
-
-    # # Plot side-by-side bars
-    # plt.bar(bin_centers - width/2, counts_baseline, width=width, alpha=0.7, label='Baseline', color='skyblue', edgecolor='black')
-    # plt.bar(bin_centers + width/2, counts_optimized, width=width, alpha=0.7, label='Optimized', color='salmon', edgecolor='black')
-
-    # plt.title(title, fontsize=24)
-    # plt.xlabel(xlabel, fontsize=18)
-    # plt.ylabel("Frequency", fontsize=18)
-    # plt.xticks(fontsize=14)
-    # plt.yticks(fontsize=14)
-    # plt.legend(fontsize=18)
-    # plt.grid(True)
-
-    # os.makedirs("Plots", exist_ok=True)
-    # filename = title.lower().replace(" ", "_") + ".png"
-    # plt.savefig(os.path.join("Plots", filename), bbox_inches='tight')
-    # plt.show()
-
-    fig, axes = plt.subplots(1, 2, figsize=(14, 6), sharey=True)
-
-    # Plot baseline
-    axes[0].hist(baseline_data, bins=bins, color='skyblue', edgecolor='black')
-    axes[0].set_title("1st Baseline", fontsize=18)
-    axes[0].set_xlabel(xlabel, fontsize=14)
-    axes[0].set_ylabel("Frequency", fontsize=14)
-    axes[0].tick_params(axis='both', labelsize=12)
-    axes[0].grid(True)
-
-    # Plot optimized
-    axes[1].hist(optimized_data, bins=bins, color='salmon', edgecolor='black')
-    axes[1].set_title("Optimized", fontsize=18)
-    axes[1].set_xlabel(xlabel, fontsize=14)
-    axes[1].tick_params(axis='both', labelsize=12)
-    axes[1].grid(True)
-
-    # Overall title
-    fig.suptitle(title, fontsize=24)
-    plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-
-    # Save in 'Plots' folder
-    os.makedirs("Plots", exist_ok=True)
-    filename = title.lower().replace(" ", "_") + ".png"
-    filepath = os.path.join("Plots", filename)
-    plt.savefig(filepath, bbox_inches='tight')
-    plt.show()
-
-# Independent function to plot a single histogram (Baseline only)
-def plot_baseline_histogram(data, title, xlabel, bins=20):
-    """
-    Plot a histogram for baseline simulation statistics.
-
-    Args:
-        data (list or np.array): Data from baseline configuration.
-        title (str): Plot title.
-        xlabel (str): Label for the x-axis.
-        bins (int): Number of histogram bins.
-    """
-    plt.figure(figsize=(8, 6))
-    plt.hist(data, bins=bins, alpha=0.7, color='skyblue', edgecolor='black', label='Baseline')
-    plt.title(title, fontsize=24)
-    plt.xlabel(xlabel, fontsize=18)
-    plt.ylabel('Frequency', fontsize=18)
-    plt.xticks(fontsize=14)
-    plt.yticks(fontsize=14)
-    plt.legend(fontsize=18)
-    plt.grid(True)
-    # Create 'Plots' folder if it doesn't exist
-    os.makedirs("Plots", exist_ok=True)
-    # Save the plot with a unique filename based on the title
-    filename = "baseline_" + title.lower().replace(" ", "_") + ".png"
-    filepath = os.path.join("Plots", filename)
-    plt.savefig(filepath, bbox_inches='tight')
-    plt.show()
+    @staticmethod
+    def student_t_quantile(probability, df):
+        """ Calculates the quantile of the Student t distribution with an integer number of degrees of freedom, by
+        bisection on its closed-form CDF (Abramowitz and Stegun 26.7.3 and 26.7.4), without SciPy.
 
+        Args:
+            probability (float): Probability of the quantile, in (0, 1).
+            df (int): Number of degrees of freedom (at least 1).
+
+        Returns:
+            float: The value t such that P(T <= t) = probability.
+        """
+        def cdf(t):
+            theta = np.arctan(t / np.sqrt(df))
+            sin, cos = np.sin(theta), np.cos(theta)
+            if df % 2 == 1:
+                term, total = cos, (cos if df > 1 else 0.0)
+                for k in range(1, (df - 1) // 2):
+                    term *= cos ** 2 * 2 * k / (2 * k + 1)
+                    total += term
+                a = 2 / np.pi * (theta + sin * total)
+            else:
+                term, total = 1.0, 1.0
+                for k in range(1, df // 2):
+                    term *= cos ** 2 * (2 * k - 1) / (2 * k)
+                    total += term
+                a = sin * total
+            return (1 + a) / 2
+
+        if not 0 < probability < 1:
+            raise ValueError("The probability of the quantile must be in (0, 1).")
+        low, high = -1.0, 1.0
+        while cdf(low) > probability:
+            low *= 2
+        while cdf(high) < probability:
+            high *= 2
+        for _ in range(100):
+            middle = (low + high) / 2
+            if cdf(middle) < probability:
+                low = middle
+            else:
+                high = middle
+        return float((low + high) / 2)
+
+    @staticmethod
+    def mser_truncation(waiting_times, batch_size=5):
+        """ Detects the end of the warm-up period with the MSER-m rule: the series is averaged over batches of
+        batch_size observations and the truncation point minimizing the marginal standard error of the remaining
+        batches is selected among the first half of the series.
+
+        Args:
+            waiting_times (np.array): Waiting times of a single run ordered by creation time.
+            batch_size (int): Number of observations averaged before applying the rule (m in MSER-m).
+
+        Returns:
+            int: Number of observations to discard from the start of the series.
+        """
+        n_batches = len(waiting_times) // batch_size
+        if n_batches < 2:
+            return 0
+
+        batch_means = np.asarray(waiting_times[:n_batches * batch_size]).reshape(n_batches, batch_size).mean(axis=1)
+
+        # MSER statistic sum_{i>d} (x_i - mean_d)^2 / (n-d)^2 for each truncation d, using suffix sums
+        suffix_count = np.arange(n_batches, 0, -1)
+        suffix_sum = np.cumsum(batch_means[::-1])[::-1]
+        suffix_sum_sq = np.cumsum(batch_means[::-1] ** 2)[::-1]
+        mser = (suffix_sum_sq - suffix_sum ** 2 / suffix_count) / suffix_count ** 2
+
+        d = int(np.argmin(mser[:n_batches // 2]))
+        return d * batch_size
+
+    @staticmethod
+    def batch_means(waiting_times, num_batches=30):
+        """ Calculates the batch means estimate of the steady-state mean waiting time and its 95% CI half-width,
+        using the Student t quantile with num_batches - 1 degrees of freedom since the batch means are few.
+
+        Args:
+            waiting_times (np.array): Waiting times of a single (truncated) run ordered by creation time.
+            num_batches (int): Number of non-overlapping batches.
+
+        Returns:
+            tuple: A tuple containing:
+                - mean (float): The batch means estimate.
+                - half_width (float): The 95% CI half-width of the estimate.
+                - batch_size (int): The number of observations per batch.
+
+        Raises:
+            ValueError: If there are fewer than two batches or fewer observations than batches.
+        """
+        if num_batches < 2:
+            raise ValueError("At least two batches are needed to compute the batch means half-width.")
+        batch_size = len(waiting_times) // num_batches
+        if batch_size == 0:
+            raise ValueError("Not enough waiting times to compute the batch means.")
+
+        batch_means = np.asarray(waiting_times[:num_batches * batch_size]).reshape(num_batches, batch_size).mean(axis=1)
+        mean = float(np.mean(batch_means))
+        t_quantile = Stats.student_t_quantile(0.975, num_batches - 1)
+        half_width = float(t_quantile * np.std(batch_means, ddof=1) / np.sqrt(num_batches))
+
+        return mean, half_width, batch_size
+
+    @staticmethod
+    def steady_state_estimate(waiting_times, num_batches=30, mser_batch_size=5):
+        """ Estimates the steady-state mean waiting time from a single long run (see Simulation.run_steady_state):
+        the warm-up period is truncated with MSER and the remaining series is used for batch means.
+
+        Args:
+            waiting_times (np.array): Waiting times of a single run ordered by creation time.
+            num_batches (int): Number of non-overlapping batches.
+            mser_batch_size (int): Batch size used by the MSER truncation rule.
+
+        Returns:
+            tuple: A tuple containing:
+                - mean (float): The steady-state mean waiting time estimate.
+                - half_width (float): The 95% CI half-width of the estimate.
+                - truncation (int): The number of warm-up observations discarded.
+
+        Raises:
+            ValueError: If the truncated series has fewer observations than batches.
+        """
+        truncation = Stats.mser_truncation(waiting_times, batch_size=mser_batch_size)
+        if len(waiting_times) - truncation < num_batches:
+            raise ValueError(f"Only {len(waiting_times) - truncation} waiting times after the warm-up period for "
+                             f"{num_batches} batches, increase the horizon of the run.")
+        mean, half_width, _ = Stats.batch_means(waiting_times[truncation:], num_batches=num_batches)
+
+        return mean, half_width, truncation
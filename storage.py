@@ -14,12 +14,14 @@ class Storage:
         self.min_serve = BOUND_SERVE_TIME[0]
         self.max_serve = BOUND_SERVE_TIME[1]
 
-    def process(self, requests:List[Request]):
+    def process(self, requests:List[Request], time_free=-np.inf):
         """
         Simulate the queue of requests by processing in-place the request (handling and serving) by order of arrival
         on a First-Come-First-Served basis. In particular, draw Delta t_handle ~ Exp(lambda_handle) and
         Delta t_serve ~ mu(group, movie) + U(min_serve, max_serve) for each request.
         :param: requests (list<Request>): list of requests to be processed
+        :param: time_free (float): time at which the node finishes handling earlier requests, used to carry the queue
+                                   over consecutive batches of a streamed run (by default the node is idle)
         :return: arrival_sorted_requests (list<Request>): list of requests sorted by arrival time
         """
         n_request = len(requests)
@@ -32,13 +34,29 @@ class Storage:
         deltas_time_handle = np.random.exponential(scale=STORAGE_HANDLE_TIME_BETA, size=n_request)  # generate in batch for efficiency
         deltas_time_serve_random = np.random.uniform(self.min_serve, self.max_serve, size=n_request)  # generate in batch for efficiency
 
-        process_start_time = arrival_sorted_requests[0].time_arrived
-        for request, delta_time_handle, delta_time_serve_random in zip(arrival_sorted_requests, deltas_time_handle, deltas_time_serve_random):
-            process_start_time = max(process_start_time, request.time_arrived)  # wait until the next request arrives
-            if request.to_be_processed:  # check if request is within processing time
-                request.time_handled = process_start_time + delta_time_handle
-                request.time_served = request.time_handled + request.time_movie_service + delta_time_serve_random
-
-                process_start_time = request.time_handled # process the next request at handling time
+        # the requests arriving after the processing horizon are last in the order of arrival
+        processed_requests = [request for request in arrival_sorted_requests if request.to_be_processed]
+        n_processed = len(processed_requests)
+        times_handled = fcfs_handling_times([request.time_arrived for request in processed_requests], deltas_time_handle[:n_processed], time_free=time_free)
+        for request, time_handled, delta_time_serve_random in zip(processed_requests, times_handled.tolist(), deltas_time_serve_random[:n_processed]):
+            request.time_handled = time_handled
+            request.time_served = request.time_handled + request.time_movie_service + delta_time_serve_random
 
         return arrival_sorted_requests
+
+
+def fcfs_handling_times(times_arrived, deltas_time_handle, time_free=-np.inf):
+    """
+    Lindley recursion of a First-Come-First-Served node: each request is handled once it has arrived and the node is
+    free, the next request being handled from the handling time of the previous one. Shared by Storage.process and the
+    incremental evaluator (see incremental.py) so that both queue the requests identically.
+    :param times_arrived: arrival times of the requests sorted by arrival
+    :param deltas_time_handle: handling durations of the requests
+    :param time_free: time at which the node finishes handling earlier requests (by default the node is idle)
+    :return: array of the handling times of the requests
+    """
+    times_handled = np.empty(len(deltas_time_handle))
+    for k, (time_arrived, delta_time_handle) in enumerate(zip(np.asarray(times_arrived, dtype=float).tolist(), np.asarray(deltas_time_handle, dtype=float).tolist())):
+        time_free = max(time_free, time_arrived) + delta_time_handle
+        times_handled[k] = time_free
+    return times_handled
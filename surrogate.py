@@ -0,0 +1,181 @@
+import numpy as np
+
+from request import Request
+from constants import GROUP_IDS, STORAGE_IDS, TIME_INTERVALS, GROUP_ACTIVITIES, GROUP_MOVIE_POPULARITIES, \
+    STORAGE_HANDLE_TIME_BETA, BOUND_SERVE_TIME
+from utils import mean_request_rate_array, group_movie_to_storage_map, STORAGE_INDEX
+
+# The storage node is busy only while handling a request (Delta t_handle ~ Exp(1/beta)), the transmission and serving
+# times are pure delays added to the waiting time. Each node and interval is thus approximated by an M/G/1 queue whose
+# service time is the handling time, with E[S] = beta and E[S^2] = 2 beta^2.
+HANDLING_RATE = 1 / STORAGE_HANDLE_TIME_BETA
+HANDLING_SECOND_MOMENT = 2 * STORAGE_HANDLE_TIME_BETA ** 2
+
+
+def _delay_time(group_id, movie_id, storage_id):
+    """
+    Deterministic part of the waiting time of a request (transmission time and movie serving time).
+    :param group_id: group of the request
+    :param movie_id: movie requested
+    :param storage_id: storage node serving the request
+    :return: transmission time + serving time
+    """
+    request = Request(group_id=group_id, movie_id=movie_id, storage_id=storage_id, time_creation=0)
+    return request.time_request_send + request.time_movie_service
+
+
+def mean_delay_time(movies_hashsets):
+    """
+    Computes the mean delay (transmission, serving and uniform serving times) of the requests per storage node and time
+    interval, weighted by the request rates of the groups and movies routed to the node.
+    :param movies_hashsets: movie hashset defining the storage configuration
+    :return: mean delay per storage node for each time interval (storage node x time interval)
+    """
+    routing = group_movie_to_storage_map(movies_hashsets)
+    weighted_delay = {storage_id: np.zeros(len(TIME_INTERVALS)) for storage_id in STORAGE_IDS}
+    weights = {storage_id: np.zeros(len(TIME_INTERVALS)) for storage_id in STORAGE_IDS}
+
+    for group_id in GROUP_IDS:
+        popularities = GROUP_MOVIE_POPULARITIES[group_id]
+        total_popularity = sum(popularities.values())
+        for movie_id, popularity in popularities.items():
+            storage_id = routing[group_id][movie_id]
+            rates = np.array(GROUP_ACTIVITIES[group_id]) * popularity / total_popularity
+            weighted_delay[storage_id] += rates * _delay_time(group_id, movie_id, storage_id)
+            weights[storage_id] += rates
+
+    mean_serve_random = np.mean(BOUND_SERVE_TIME)
+    return {storage_id: np.divide(weighted_delay[storage_id], weights[storage_id], out=np.zeros(len(TIME_INTERVALS)), where=weights[storage_id] > 0) + mean_serve_random for storage_id in STORAGE_IDS}
+
+
+def queue_waiting_time(request_rates):
+    """
+    Approximates the mean time spent in the queue of a node over consecutive time intervals. Within an interval, the
+    stationary Pollaczek-Khinchine waiting time Wq = lambda E[S^2] / (2 (1 - rho)) is capped by the transient growth of
+    an initially empty queue in heavy traffic, and the backlog carried between intervals is drained (or accumulated if
+    rho >= 1) following a fluid approximation.
+    :param request_rates: request rate of the node for each time interval
+    :return: mean queueing time for each time interval
+    """
+    waiting_times = np.zeros(len(TIME_INTERVALS))
+    backlog = 0.  # number of requests queued at the start of the interval
+
+    for interval, (t_start, t_end) in enumerate(TIME_INTERVALS):
+        duration = t_end - t_start
+        rate = request_rates[interval]
+        rho = rate / HANDLING_RATE
+
+        # stationary term, capped by the expected growth of a reflected random walk over the interval
+        transient_cap = 2 / 3 * np.sqrt(2 * (rate + HANDLING_RATE) * duration / np.pi) / HANDLING_RATE
+        stationary = rate * HANDLING_SECOND_MOMENT / (2 * (1 - rho)) if rho < 1 else np.inf
+        stationary = min(stationary, transient_cap)
+
+        # fluid term of the backlog carried from the previous interval
+        if rho < 1:
+            drain_time = min(backlog / (HANDLING_RATE - rate), duration) if backlog > 0 else 0.
+            backlog_end = backlog - (HANDLING_RATE - rate) * drain_time
+            fluid = drain_time / duration * (backlog + backlog_end) / 2 / HANDLING_RATE
+        else:
+            backlog_end = backlog + (rate - HANDLING_RATE) * duration
+            fluid = (backlog + backlog_end) / 2 / HANDLING_RATE
+
+        waiting_times[interval] = stationary + fluid
+        backlog = backlog_end
+
+    return waiting_times
+
+
+def surrogate_waiting_time(movies_hashsets):
+    """
+    Analytic approximation of the expected mean waiting time of a movie hashset: per storage node and time interval,
+    the mean queueing time (see queue_waiting_time) plus the mean handling time and delays, weighted by the request rates.
+    :param movies_hashsets: movie hashset defining the storage configuration
+    :return: approximate mean waiting time
+    """
+    mean_request_rate = mean_request_rate_array(movies_hashsets)
+    delays = mean_delay_time(movies_hashsets)
+    durations = np.array([t_end - t_start for t_start, t_end in TIME_INTERVALS])
+
+    total_wait, total_requests = 0., 0.
+    for storage_id in STORAGE_IDS:
+        rates = mean_request_rate[STORAGE_INDEX[storage_id]]
+        waiting_times = queue_waiting_time(rates) + STORAGE_HANDLE_TIME_BETA + delays[storage_id]
+        total_wait += np.sum(rates * durations * waiting_times)
+        total_requests += np.sum(rates * durations)
+
+    return total_wait / total_requests
+
+
+def screen(hashsets, fraction):
+    """
+    Ranks movie hashsets by their surrogate mean waiting time and keeps the top fraction.
+    :param hashsets: list of movie hashsets
+    :param fraction: fraction of hashsets kept (at least one)
+    :return: indices of the kept hashsets, by increasing surrogate mean waiting time
+    """
+    surrogates = [surrogate_waiting_time(movie_hashsets) for movie_hashsets in hashsets]
+    num_kept = max(int(np.ceil(fraction * len(hashsets))), 1)
+    return list(np.argsort(surrogates)[:num_kept])
+
+
+def _ranks(x):
+    ranks = np.empty(len(x))
+    ranks[np.argsort(x)] = np.arange(len(x))
+    return ranks
+
+
+def calibration_report(hashsets, num_simulations=10, seed=0, n_workers=1, print_results=True):
+    """
+    Compares the surrogate to the simulated mean waiting time over a set of movie hashsets.
+    :param hashsets: list of movie hashsets
+    :param num_simulations: number of simulations per hashset
+    :param seed: seed shared by the simulations of the hashsets
+    :param n_workers: number of worker processes
+    :param print_results: whether to print the report
+    :return: dictionary of the surrogate and simulated means per hashset, the 95% CI half-width of the simulated means,
+             the bias, the root mean squared error and the Spearman rank correlation
+    """
+    from evaluation import evaluate_batch
+
+    surrogates = np.array([surrogate_waiting_time(movie_hashsets) for movie_hashsets in hashsets])
+    records = evaluate_batch(hashsets, num_simulations, metric_fct=np.mean, seed=seed, n_workers=n_workers)
+    simulated = np.array([record.mean() for record in records])
+
+    errors = surrogates - simulated
+    report = {
+        "surrogate": surrogates,
+        "simulated": simulated,
+        "half_width": np.array([record.half_width() for record in records]),
+        "bias": float(np.mean(errors)),
+        "rmse": float(np.sqrt(np.mean(errors ** 2))),
+        "spearman": float(np.corrcoef(_ranks(surrogates), _ranks(simulated))[0, 1]) if len(hashsets) > 1 else np.nan,
+    }
+
+    if print_results:
+        for movie_hashsets, surrogate, mean, half_width in zip(hashsets, surrogates, simulated, report["half_width"]):
+            print(f"surrogate {surrogate:8.3f} | simulated {mean:8.3f} ± {half_width:.3f} : {movie_hashsets}")
+        print(f"Bias: {report['bias']:.3f}, RMSE: {report['rmse']:.3f}, Spearman rank correlation: {report['spearman']:.3f}")
+
+    return report
+
+
+def test_surrogate():
+    """
+    Test that the Pollaczek-Khinchine surrogate ranks a few hashsets with clearly different loads of the alternative
+    storage nodes in the same order as the simulation.
+    """
+    hashsets = [
+        {"MSN": set(range(10)), "ASN1": {2, 3, 9}, "ASN2": {2, 3, 9}},
+        {"MSN": set(range(10)), "ASN1": set(), "ASN2": set()},
+        {"MSN": set(range(10)), "ASN1": {2}, "ASN2": {3}},
+        {"MSN": set(range(10)), "ASN1": {0, 1}, "ASN2": {7, 8}},
+        {"MSN": set(range(10)), "ASN1": {2, 3}, "ASN2": {9}},
+    ]
+    report = calibration_report(hashsets, num_simulations=10, seed=0)
+    assert list(np.argsort(report["surrogate"])) == list(np.argsort(report["simulated"])), \
+        "Surrogate should rank the hashsets as the simulation"
+    assert np.isclose(report["spearman"], 1.)
+
+
+if __name__ == "__main__":
+    test_surrogate()
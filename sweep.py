@@ -0,0 +1,362 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+import numpy as np
+
+from constants import GROUP_ACTIVITIES
+from evaluation import EvaluationRecord, simulate_replications
+from optimization import Optimization
+from utils import mean_request_rate_array, set_group_activities
+
+# version of the cached results, to be increased when a change of the code invalidates them
+SWEEP_CACHE_VERSION = 1
+
+METRIC_FCTS = {"mean": np.mean, "median": np.median, "max": np.max, "var": np.var}
+
+SCENARIO_OVERRIDES = ("activity_scale", "group_activities")
+
+DEFAULT_SPEC = {
+    "mode": "evaluate",  # "evaluate" the hashsets or "optimize" from scratch
+    "hashsets": {},  # name -> movie hashset, e.g. {"baseline": {"MSN": [0, ..., 9], "ASN1": [2, 3, 9], "ASN2": [2, 3, 9]}}
+    "metric_fcts": ["mean"],
+    "use_control_variate": [False],
+    "tolerances": [0.5],
+    "seeds": [0],
+    "scenarios": {"nominal": {}},  # name -> overrides, "activity_scale" and/or "group_activities"
+    "min_simulations": 10,  # evaluate mode: simulations between two checks of the CI half-width
+    "max_simulations": 200,  # evaluate mode: maximal number of simulations per cell
+    "optimization": {},  # optimize mode: other parameters of Optimization.__call__
+}
+
+
+def expand_sweep(spec):
+    """
+    Expand a sweep specification into its grid of cells.
+    :param spec: dictionary of the sweep (see DEFAULT_SPEC)
+    :return: list of cells, each a JSON-serializable dictionary of the parameters of one run
+    """
+    spec = {**DEFAULT_SPEC, **spec}
+    if spec["mode"] not in ("evaluate", "optimize"):
+        raise ValueError(f"Unknown sweep mode {spec['mode']}.")
+    if spec["mode"] == "evaluate" and len(spec["hashsets"]) == 0:
+        raise ValueError("The evaluate mode needs at least one hashset.")
+    if spec["mode"] == "evaluate" and not 1 <= spec["min_simulations"] <= spec["max_simulations"]:
+        raise ValueError(f"The evaluate mode needs 1 <= min_simulations <= max_simulations, got {spec['min_simulations']} "
+                         f"and {spec['max_simulations']}.")
+    for name, overrides in spec["scenarios"].items():
+        unknown = set(overrides) - set(SCENARIO_OVERRIDES)
+        if unknown:
+            raise ValueError(f"Unknown overrides {sorted(unknown)} of scenario {name}, expected {SCENARIO_OVERRIDES}.")
+        _check_group_activities(overrides.get("group_activities", {}))
+    for metric_fct in spec["metric_fcts"]:
+        if metric_fct not in METRIC_FCTS:
+            raise ValueError(f"Unknown metric function {metric_fct}, expected one of {list(METRIC_FCTS)}.")
+
+    hashsets = spec["hashsets"].items() if spec["mode"] == "evaluate" else [(None, None)]
+    cells = []
+    for (hashset_name, hashset), metric_fct, use_control_variate, tolerance, seed, (scenario, overrides) in itertools.product(
+        hashsets, spec["metric_fcts"], spec["use_control_variate"], spec["tolerances"], spec["seeds"], spec["scenarios"].items()
+    ):
+        cell = {
+            "mode": spec["mode"],
+            "hashset_name": hashset_name,
+            "hashset": {storage_id: sorted(movie_ids) for storage_id, movie_ids in sorted(hashset.items())} if hashset is not None else None,
+            "metric_fct": metric_fct,
+            "use_control_variate": bool(use_control_variate),
+            "tolerance": tolerance,
+            "seed": seed,
+            "scenario": scenario,
+            "overrides": overrides,
+        }
+        if spec["mode"] == "evaluate":
+            cell.update(min_simulations=spec["min_simulations"], max_simulations=spec["max_simulations"])
+        else:
+            cell.update(optimization=spec["optimization"])
+        cells.append(cell)
+    return cells
+
+
+def fingerprint(cell):
+    """
+    The names of the hashset and of the scenario are excluded on purpose: the results only depend on the hashset and
+    the overrides themselves, so renaming a hashset or a scenario (or listing the same one under two names) reuses the
+    cached results, the names of the rows of the table being taken from the current cells.
+    :param cell: cell of a sweep
+    :return: hash of the parameters of the cell (names excluded) and of the cache version
+    """
+    config = {name: value for name, value in cell.items() if name not in ("hashset_name", "scenario")}
+    config["version"] = SWEEP_CACHE_VERSION
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _check_group_activities(group_activities):
+    # the overridden request rates must cover every time interval of the groups they replace
+    for group_id, activities in group_activities.items():
+        if group_id not in GROUP_ACTIVITIES:
+            raise ValueError(f"Unknown group {group_id} in the group activities, expected one of {list(GROUP_ACTIVITIES)}.")
+        if len(activities) != len(GROUP_ACTIVITIES[group_id]):
+            raise ValueError(f"Group {group_id} has {len(activities)} activities, expected one per time interval "
+                             f"({len(GROUP_ACTIVITIES[group_id])}).")
+
+
+@contextmanager
+def scenario_overrides(overrides):
+    """
+    Apply the overrides of a scenario for the duration of the context.
+    :param overrides: dictionary of the "group_activities" (request rates per group and time interval) and/or the
+                      "activity_scale" applied to the request rates
+    """
+    _check_group_activities(overrides.get("group_activities", {}))
+    original = {group_id: list(activities) for group_id, activities in GROUP_ACTIVITIES.items()}
+    activities = {group_id: list(overrides.get("group_activities", {}).get(group_id, activities)) for group_id, activities in original.items()}
+    scale = overrides.get("activity_scale", 1.)
+    set_group_activities({group_id: [activity * scale for activity in rates] for group_id, rates in activities.items()})
+    try:
+        yield
+    finally:
+        set_group_activities(original)
+
+
+def _evaluate_cell(cell):
+    """
+    Simulate a hashset until the 95% CI half-width of the (control variate) estimate is below the tolerance.
+    :return: dictionary of the estimate, its half-width, the number of simulations and the mean waiting time
+    """
+    movie_hashsets = {storage_id: set(movie_ids) for storage_id, movie_ids in cell["hashset"].items()}
+    metric_fct = METRIC_FCTS[cell["metric_fct"]]
+    mu_CV = mean_request_rate_array(movies_hashsets=movie_hashsets).max()
+
+    record, mean_waits = EvaluationRecord(), np.array([])
+    while True:
+        replications = simulate_replications(movie_hashsets, min(cell["min_simulations"], cell["max_simulations"] - record.count), metric_fct=metric_fct)
+        record.update(replications["metric"], replications["control_variate"])
+        mean_waits = np.append(mean_waits, replications["mean_wait"])
+
+        if cell["use_control_variate"] and record.count > 2:
+            estimate, half_width = record.control_variate_estimate(mu_CV), record.control_variate_half_width()
+        else:
+            estimate, half_width = record.mean(), record.half_width()
+        if half_width < cell["tolerance"] or record.count >= cell["max_simulations"]:
+            break
+
+    return {"estimate": float(estimate), "half_width": float(half_width), "num_simulations": record.count, "mean_wait": float(np.mean(mean_waits))}
+
+
+def _optimize_cell(cell, log_prefix):
+    """
+    Run an optimization from the parameters of the cell.
+    :return: dictionary of the best hashset and its metric
+    """
+    optimization = Optimization(random_seed=cell["seed"])
+    optimization.STATS_LOG_PATH = f"{log_prefix}_stats.runlog"
+    optimization.HISTORY_LOG_PATH = f"{log_prefix}_history.runlog"
+    best_hashset, best_metric = optimization(
+        **{
+            "optimization_fct_names": ["replace_one", "swap_one", "remove_one"],
+            **cell["optimization"],
+            "metric_fct": METRIC_FCTS[cell["metric_fct"]],
+            "tolerance": cell["tolerance"],
+            "use_control_variate": cell["use_control_variate"],
+        }
+    )
+    best_hashset = {storage_id: sorted(movie_ids) for storage_id, movie_ids in sorted(best_hashset.items())} if best_hashset is not None else None
+    return {"best_hashset": best_hashset, "best_metric": float(best_metric)}
+
+
+def run_cell(cell, cache_dir):
+    """
+    Run a cell of a sweep from its seed under the overrides of its scenario.
+    :param cell: cell of a sweep
+    :param cache_dir: directory of the cached results (the run logs of the optimizations are written there)
+    :return: fingerprint of the cell and its result
+    """
+    key = fingerprint(cell)
+    np.random.seed(cell["seed"])
+    random.seed(cell["seed"])
+
+    start_time = time.time()
+    with scenario_overrides(cell["overrides"]):
+        if cell["mode"] == "evaluate":
+            result = _evaluate_cell(cell)
+        else:
+            result = _optimize_cell(cell, os.path.join(cache_dir, key))
+    result["time"] = time.time() - start_time
+    return key, result
+
+
+def _save_result(cache_dir, key, cell, result):
+    # written atomically so that an interrupted sweep never leaves a truncated result in the cache
+    path = os.path.join(cache_dir, f"{key}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump({"cell": cell, "result": result}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _load_result(cache_dir, key):
+    path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["result"]
+
+
+def run_sweep(spec, cache_dir="sweep_cache", output_path="sweep_results.csv", n_workers=1, force=False, print_results=True):
+    """
+    Run the grid of a sweep in parallel, the cells whose fingerprint is found in the cache being skipped, and write the
+    results of all the cells to a CSV table.
+    :param spec: dictionary of the sweep (see DEFAULT_SPEC)
+    :param cache_dir: directory of the cached results of the cells
+    :param output_path: path of the CSV table of the results
+    :param n_workers: number of worker processes
+    :param force: whether to run the cached cells again
+    :param print_results: whether to print the progress
+    :return: list of the rows of the table
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cells = expand_sweep(spec)
+    results = {} if force else {fingerprint(cell): _load_result(cache_dir, fingerprint(cell)) for cell in cells}
+    pending = [cell for cell in cells if results.get(fingerprint(cell)) is None]
+    if print_results:
+        print(f"{len(cells)} cells, {len(cells) - len(pending)} cached, {len(pending)} to run")
+
+    cells_by_key = {fingerprint(cell): cell for cell in pending}
+    tasks = [(cell, cache_dir) for cell in cells_by_key.values()]
+    with Pool(processes=n_workers) if n_workers > 1 and len(tasks) > 1 else _NoPool() as pool:
+        for done, (key, result) in enumerate(pool.imap_unordered(_run_cell_task, tasks), start=1):
+            _save_result(cache_dir, key, cells_by_key[key], result)
+            results[key] = result
+            if print_results:
+                print(f"[{done}/{len(tasks)}] {key} done in {result['time']:.1f} seconds")
+
+    rows = []
+    for cell in cells:
+        key = fingerprint(cell)
+        row = {"fingerprint": key}
+        row.update({name: value for name, value in cell.items() if name not in ("hashset", "overrides", "optimization")})
+        row["overrides"] = json.dumps(cell["overrides"], sort_keys=True)
+        row.update({name: json.dumps(value) if isinstance(value, dict) else value for name, value in results[key].items()})
+        rows.append(row)
+
+    if output_path is not None:
+        if os.path.dirname(output_path):
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        fieldnames = list(dict.fromkeys(name for row in rows for name in row))
+        with open(output_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        if print_results:
+            print(f"Results written to {output_path}")
+
+    return rows
+
+
+def _run_cell_task(task):
+    return run_cell(*task)
+
+
+class _NoPool:
+    """
+    In-process stand-in of a Pool for sweeps run with a single worker.
+    """
+
+    def imap_unordered(self, fct, tasks):
+        return map(fct, tasks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def test_sweep():
+    """
+    Test that the control variate estimate of a cell matches the regression on the replications, that a scenario
+    overriding the request rates with the wrong number of time intervals is rejected without touching the rates, that
+    invalid numbers of simulations are rejected, and that a sweep run again only reads its cached cells.
+    """
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    Y = rng.normal(size=50)
+    X = 2 * Y + rng.normal(size=50)
+    record = EvaluationRecord()
+    record.update(X, Y)
+    a = np.cov(X, Y)[0, 1] / np.var(Y, ddof=1)
+    Z = X - a * (Y - 0.5)
+    assert np.isclose(record.control_variate_estimate(0.5), np.mean(Z))
+    assert np.isclose(record.control_variate_half_width(), 1.96 * np.std(Z, ddof=1) / np.sqrt(len(Z)))
+
+    group_id, activities = next(iter(GROUP_ACTIVITIES.items()))
+    original = list(activities)
+    for overrides in ({"group_activities": {group_id: original[:-1]}}, {"group_activities": {"unknown": original}}):
+        try:
+            with scenario_overrides(overrides):
+                pass
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Invalid group activities should be rejected")
+        assert GROUP_ACTIVITIES[group_id] == original
+    with scenario_overrides({"group_activities": {group_id: [2 * activity for activity in original]}}):
+        assert GROUP_ACTIVITIES[group_id] == [2 * activity for activity in original]
+    assert GROUP_ACTIVITIES[group_id] == original
+
+    spec = {
+        "hashsets": {"baseline": {"MSN": list(range(10)), "ASN1": [2, 3, 9], "ASN2": [0, 1, 4]}},
+        "seeds": [0, 1],
+        "tolerances": [100.],
+        "min_simulations": 2,
+        "max_simulations": 4,
+    }
+    for min_simulations, max_simulations in ((0, 4), (5, 4)):
+        try:
+            expand_sweep({**spec, "min_simulations": min_simulations, "max_simulations": max_simulations})
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Invalid numbers of simulations should be rejected")
+
+    directory = tempfile.mkdtemp()
+    cache_dir, output_path = os.path.join(directory, "cache"), os.path.join(directory, "results.csv")
+    rows = run_sweep(spec, cache_dir=cache_dir, output_path=output_path, n_workers=2, print_results=False)
+    assert len(rows) == 2 and all(row["num_simulations"] == 2 for row in rows)
+    assert sorted(os.listdir(cache_dir)) == sorted(f"{row['fingerprint']}.json" for row in rows)
+    cached = {name: os.stat(os.path.join(cache_dir, name)).st_mtime_ns for name in os.listdir(cache_dir)}
+
+    # the second run evaluates nothing: the cache files are untouched and the rows, times included, are read back
+    assert run_sweep(spec, cache_dir=cache_dir, output_path=output_path, n_workers=2, print_results=False) == rows
+    assert {name: os.stat(os.path.join(cache_dir, name)).st_mtime_ns for name in os.listdir(cache_dir)} == cached
+    with open(output_path, newline="") as f:
+        table = list(csv.DictReader(f))
+    assert [row["fingerprint"] for row in table] == [row["fingerprint"] for row in rows]
+    assert [float(row["estimate"]) for row in table] == [row["estimate"] for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of evaluations or optimizations.")
+    parser.add_argument("spec", help="path of the JSON specification of the sweep (see sweep.DEFAULT_SPEC)")
+    parser.add_argument("--cache-dir", default="sweep_cache", help="directory of the cached results of the cells")
+    parser.add_argument("--output", default="sweep_results.csv", help="path of the CSV table of the results")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--force", action="store_true", help="run the cached cells again")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    run_sweep(spec, cache_dir=args.cache_dir, output_path=args.output, n_workers=args.workers, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
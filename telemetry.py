@@ -0,0 +1,144 @@
+import json
+import os
+import time
+
+import numpy as np
+
+
+def _to_builtin(value):
+    """
+    JSON conversion of the NumPy scalars and the sets of the records.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable.")
+
+
+class Telemetry:
+
+    def __init__(self, path=None, callback=None):
+        """
+        Stream of per-iteration records of the optimization, written as JSON lines and/or passed to a callback. The
+        lines are flushed as they are written so that a long run can be followed live (e.g. with tail -f).
+        :param path: path of the JSON-lines file, appended to (optional)
+        :param callback: function called with each record (optional)
+        """
+        self.path = path
+        self.callback = callback
+        self.file = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.file = open(path, "a")
+        self.start_time = time.time()
+
+    def emit(self, **record):
+        """
+        Emit a record, stamped with the time elapsed since the start of the stream.
+        :param record: fields of the record
+        """
+        record["elapsed"] = time.time() - self.start_time
+        if self.file is not None:
+            self.file.write(json.dumps(record, default=_to_builtin) + "\n")
+            self.file.flush()
+        if self.callback is not None:
+            self.callback(record)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def size(self):
+        """
+        :return: size in bytes of the file, None without file
+        """
+        return self.file.tell() if self.file is not None else None
+
+    def truncate(self, size):
+        """
+        Drop the records written after the given size, e.g. after the checkpoint a run is resumed from.
+        :param size: size in bytes to keep, at most the size of the file
+        """
+        if self.file is not None and size is not None:
+            self.file.seek(0, os.SEEK_END)
+            if size > self.file.tell():
+                raise ValueError(f"The telemetry file {self.path} has {self.file.tell()} bytes, it cannot be truncated to {size}.")
+            self.file.truncate(size)
+            self.file.seek(size)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_telemetry(path):
+    """
+    :param path: path of the JSON-lines file
+    :return: list of the records
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_telemetry():
+    """
+    Test that the records are written as JSON lines and passed to the callback with their elapsed time, that a stream is
+    truncated back to a size, and that an optimization emits one record per iteration with the expected fields.
+    """
+    import tempfile
+    from optimization import Optimization
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "telemetry.jsonl")
+    received = []
+    telemetry = Telemetry(path, callback=received.append)
+    telemetry.emit(iteration=np.int64(0), movies={3, 1})
+    size = telemetry.size()
+    telemetry.emit(iteration=1, movies=frozenset())
+    assert [record["iteration"] for record in read_telemetry(path)] == [0, 1]
+    assert read_telemetry(path)[0]["movies"] == [1, 3]
+    assert all("elapsed" in record for record in received) and len(received) == 2
+    telemetry.truncate(size)
+    try:
+        telemetry.truncate(size + 1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("A telemetry file should not be truncated beyond its size")
+    telemetry.close()
+    assert len(read_telemetry(path)) == 1
+
+    fields = {
+        "iteration", "operator", "outcome", "improved", "simulations", "requests", "duration", "simulations_per_second",
+        "requests_per_second", "candidate_metric", "current_metric", "best_metric", "half_width", "tolerance",
+        "constraint_skips", "evaluation_cache_hit_rate", "incremental_reuse_rate", "rate_model_hit_rate", "elapsed",
+    }
+    optimization = Optimization(print_results=False, random_seed=0)
+    optimization.STATS_LOG_PATH = os.path.join(directory, "stats.runlog")
+    telemetry_path = os.path.join(directory, "optimization.jsonl")
+    received = []
+    optimization(
+        ["replace_one", "swap_one"],
+        num_optimization_iters=3,
+        num_iters_per_optimization=10,
+        tolerance=0.5,
+        use_evaluation_cache=True,
+        telemetry_path=telemetry_path,
+        telemetry_callback=received.append,
+    )
+    records = read_telemetry(telemetry_path)
+    assert [record["iteration"] for record in records] == [0, 1, 2]
+    assert [record["outcome"] for record in records] == [record["outcome"] for record in received]
+    assert records[0]["simulations"] > 0 and records[0]["requests"] > 0
+    for record in records:
+        if record["outcome"] in ("accepted", "rejected", "raced_out"):
+            assert set(record) == fields, set(record) ^ fields
+        else:
+            assert {"iteration", "operator", "outcome", "constraint_skips", "elapsed"} <= set(record)
+
+
+if __name__ == "__main__":
+    test_telemetry()
@@ -1,4 +1,7 @@
+from functools import lru_cache
+
 from constants import *
+from bitmask import to_mask
 
 def movie_to_storage_map(group_id, movies_hashsets=INITIAL_MOVIE_HASHSET):
     """
@@ -28,39 +31,84 @@ def group_movie_to_storage_map(movies_hashsets=INITIAL_MOVIE_HASHSET):
 
     return group_movie_to_storage
 
-def compute_mean_request_rate(movies_hashsets=INITIAL_MOVIE_HASHSET):
+# Fixed orders of the groups, storage nodes and movies indexing the arrays of the expected rate model
+GROUP_ORDER = tuple(sorted(GROUP_IDS))
+STORAGE_ORDER = tuple(sorted(STORAGE_IDS))
+MOVIE_ORDER = tuple(sorted(MOVIES_IDS))
+STORAGE_INDEX = {storage_id: k for k, storage_id in enumerate(STORAGE_ORDER)}
+
+# popularity[group, movie] normalized per group, activity[group, interval] and send time[group, storage] (inf if the
+# group cannot reach the storage node)
+MOVIE_POPULARITY = np.array([[GROUP_MOVIE_POPULARITIES[group_id][movie_id] for movie_id in MOVIE_ORDER] for group_id in GROUP_ORDER], dtype=float)
+MOVIE_POPULARITY /= MOVIE_POPULARITY.sum(axis=1, keepdims=True)
+GROUP_ACTIVITY = np.array([GROUP_ACTIVITIES[group_id] for group_id in GROUP_ORDER], dtype=float)
+GROUP_SEND_TIME = np.array([[RHO_SEND_TIME[group_id][storage_id] if storage_id in GROUP_STORAGE_OPTIONS[group_id] else np.inf for storage_id in STORAGE_ORDER] for group_id in GROUP_ORDER])
+
+
+def set_group_activities(group_activities):
     """
-    Computes the mean request rate for a given movie hashset for each time interval per storage node.
-    :param movies_hashsets: movie hashset defining the storage configuration (by default the initial configuration)
-    :return: mean request rate per storage node for each time interval (storage node x time interval)
+    Override the request rates of the groups per time interval, e.g. for the scenarios of an experiment. GROUP_ACTIVITIES
+    is updated in-place so that the modules which imported it see the new rates, and the expected rate model is reset.
+    :param group_activities: dictionary of the groups to their request rate per time interval
     """
+    for group_id, activities in group_activities.items():
+        GROUP_ACTIVITIES[group_id][:] = activities
+    GROUP_ACTIVITY[:] = [GROUP_ACTIVITIES[group_id] for group_id in GROUP_ORDER]
+    _mean_request_rate.cache_clear()
 
-    mean_request_rate = {storage_id: [0 for _ in TIME_INTERVALS] for storage_id in STORAGE_IDS}
-    map = group_movie_to_storage_map(movies_hashsets)
 
-    # compounding total request number per storage in each interval
-    for group_id in GROUP_IDS:
-        normalized_movie_weights = np.array(list(GROUP_MOVIE_POPULARITIES[group_id].values()))*1.
-        normalized_movie_weights /= np.sum(normalized_movie_weights)
+def routing_tensor(movies_hashsets=INITIAL_MOVIE_HASHSET):
+    """
+    One-hot routing of the requests: each group requests a movie from the reachable storage node storing it with the
+    lowest send time (see movie_to_storage_map).
+    :param movies_hashsets: movie hashset defining the storage configuration (by default the initial configuration)
+    :return: array routing[group, movie, storage] equal to 1 if the requests of the group for the movie are routed to
+             the storage node, 0 otherwise
+    """
+    stored = np.array([[movie_id in movies_hashsets[storage_id] for movie_id in MOVIE_ORDER] for storage_id in STORAGE_ORDER])
+    send_time = np.where(stored.T[None, :, :], GROUP_SEND_TIME[:, None, :], np.inf)  # group x movie x storage
+    routing = np.zeros(send_time.shape)
+    np.put_along_axis(routing, np.argmin(send_time, axis=2)[:, :, None], 1., axis=2)
+    return routing
+
+
+@lru_cache(maxsize=4096)
+def _mean_request_rate(key):
+    movies_hashsets = {storage_id: [movie_id for k, movie_id in enumerate(MOVIE_ORDER) if mask >> k & 1] for storage_id, mask in key}
+    # expected rate[storage, interval] = sum_group,movie activity[group, interval] popularity[group, movie] routing[group, movie, storage]
+    mean_request_rate = np.einsum("gt,gm,gms->st", GROUP_ACTIVITY, MOVIE_POPULARITY, routing_tensor(movies_hashsets))
+    mean_request_rate.setflags(write=False)
+    return mean_request_rate
 
-        for interval in range(len(TIME_INTERVALS)):
-            t_start, t_end = TIME_INTERVALS[interval]
-            duration = t_end - t_start
 
-            average_number_requests = GROUP_ACTIVITIES[group_id][interval] * duration
+def mean_request_rate_array(movies_hashsets=INITIAL_MOVIE_HASHSET):
+    """
+    Computes the mean request rate for a given movie hashset for each storage node and time interval, as the product of
+    the group activities and movie popularities routed through the routing tensor. The result is memoized per canonical
+    hashset and must not be modified.
+    :param movies_hashsets: movie hashset defining the storage configuration (by default the initial configuration)
+    :return: read-only array of the mean request rates (storage node in STORAGE_ORDER x time interval)
+    """
+    return _mean_request_rate(canonical_hashset(movies_hashsets))
 
-            for movie_id, movie_weight in zip(MOVIES_IDS, normalized_movie_weights):
-                storage_id = map[group_id][movie_id]
-                mean_request_rate[storage_id][interval] += average_number_requests * movie_weight
 
-    # computing rate
-    for storage_id in STORAGE_IDS:
-        for interval in range(len(TIME_INTERVALS)):
-            t_start, t_end = TIME_INTERVALS[interval]
-            duration = t_end - t_start
-            mean_request_rate[storage_id][interval] /= duration
+def mean_request_rate_hit_rate():
+    """
+    :return: fraction of the mean request rates served from the memoized rate model
+    """
+    info = _mean_request_rate.cache_info()
+    lookups = info.hits + info.misses
+    return info.hits / lookups if lookups > 0 else 0.
 
-    return mean_request_rate
+
+def compute_mean_request_rate(movies_hashsets=INITIAL_MOVIE_HASHSET):
+    """
+    Computes the mean request rate for a given movie hashset for each time interval per storage node.
+    :param movies_hashsets: movie hashset defining the storage configuration (by default the initial configuration)
+    :return: mean request rate per storage node for each time interval (storage node x time interval)
+    """
+    mean_request_rate = mean_request_rate_array(movies_hashsets)
+    return {storage_id: list(mean_request_rate[STORAGE_INDEX[storage_id]]) for storage_id in STORAGE_IDS}
 
 def compute_overall_request_rate(movies_hashsets=INITIAL_MOVIE_HASHSET):
     """
@@ -83,4 +131,60 @@ def compute_overall_request_rate(movies_hashsets=INITIAL_MOVIE_HASHSET):
     # computing rate
     overall_request_rate /= total_duration
 
-    return overall_request_rate
\ No newline at end of file
+    return overall_request_rate
+
+def canonical_hashset(movies_hashsets):
+    """
+    Canonical frozen form of a movie hashset, used as a key for evaluation caches and tabu lists.
+    :param movies_hashsets: movie hashset defining the storage configuration
+    :return: tuple of (storage_id, movie bitmask) sorted by storage node (see bitmask.py)
+    """
+    return tuple(sorted((storage_id, to_mask(movie_set)) for storage_id, movie_set in movies_hashsets.items()))
+
+def observed_max_request_rate(requests):
+    """
+    Computes the maximum observed request rate per storage node and time interval.
+    :param requests: (unfiltered) requests generated by the simulation
+    :return: maximum rate per storage node and time interval
+    """
+    rates = []
+    for storage_id in STORAGE_IDS:
+        for time_interval in TIME_INTERVALS:
+            duration = time_interval[1] - time_interval[0]
+            filtered_requests = [r for r in requests if
+                                 r.storage_id == storage_id and time_interval[0] <= r.time_creation <=
+                                 time_interval[1]]
+            rates.append(len(filtered_requests) / duration)
+    return max(rates)
+
+def feasible_movie_sets(storage_id):
+    """
+    Enumerates all the movie sets fitting in the capacity of a storage node (0/1 knapsack enumeration).
+    :param storage_id: storage node
+    :return: list of feasible movie sets
+    """
+    capacity = STORAGE_SIZES[storage_id]
+    movie_ids = sorted(MOVIES_IDS, key=lambda movie_id: MOVIE_SIZES[movie_id])
+
+    feasible_sets = []
+    def _extend(start, movie_set, remaining_capacity):
+        feasible_sets.append(set(movie_set))
+        for idx in range(start, len(movie_ids)):
+            # movies are sorted by size: no larger movie fits either
+            if MOVIE_SIZES[movie_ids[idx]] > remaining_capacity:
+                break
+            movie_set.append(movie_ids[idx])
+            _extend(idx + 1, movie_set, remaining_capacity - MOVIE_SIZES[movie_ids[idx]])
+            movie_set.pop()
+
+    _extend(0, [], capacity)
+    return feasible_sets
+
+def storage_used(movies_hashsets, storage_ids=("ASN1", "ASN2")):
+    """
+    Computes the storage used by the movies stored on the given storage nodes.
+    :param movies_hashsets: movie hashset defining the storage configuration
+    :param storage_ids: storage nodes accounted for (by default the ASN, the MSN storing all the movies)
+    :return: total size of the stored movies
+    """
+    return sum(MOVIE_SIZES[movie_id] for storage_id in storage_ids for movie_id in movies_hashsets[storage_id])